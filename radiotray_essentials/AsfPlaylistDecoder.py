@@ -17,8 +17,6 @@
 # along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##########################################################################
-import urllib2
-from lib.common import USER_AGENT
 from lxml import etree
 from lxml import objectify
 from StringIO import StringIO
@@ -26,35 +24,37 @@ import logging
 
 class AsfPlaylistDecoder:
 
-    def __init__(self):
+    contentTypes = ('video/x-ms-asf',)
+    magic = ('[reference]',)
+    magicRequired = True
+
+    def __init__(self, http):
+        self.http = http
         self.log = logging.getLogger('radiotray')
         self.log.debug('Initializing ASF playlist decoder')
 
 
-    def isStreamValid(self, contentType, firstBytes):
-
-        if('video/x-ms-asf' in contentType and firstBytes.strip().lower().startswith('[reference]')):
-            self.log.info('Stream is readable by ASF Playlist Decoder')
-            return True
-        else:
-            return False
-
-        
     def extractPlaylist(self,  url):
 
         self.log.info('Downloading playlist..')
 
-        req = urllib2.Request(url)
-        req.add_header('User-Agent', USER_AGENT)
-        f = urllib2.urlopen(req)
-        str = f.read()
-        f.close()
+        f = self.http.open(url)
+        try:
+            return self.decodePlaylist(f)
+        finally:
+            f.close()
+
+
+    def decodePlaylist(self, data):
+
+        if hasattr(data, 'read'):
+            data = data.read()
 
         self.log.info('Playlist downloaded')
         self.log.info('Decoding playlist...')
 
         playlist = []
-        lines = str.split("\n")
+        lines = data.split("\n")
         for line in lines:
 
             if (line.startswith("Ref") == True):
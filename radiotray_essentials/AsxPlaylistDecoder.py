@@ -17,8 +17,6 @@
 # along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##########################################################################
-import urllib2
-from lib.common import USER_AGENT
 from lxml import etree
 from lxml import objectify
 from StringIO import StringIO
@@ -26,35 +24,38 @@ import logging
 
 class AsxPlaylistDecoder:
 
-    def __init__(self):
+    contentTypes = ('audio/x-ms-wax', 'video/x-ms-wvx', 'video/x-ms-asf', 'video/x-ms-wmv')
+    magic = ('<asx',)
+    # the same content types are used by plain ASF streams
+    magicRequired = True
+
+    def __init__(self, http):
+        self.http = http
         self.log = logging.getLogger('radiotray')
         self.log.debug('ASX-familiy playlist decoder')
 
 
-    def isStreamValid(self, contentType, firstBytes):
-
-        if(('audio/x-ms-wax' in contentType or 'video/x-ms-wvx' in contentType or 'video/x-ms-asf' in contentType or 'video/x-ms-wmv' in contentType) and firstBytes.strip().lower().startswith('<asx')):
-            self.log.info('Stream is readable by ASX Playlist Decoder')
-            return True
-        else:
-            return False
-
-        
     def extractPlaylist(self,  url):
 
         self.log.info('Downloading playlist...')
 
-        req = urllib2.Request(url)
-        req.add_header('User-Agent', USER_AGENT)
-        f = urllib2.urlopen(req)
-        str = f.read()
-        f.close()
+        f = self.http.open(url)
+        try:
+            return self.decodePlaylist(f)
+        finally:
+            f.close()
+
+
+    def decodePlaylist(self, data):
+
+        if hasattr(data, 'read'):
+            data = data.read()
 
         self.log.info('Playlist downloaded')
         self.log.info('Decoding playlist...')
 
         parser = etree.XMLParser(recover=True)
-        root = etree.parse(StringIO(str),parser)
+        root = etree.parse(StringIO(data),parser)
 
         #ugly hack to normalize the XML
         for element in root.iter():
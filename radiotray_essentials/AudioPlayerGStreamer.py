@@ -22,105 +22,710 @@ import sys, os
 import pygst
 pygst.require("0.10")
 import gst
+import gobject
+import time
 from StreamDecoder import StreamDecoder
-from lib.common import USER_AGENT
+from ResolutionCache import ResolutionCache
+from StreamRacer import StreamRacer
+from ResolverQueue import ResolverQueue
+from PlaylistExpander import PlaylistExpander
+from StationPrefetcher import StationPrefetcher
+from StandbyPool import StandbyPool, StandbyPipeline
+from BufferTuner import BufferTuner, BufferSession
+from ReconnectScheduler import ReconnectScheduler
+from TimeShift import TimeShift
+from StreamRecorder import StreamRecorder
+from lib.Telemetry import Telemetry
+from lib.common import USER_AGENT, RESOLUTION_CACHE_FILE, BUFFER_HISTORY_FILE, TIMESHIFT_FILE, RECORDINGS_DIR, STATS_FILE
 from events.EventManager import EventManager
-from threading import Timer
+from events.EventData import StateData, BufferData, ErrorData, NotificationData
 import logging
 
+# seconds between two buffer fill updates to subscribers
+BUFFER_NOTIFY_INTERVAL = 0.5
+# seconds a standby pipeline may take to fill up after it was switched to
+STANDBY_FILL_TIMEOUT = 5
+# seconds without a new byte from the source before a buffering pause counts as a stall
+STALL_TIMEOUT = 3
+# seconds a stopped pipeline keeps the audio sink open before it is released
+IDLE_RELEASE_SECONDS = 60
+# tags that make up the song, a change in any of them is a song change
+SONG_TAGS = ('artist', 'title', 'album', 'organization')
+# tags describing the stream itself, published on the low priority path
+STREAM_TAGS = ('bitrate', 'nominal-bitrate', 'minimum-bitrate', 'maximum-bitrate', 'audio-codec', 'container-format', 'channel-mode')
+
 class AudioPlayerGStreamer:
 
-    def __init__(self, cfg_provider, eventManager):
+    def __init__(self, cfg_provider, eventManager, dnsCache=None):
         #self.mediator = mediator
         self.eventManager = eventManager
-        self.decoder = StreamDecoder(cfg_provider)
-        self.playlist = []
-        self.retrying = False
+        # process wide DNS cache, only read for its stats
+        self.dnsCache = dnsCache
+        self.telemetry = Telemetry()
+        self.decoder = StreamDecoder(cfg_provider, self.telemetry)
+        self.maxPlaylistDepth = int(cfg_provider.getConfigValue("playlist_max_depth", 4))
+        self.maxPlaylistCandidates = int(cfg_provider.getConfigValue("playlist_max_candidates", 50))
+        self.playlist = self.newPlaylist()
+        self.station = None
+        self.currentStream = None
+        # set while playing streams taken from the resolution cache
+        self.cachedPlayback = False
+        # resolution details to be cached once the station starts playing
+        self.pendingCache = None
+        # fingerprint of the last published song tags and the last stream tags
+        self.songFingerprint = None
+        self.streamInfo = {}
+        # all tags seen on the current station, kept with it when it goes on standby
+        self.tags = {}
         # used to make a difference between an intended stop by the user and one of external cause. -- Euroman
         self.stoppedManually = False
 
         self.log = logging.getLogger('radiotray')
 
-        # init player
-        self.souphttpsrc = gst.element_factory_make("souphttpsrc", "source")
-        self.souphttpsrc.set_property("user-agent", USER_AGENT)
-		
-        self.player = gst.element_factory_make("playbin2", "player")		
-        fakesink = gst.element_factory_make("fakesink", "fakesink")
-        self.player.set_property("video-sink", fakesink)
+        cacheTtl = int(cfg_provider.getConfigValue("resolution_cache_ttl", 86400))
+        cacheSize = int(cfg_provider.getConfigValue("resolution_cache_size", 500))
+        self.cache = ResolutionCache(RESOLUTION_CACHE_FILE, cacheTtl, cacheSize)
+
+        raceWidth = int(cfg_provider.getConfigValue("race_width", 3))
+        self.racer = StreamRacer(self.decoder, max(raceWidth, 1))
+
+        resolverWorkers = int(cfg_provider.getConfigValue("resolver_workers", 2))
+        self.resolver = ResolverQueue(max(resolverWorkers, 1))
+        self.job = None
+
+        prefetchTtl = int(cfg_provider.getConfigValue("prefetch_ttl", 60))
+        self.prefetcher = StationPrefetcher(self.prefetchStation, ttl=prefetchTtl)
+
+        reconnectDelay = float(cfg_provider.getConfigValue("reconnect_delay", 1.0))
+        reconnectMaxDelay = float(cfg_provider.getConfigValue("reconnect_max_delay", 20.0))
+        reconnectAttempts = int(cfg_provider.getConfigValue("reconnect_attempts", 5))
+        self.reconnector = ReconnectScheduler(self.reconnect, self.reconnectFailed,
+                                              reconnectDelay, reconnectMaxDelay, reconnectAttempts)
+        # pause below the low mark, resume only once the buffer is back above the high mark
+        self.bufferLowMark = int(cfg_provider.getConfigValue("buffer_low_mark", 20))
+        self.bufferHighMark = int(cfg_provider.getConfigValue("buffer_high_mark", 100))
+        self.buffering = False
+        self.bufferNotifiedAt = 0
+        self.bufferNotifiedPercent = None
+
+        # buffer fill seen by the last reconnect check, to tell a slow stream from a dead one
+        self.bufferPercent = 0
+        self.reconnectPercent = 0
+
+        # opt-in: play through a ring file that can be paused and rewound
+        self.timeshift = None
+        self.timeshifting = False
+        # streams in a format that cannot be time-shifted
+        self.unshiftable = set()
+        timeshiftMinutes = int(cfg_provider.getConfigValue("timeshift_minutes", 0))
+        if(timeshiftMinutes > 0):
+            # room for that many minutes at 320 kbit/s
+            self.timeshift = TimeShift(TIMESHIFT_FILE, timeshiftMinutes * 60 * 40000, self.stationPlaying,
+                                       self.streamFailed, self.timeshiftTag, self.timeshiftUnsupported)
+
+        # when the current station was started and since when it is buffering, for the telemetry
+        self.startedAt = None
+        # how the pipeline for the current station was set up: cold, ready, fresh or standby
+        self.switchPath = None
+        self.bufferingSince = None
+        # source whose byte count was sampled last
+        self.sampledSource = None
+        self.sampledPosition = 0
+        self.sampledAt = None
+        self.statsFile = cfg_provider.getConfigValue("stats_file", STATS_FILE)
+        statsInterval = int(cfg_provider.getConfigValue("stats_interval", 60))
+        if(statsInterval > 0):
+            gobject.timeout_add_seconds(statsInterval, self.writeStats)
+
+        self.recorder = StreamRecorder(cfg_provider.getConfigValue("recording_dir", RECORDINGS_DIR))
+
+        standbyPipelines = int(cfg_provider.getConfigValue("standby_pipelines", 0))
+        standbyTtl = int(cfg_provider.getConfigValue("standby_ttl", 120))
+        # a READY pipeline with its audio sink open, for the next switch while standby is on
+        self.spare = None
+        self.standby = StandbyPool(self.recyclePipeline, max(standbyPipelines, 0), standbyTtl)
+        # url -> job resolving a station to be kept warm
+        self.warming = {}
+        gobject.timeout_add_seconds(30, self.standby.expire)
 
         #buffer size
-        if(cfg_provider._settingExists("buffer_size")):
-            bufferSize = int(cfg_provider.getConfigValue("buffer_size"))
-            if (bufferSize > 0):
-            
-                self.log.debug("Setting buffer size to " + str(bufferSize))
-                self.player.set_property("buffer-size", bufferSize)
+        self.bufferSize = int(cfg_provider.getConfigValue("buffer_size", 0))
+        if (self.bufferSize > 0):
+            self.log.debug("Setting buffer size to " + str(self.bufferSize))
+
+        # per station buffer settings learned from earlier sessions
+        self.tuner = None
+        self.bufferSession = None
+        if(cfg_provider.getConfigValue("adaptive_buffering", "true") == "true"):
+            minSize = int(cfg_provider.getConfigValue("buffer_min_size", 32000))
+            maxSize = int(cfg_provider.getConfigValue("buffer_max_size", 1048576))
+            self.tuner = BufferTuner(BUFFER_HISTORY_FILE, self.bufferSize or 164000, minSize, maxSize)
+
+        self.player = self.createPipeline()
+        self.bus = self.player.get_bus()
+
+    def createPipeline(self):
+        player = gst.element_factory_make("playbin2", "player")
+        fakesink = gst.element_factory_make("fakesink", "fakesink")
+        player.set_property("video-sink", fakesink)
+
+        if (self.bufferSize > 0):
+            player.set_property("buffer-size", self.bufferSize)
 
-        
-        bus = self.player.get_bus()
+        player.connect("element-added", self.elementAdded, player)
+        player.connect("notify::source", self.sourceChanged)
+
+        bus = player.get_bus()
         bus.add_signal_watch()
         bus.connect("message", self.on_message)
+        return player
+
+    def tunePipeline(self, pipeline, station):
+        if(self.tuner is None):
+            return
+        settings = self.tuner.settings(station)
+        self.log.debug('Buffer settings for %s: %s', station, settings)
+        pipeline.set_property("buffer-size", settings['size'])
+        if(settings['duration'] is not None):
+            pipeline.set_property("buffer-duration", long(settings['duration'] * gst.SECOND))
+        # the watermarks go to the queue2 that uridecodebin creates later on
+        pipeline.set_data("buffer-settings", settings)
+
+    def elementAdded(self, bin, element, pipeline):
+        if(isinstance(element, gst.Bin)):
+            element.connect("element-added", self.elementAdded, pipeline)
+
+        factory = element.get_factory()
+        if(factory is not None and factory.get_name() == "queue2"):
+            settings = pipeline.get_data("buffer-settings")
+            if(settings is not None):
+                element.set_property("low-percent", settings['low'])
+                element.set_property("high-percent", settings['high'])
+
+    def destroyPipeline(self, pipeline):
+        pipeline.set_state(gst.STATE_NULL)
+        pipeline.get_bus().remove_signal_watch()
+
+    def recyclePipeline(self, pipeline):
+        # keep one pipeline that is done with as the spare, its sink stays open in READY
+        if(self.spare is None and self.standby.maxStandby > 0):
+            pipeline.set_state(gst.STATE_READY)
+            self.spare = pipeline
+        else:
+            self.destroyPipeline(pipeline)
+
+    def setPipeline(self, pipeline):
+        pipeline.set_property("volume", self.player.get_property("volume"))
+        self.player = pipeline
+        self.bus = pipeline.get_bus()
 
     def start(self, uri):
+        if(uri != self.station):
+            self.stopRecording()
+
+        if(self.timeshifting and uri == self.station and self.timeshift.isPaused()):
+            # the capture kept running, carry on where we paused
+            self.stoppedManually = False
+            self.timeshift.play()
+            return
+
+        self.cancelResolution()
+        self.reconnector.cancel()
+        self.retire()
         self.stoppedManually = False
-        urlInfo = self.decoder.getMediaStreamInfo(uri)
-        
-        if(urlInfo is not None and urlInfo.isPlaylist()):
-            self.playlist = self.decoder.getPlaylist(urlInfo)
-            if(len(self.playlist) == 0):
-                self.log.warn('Received empty playlist!')
-                #self.mediator.stop()
-                self.eventManager.notify(EventManager.STATION_ERROR, {'error':"Received empty stream from station"})
-            self.log.debug(self.playlist)
-            self.playNextStream()
+        self.station = uri
+        self.startedAt = time.time()
+        self.telemetry.count('stations.started')
+        self.cachedPlayback = False
+        self.pendingCache = None
+        # last published song and stream tags, so a new station publishes them again
+        self.songFingerprint = None
+        self.streamInfo = {}
+        self.tags = {}
+        if(self.tuner is not None):
+            self.bufferSession = BufferSession(uri)
 
-        elif(urlInfo is not None and urlInfo.isPlaylist() == False):
-            self.playlist = [urlInfo.getUrl()]
-            self.playNextStream()
+        warm = self.standby.take(uri)
+        if(warm is not None):
+            self.telemetry.count('resolve.standby')
+            self.activate(warm)
+            return
+
+        # resolving blocks on the network, keep it away from the UI and the main loop
+        prefetched = self.prefetcher.take(uri)
+        if(prefetched is not None):
+            self.telemetry.count('resolve.prefetched')
+            self.job = self.postJob(prefetched, self.stationResolved)
+            return
+
+        # a prefetch or warm-up of this very station is under way, wait for it instead of starting over
+        running = self.prefetcher.adopt(uri) or self.warming.pop(uri, None)
+        if(running is not None):
+            self.telemetry.count('resolve.adopted')
+            self.job = self.adoptJob(running, self.stationResolved)
+        else:
+            self.job = self.submitJob(self.resolveStation, (uri,), self.stationResolved)
+
+    # Switching stations never rebuilds the audio sink: the pipeline goes
+    # through READY, which keeps playsink and the device open. uridecodebin,
+    # the source and the decoder are made again for every uri, playbin2
+    # cannot keep a decoder across uris. With standby on, the pipeline we
+    # leave stays PAUSED in the pool; the next station then plays on the
+    # spare, a pipeline already in READY that the pool evicted or that a
+    # standby switch left behind, and only when there is none on a fresh
+    # one. firstAudio.<path> in the stats and benchmarks/SwitchLatency.py
+    # show what each path costs.
+    def retire(self):
+        self.finishBufferSession()
+        self.sampleThroughput()
+        if(self.timeshifting):
+            self.timeshift.stop()
+            self.timeshifting = False
+        # keep the station we are leaving prerolled, zapping back to it is then instant
+        state = self.player.get_state(0)[1]
+        if(self.standby.maxStandby > 0 and self.currentStream is not None and not self.stoppedManually
+           and state in (gst.STATE_PAUSED, gst.STATE_PLAYING)):
+            self.log.debug('Keeping %s on standby', self.station)
+            self.player.set_state(gst.STATE_PAUSED)
+            entry = StandbyPipeline(self.station, self.player, self.currentStream, self.playlist,
+                                    self.pendingCache, self.cachedPlayback)
+            entry.bufferPercent = self.bufferPercent
+            entry.tags = self.tags
+            entry.sampledPosition = self.sampledPosition
+            entry.sampledAt = self.sampledAt
+            self.standby.put(entry)
+            if(self.spare is not None):
+                self.setPipeline(self.spare)
+                self.spare = None
+                self.switchPath = 'ready'
+            else:
+                self.setPipeline(self.createPipeline())
+                self.switchPath = 'fresh'
+        else:
+            # READY keeps the audio sink open, only the source side is rebuilt for the next uri
+            self.switchPath = (state == gst.STATE_NULL) and 'cold' or 'ready'
+            self.player.set_state(gst.STATE_READY)
+        self.currentStream = None
+
+    def activate(self, entry):
+        self.log.info('Switching to standby pipeline of %s', entry.station)
+        self.switchPath = 'standby'
+        # whatever retire() left behind becomes the spare for the next switch
+        self.recyclePipeline(self.player)
+        self.setPipeline(entry.pipeline)
+        # carry on counting its bytes where the standby sampling left off
+        self.sampleStandby(entry)
+        self.sampledSource = entry.pipeline.get_property("source")
+        self.sampledPosition = entry.sampledPosition
+        self.sampledAt = entry.sampledAt
+        self.currentStream = entry.stream
+        self.playlist = entry.playlist
+        self.pendingCache = entry.pendingCache
+        self.cachedPlayback = entry.cachedPlayback
+        if(self.recorder.isRecording()):
+            self.attachRecorder()
+        if(len(entry.tags) > 0):
+            self.publishTags(entry.tags)
+
+        if(entry.bufferPercent is not None and entry.bufferPercent < self.bufferHighMark):
+            # prerolled but not filled up yet, on_message starts it at the high mark
+            self.log.debug('Standby buffer at %s%%, waiting for it to fill', entry.bufferPercent)
+            self.bufferPercent = entry.bufferPercent
+            self.buffering = True
+            self.bufferingSince = time.time()
+            self.notifyBuffer(entry.bufferPercent, True)
+            gobject.timeout_add_seconds(STANDBY_FILL_TIMEOUT, self.standbyFillExpired, self.player, self.bufferingSince)
+            return
+        self.buffering = False
+        self.player.set_state(gst.STATE_PLAYING)
+
+    def standbyFillExpired(self, pipeline, bufferingSince):
+        # a standby connection can die while paused and then posts nothing more, start over
+        if(pipeline is self.player and self.buffering and self.bufferingSince == bufferingSince
+           and not self.stoppedManually and not self.timeshifting):
+            self.log.info('Standby pipeline of %s did not fill up, reconnecting', self.station)
+            self.telemetry.count('standby.timeout')
+            self.player.set_state(gst.STATE_READY)
+            self.playStream(self.currentStream)
+        # run once
+        return False
+
+    def finishBufferSession(self):
+        if(self.bufferSession is not None):
+            self.tuner.finish(self.bufferSession)
+            self.bufferSession = None
+
+    def warm(self, urls):
+        """Prerolls the stations in urls, most likely first, on standby pipelines."""
+        gobject.idle_add(self.warmStations, urls)
+
+    def warmStations(self, urls):
+        # leave one standby slot for the station we are playing now
+        urls = [url for url in urls if url is not None and url != self.station][:max(self.standby.maxStandby - 1, 0)]
+        for url in self.warming.keys():
+            if url not in urls:
+                self.warming.pop(url).cancel()
+
+        for url in urls:
+            if url in self.warming or url in self.standby:
+                continue
+            self.log.debug('Warming up %s', url)
+            # on the prefetcher's threads, a warm-up must never hold up a real switch
+            self.warming[url] = self.prefetcher.resolver.submit(self.prefetchStation, (url, 'warmup'),
+                                                                lambda result, url=url: self.warmResolved(url, result))
+        # run once
+        return False
 
+    def warmResolved(self, url, result):
+        # back on the main loop
+        self.warming.pop(url, None)
+        if(result is None or url == self.station or self.standby.maxStandby == 0):
+            return
+
+        if('cached' in result):
+            entry = result['cached']
+            playlist = self.cachedPlaylist(entry)
+            standby = StandbyPipeline(url, None, entry['streams'][0], playlist, cachedPlayback=True)
         else:
+            standby = StandbyPipeline(url, None, result['stream'], result['playlist'], result['pendingCache'])
+
+        standby.pipeline = self.createPipeline()
+        self.tunePipeline(standby.pipeline, url)
+        standby.pipeline.set_property("uri", standby.stream)
+        standby.pipeline.set_state(gst.STATE_PAUSED)
+        self.standby.put(standby)
+
+    def cancelResolution(self):
+        if(self.job is not None):
+            self.job.cancel()
+            self.job = None
+
+    def submitJob(self, func, args, callback):
+        # callback only gets the result while the job is still self.job
+        job = self.resolver.submit(func, args, lambda result: self.jobDone(job, callback, result))
+        return job
+
+    def adoptJob(self, job, callback):
+        job.redirect(lambda result: self.jobDone(job, callback, result))
+        return job
+
+    def postJob(self, result, callback):
+        job = self.resolver.post(result, lambda result: self.jobDone(job, callback, result))
+        return job
+
+    def jobDone(self, job, callback, result):
+        # main loop; a job that was replaced meanwhile must not touch the player
+        if(job is not self.job):
+            self.log.debug('Dropping result of a replaced resolution')
+            return
+        self.job = None
+        callback(result)
+
+    def resolveStation(self, job, uri, phase='resolve'):
+        # runs on a resolver thread; phase names its timings in the telemetry
+        entry = self.cache.lookup(uri)
+        if(self.cache.isFresh(entry)):
+            self.log.info('Using cached resolution for %s', uri)
+            return {'cached':entry}
+
+        urlInfo = self.decoder.getMediaStreamInfo(uri, self.cache.getValidators(entry), job, phase)
+
+        if(urlInfo is not None and urlInfo.isNotModified()):
+            self.log.info('Cached resolution for %s is still valid', uri)
+            self.cache.refresh(uri)
+            return {'cached':entry}
+
+        if(urlInfo is None):
+            return None
+
+        decoderName = None
+        if(urlInfo.getDecoder() is not None):
+            decoderName = urlInfo.getDecoder().__class__.__name__
+        pendingCache = {'contentType':urlInfo.getContentType(), 'decoder':decoderName,
+                        'etag':urlInfo.getHeader('ETag'), 'lastModified':urlInfo.getHeader('Last-Modified')}
+
+        playlist = self.newPlaylist()
+        playlist.add([uri])
+        if(urlInfo.isPlaylist()):
+            if(job.isCancelled()):
+                urlInfo.close()
+                return None
+            playlist.expand(uri, self.decoder.getPlaylist(urlInfo, phase) or [])
+
+        return {'playlist':playlist, 'pendingCache':pendingCache}
+
+    def prefetchStation(self, job, uri, phase='prefetch'):
+        # runs on a prefetcher thread; resolves all the way down to the stream to play
+        result = self.resolveStation(job, uri, phase)
+        if(result is None or 'cached' in result):
+            return result
+
+        urlInfo = self.racer.select(result['playlist'], job, phase)
+        if(urlInfo is None):
+            return None
+        result['stream'] = urlInfo.getUrl()
+        return result
+
+    def newPlaylist(self):
+        return PlaylistExpander(self.maxPlaylistDepth, self.maxPlaylistCandidates)
+
+    def stationResolved(self, result):
+        # back on the main loop
+        if(result is None):
             self.stop()
-            self.eventManager.notify(EventManager.STATION_ERROR, {'error':"Couldn't connect to radio station"})
+            self.eventManager.notify(EventManager.STATION_ERROR, ErrorData("Couldn't connect to radio station"))
+            return
+
+        if(self.startedAt is not None):
+            self.telemetry.observe('resolve.station', time.time() - self.startedAt)
+        if('cached' in result):
+            self.telemetry.count('resolve.cacheHits')
+            self.playCached(result['cached'])
+            return
+
+        self.pendingCache = result['pendingCache']
+        self.playlist = result['playlist']
+        if('stream' in result):
+            self.log.info('Play "%s"', result['stream'])
+            self.playStream(result['stream'])
+            return
+
+        if(len(self.playlist) == 0):
+            self.log.warn('Received empty playlist!')
+            #self.mediator.stop()
+            self.eventManager.notify(EventManager.STATION_ERROR, ErrorData("Received empty stream from station"))
+        self.log.debug(self.playlist.urls())
+        self.playNextStream()
             
 
     def playNextStream(self):
         if(len(self.playlist) > 0):
-            stream = self.playlist.pop(0)
-            self.log.info('Play "%s"', stream)
-
-            urlInfo = self.decoder.getMediaStreamInfo(stream)
-            if(urlInfo is not None and urlInfo.isPlaylist() == False):
-                self.playStream(stream)
-            elif(urlInfo is not None and urlInfo.isPlaylist()):
-                self.playlist = self.decoder.getPlaylist(urlInfo) + self.playlist
-                self.playNextStream()
-            elif(urlInfo is None):
-                self.playNextStream()
+            self.cancelResolution()
+            self.job = self.submitJob(self.selectStream, (self.playlist,), self.streamSelected)
         else:
             self.stop()
-            self.eventManager.notify(EventManager.STATE_CHANGED, {'state':'paused'})
+            self.eventManager.notify(EventManager.STATE_CHANGED, StateData.PAUSED)
         #self.mediator.updateVolume(self.player.get_property("volume"))
 
+    def selectStream(self, job, playlist):
+        # runs on a resolver thread
+        started = time.time()
+        urlInfo = self.racer.select(playlist, job)
+        self.telemetry.observe('resolve.race', time.time() - started)
+        if(urlInfo is None):
+            return None
+        return urlInfo.getUrl()
+
+    def streamSelected(self, stream):
+        # back on the main loop
+        if(stream is not None):
+            self.log.info('Play "%s"', stream)
+            self.playStream(stream)
+        elif(self.cachedPlayback):
+            self.resolveAgain()
+        else:
+            self.stop()
+            self.eventManager.notify(EventManager.STATE_CHANGED, StateData.PAUSED)
+
+
+    def cachedPlaylist(self, entry):
+        playlist = self.newPlaylist()
+        playlist.add(entry['streams'])
+        playlist.take(entry['streams'][0], 'cached')
+        return playlist
+
+    def playCached(self, entry):
+        self.cachedPlayback = True
+        self.playlist = self.cachedPlaylist(entry)
+        self.playStream(entry['streams'][0])
 
     def playStream(self, uri):
+        self.currentStream = uri
+        if(self.timeshift is not None and uri.startswith('http') and uri not in self.unshiftable):
+            self.timeshifting = True
+            # the time-shift plays through its own sink, free ours
+            self.player.set_state(gst.STATE_NULL)
+            self.timeshift.start(uri, self.player.get_property("volume"))
+            if(self.recorder.isRecording()):
+                self.attachRecorder()
+            return
+
+        self.timeshifting = False
+        self.buffering = True
+        self.bufferingSince = time.time()
+        self.tunePipeline(self.player, self.station)
         self.player.set_property("uri", uri)
         self.player.set_state(gst.STATE_PAUSED) # buffer before starting playback
 
     def stop(self):
         self.stoppedManually = True
-        self.player.set_state(gst.STATE_NULL)
-        self.eventManager.notify(EventManager.STATE_CHANGED, {'state':'paused'})
+        self.cancelResolution()
+        self.reconnector.cancel()
+        self.finishBufferSession()
+        if(self.timeshifting):
+            # keep capturing so playing again resumes where we paused
+            self.timeshift.pause()
+        else:
+            self.player.set_state(gst.STATE_READY)
+            gobject.timeout_add_seconds(IDLE_RELEASE_SECONDS, self.releaseIdle, self.player)
+        self.eventManager.notify(EventManager.STATE_CHANGED, StateData.PAUSED)
+
+    def releaseIdle(self, pipeline):
+        # still stopped, let go of the audio device
+        if(pipeline is self.player and self.stoppedManually and pipeline.get_state(0)[1] == gst.STATE_READY):
+            self.log.debug('Releasing the idle pipeline')
+            pipeline.set_state(gst.STATE_NULL)
+        # run once
+        return False
+
+    def rewind(self, seconds):
+        if(self.timeshifting):
+            self.timeshift.rewind(seconds)
+
+    def goLive(self):
+        if(self.timeshifting):
+            self.timeshift.live()
+
+    def getTimeshiftDelay(self):
+        if(self.timeshifting):
+            return self.timeshift.delay()
+        return 0.0
+
+    def isRecording(self):
+        return self.recorder.isRecording()
+
+    def startRecording(self, name=None):
+        if(self.station is None):
+            return
+        try:
+            self.recorder.start(self.station, name)
+        except (OSError, IOError), e:
+            self.log.warn('Could not start recording: %s', str(e))
+            self.eventManager.notify(EventManager.NOTIFICATION, NotificationData('Recording failed', str(e)))
+            return
+        self.attachRecorder()
+
+    def toggleRecording(self, name=None):
+        if(self.recorder.isRecording()):
+            self.stopRecording()
+        else:
+            self.startRecording(name)
+
+    def stopRecording(self):
+        if(self.timeshift is not None):
+            self.timeshift.recorder = None
+        self.recorder.stop()
+
+    def attachRecorder(self):
+        if(self.timeshifting):
+            # the capture hands over the stream without the icecast metadata
+            self.recorder.attach(None)
+            self.timeshift.recorder = self.recorder
+            return
+        source = self.player.get_property("source")
+        if(source is not None):
+            self.recorder.attach(source.get_pad("src"))
+
+    def sourceChanged(self, pipeline, pspec):
+        # playbin2 made a new source for the next stream
+        source = pipeline.get_property("source")
+        if(source is not None and source.get_factory().get_name() == "souphttpsrc"):
+            source.set_property("user-agent", USER_AGENT)
+        if(pipeline is not self.player):
+            return
+        self.sampledSource = source
+        self.sampledPosition = 0
+        self.sampledAt = time.time()
+        if(self.recorder.isRecording() and not self.timeshifting):
+            self.attachRecorder()
+
+    def sampleThroughput(self):
+        source = self.player.get_property("source")
+        if(source is None or source is not self.sampledSource):
+            return
+        self.sampledPosition, self.sampledAt = self.sampleSource(source, self.station, self.sampledPosition,
+                                                                 self.sampledAt)
+
+    def sampleStandby(self, entry):
+        # standby pipelines keep downloading until their buffer is full, count it for their station
+        source = entry.pipeline.get_property("source")
+        if(source is None):
+            return
+        position, entry.sampledAt = self.sampleSource(source, entry.station, entry.sampledPosition, entry.sampledAt)
+        if(position > entry.sampledPosition):
+            self.telemetry.station(entry.station, 'standbyBytes', position - entry.sampledPosition)
+            entry.sampledPosition = position
+
+    def sampleSource(self, source, station, sampledPosition, sampledAt):
+        """Adds what source received since sampledPosition to the station, returns the new position and time."""
+        try:
+            position, format = source.query_position(gst.FORMAT_BYTES)
+        except gst.QueryError:
+            return sampledPosition, sampledAt
+        now = time.time()
+        if(position <= sampledPosition):
+            return sampledPosition, sampledAt
+        self.telemetry.station(station, 'bytes', position - sampledPosition)
+        self.telemetry.station(station, 'seconds', now - sampledAt)
+        return position, now
+
+    def sampleAll(self):
+        self.sampleThroughput()
+        for entry in self.standby.values():
+            self.sampleStandby(entry)
+
+    def getStats(self):
+        """Returns a snapshot of the player telemetry."""
+        self.sampleAll()
+        stats = self.telemetry.snapshot()
+        stats['reconnect'] = self.reconnector.stats()
+        stats['events'] = self.eventManager.getQueueStats()
+        if(self.dnsCache is not None):
+            stats['dns'] = self.dnsCache.stats()
+        profile = self.eventManager.getProfile()
+        if(profile is not None):
+            stats['eventProfile'] = profile
+        return stats
+
+    def writeStats(self):
+        self.sampleAll()
+        extra = {'reconnect':self.reconnector.stats(), 'events':self.eventManager.getQueueStats()}
+        if(self.dnsCache is not None):
+            extra['dns'] = self.dnsCache.stats()
+        profile = self.eventManager.getProfile()
+        if(profile is not None):
+            extra['eventProfile'] = profile
+        self.telemetry.writeTo(self.statsFile, extra)
+        # keep running as a gobject timeout
+        return True
+
+    def close(self):
+        # the main loop is gone, write out what is still pending
+        self.cache.close()
+
+    def getVolume(self):
+        if(self.timeshifting and self.timeshift.isActive()):
+            return self.timeshift.getVolume()
+        return self.player.get_property("volume")
+
+    def setVolume(self, volume):
+        self.player.set_property("volume", volume)
+        if(self.timeshifting):
+            self.timeshift.setVolume(volume)
 
     def volume_up(self, volume_increment):   
-        self.player.set_property("volume", min(self.player.get_property("volume") + volume_increment, 1.0))
+        self.setVolume(min(self.getVolume() + volume_increment, 1.0))
         #self.mediator.updateVolume(self.player.get_property("volume"))
 
     def volume_down(self, volume_increment):
-        self.player.set_property("volume", max(self.player.get_property("volume") - volume_increment, 0.0))
+        self.setVolume(max(self.getVolume() - volume_increment, 0.0))
         #self.mediator.updateVolume(self.player.get_property("volume"))
 
     def on_message(self, bus, message):
+        if(bus is not self.bus):
+            self.on_standby_message(bus, message)
+            return True
+
         t = message.type
 
         stru = message.structure
@@ -128,69 +733,237 @@ class AudioPlayerGStreamer:
             name = stru.get_name()
             if(name == 'redirect'):
                 self.log.info("redirect received")
-                self.player.set_state(gst.STATE_NULL)
+                self.player.set_state(gst.STATE_READY)
                 stru.foreach(self.redirect, None)
 
                 
 
         if t == gst.MESSAGE_EOS:
             self.log.debug("Received MESSAGE_EOS")
-            self.player.set_state(gst.STATE_NULL)
+            self.player.set_state(gst.STATE_READY)
             self.playNextStream()
         elif t == gst.MESSAGE_BUFFERING:
             percent = message.structure['buffer-percent']
-            if percent < 100:
-                self.log.debug("Buffering %s" % percent)
+            self.bufferPercent = percent
+            if(self.bufferSession is not None):
+                mode, avgIn, avgOut, bufferingLeft = message.parse_buffering_stats()
+                self.bufferSession.buffering(avgIn)
+
+            changed = False
+            if(not self.buffering and percent < self.bufferLowMark):
+                self.log.debug("Buffer down to %s%%, pausing" % percent)
+                self.buffering = changed = True
+                self.bufferingSince = time.time()
+                self.telemetry.count('underruns')
+                self.telemetry.station(self.station, 'underruns')
+                if(self.bufferSession is not None):
+                    self.bufferSession.underrun()
                 self.player.set_state(gst.STATE_PAUSED)
-                self.eventManager.notify(EventManager.BUFFER_CHANGED,{'buffer':percent})
-            else:
+            elif(self.buffering and percent >= self.bufferHighMark):
+                self.log.debug("Buffer back at %s%%, playing" % percent)
+                self.buffering = False
+                if(self.bufferingSince is not None):
+                    self.telemetry.observe('buffering', time.time() - self.bufferingSince)
+                    self.bufferingSince = None
+                changed = True
                 self.player.set_state(gst.STATE_PLAYING)
+            self.notifyBuffer(percent, changed)
         elif t == gst.MESSAGE_ERROR:
             self.log.debug("Received MESSAGE_ERROR")
-            self.player.set_state(gst.STATE_NULL)
+            self.player.set_state(gst.STATE_READY)
             err, debug = message.parse_error()
             self.log.warn(err)
             self.log.warn(debug)
 
-            if(len(self.playlist)>0):
-                self.playNextStream()
-            else:
-                self.eventManager.notify(EventManager.STATION_ERROR, {'error':debug})
+            if(self.isAudioSinkError(message) and self.disableStandby()):
+                # a standby pipeline held on to the audio device, try again without them
+                self.playStream(self.currentStream)
+                return True
+            if(self.reconnector.isActive()):
+                # the reconnect attempt failed, the scheduler tries again later
+                return True
+            self.streamFailed(debug)
 
         elif t == gst.MESSAGE_STATE_CHANGED:
             oldstate, newstate, pending = message.parse_state_changed()
             self.log.debug(("Received MESSAGE_STATE_CHANGED (%s -> %s)") % (oldstate, newstate))
 
             if newstate == gst.STATE_PLAYING:
-                self.retrying = False
-                #station = self.mediator.getContext().station
-                self.eventManager.notify(EventManager.STATE_CHANGED, {'state':'playing'})
+                if(message.src is self.player):
+                    self.reconnector.recovered()
+                if(self.bufferSession is not None and message.src is self.player):
+                    self.bufferSession.playing()
+                self.stationPlaying()
             elif oldstate == gst.STATE_PLAYING and newstate == gst.STATE_PAUSED and (not self.stoppedManually):
                 self.log.info("Received PAUSE state.")
-                
-                if self.retrying == False:
-                    self.retrying = True
-                    timer = Timer(20.0, self.checkTimeout)
-                    timer.start()
-                    self.eventManager.notify(EventManager.STATE_CHANGED, {'state':'paused'})
-                    
-            
+
+                if(message.src is self.player and not self.reconnector.isActive()):
+                    if(self.buffering):
+                        # a low buffer is no stall as long as the source keeps receiving
+                        self.watchStall(self.player, self.sourcePosition(self.player))
+                    else:
+                        self.reconnectPercent = self.bufferPercent
+                        self.reconnector.stalled()
+                    self.eventManager.notify(EventManager.STATE_CHANGED, StateData.PAUSED)
+
 
         elif t == gst.MESSAGE_TAG:
 
            taglist = message.parse_tag()
+           self.publishTags(taglist)
+
+        return True
+
+    def sourcePosition(self, pipeline):
+        source = pipeline.get_property("source")
+        if(source is None):
+            return None
+        try:
+            return source.query_position(gst.FORMAT_BYTES)[0]
+        except gst.QueryError:
+            return None
+
+    def watchStall(self, pipeline, position):
+        gobject.timeout_add_seconds(STALL_TIMEOUT, self.checkStall, pipeline, position)
+
+    def checkStall(self, pipeline, position):
+        # still waiting for the buffer to fill on the same pipeline?
+        if(pipeline is not self.player or not self.buffering or self.stoppedManually
+           or self.reconnector.isActive()):
+            return False
+        current = self.sourcePosition(pipeline)
+        if(current is not None and position is not None and current > position):
+            # slow, but the data is coming
+            self.watchStall(pipeline, current)
+            return False
+        self.log.info("No data for %d seconds while buffering", STALL_TIMEOUT)
+        self.reconnectPercent = self.bufferPercent
+        self.reconnector.stalled()
+        # run once
+        return False
+
+    def stationPlaying(self):
+        if(self.startedAt is not None):
+            elapsed = time.time() - self.startedAt
+            self.telemetry.observe('firstAudio', elapsed)
+            if(self.switchPath is not None):
+                self.telemetry.observe('firstAudio.' + self.switchPath, elapsed)
+            self.startedAt = None
+        if(self.cachedPlayback):
+            # a cached fallback took over, try it first next time
+            self.cache.promote(self.station, self.currentStream)
+        if(self.pendingCache is not None):
+            pending = self.pendingCache
+            self.pendingCache = None
+            self.cache.store(self.station, [self.currentStream] + self.playlist.urls(), pending['contentType'],
+                             pending['decoder'], pending['etag'], pending['lastModified'])
+        #station = self.mediator.getContext().station
+        self.eventManager.notify(EventManager.STATE_CHANGED, StateData.PLAYING)
+
+    def publishTags(self, taglist):
+        keys = taglist.keys()
+        for key in keys:
+            self.tags[key] = taglist[key]
+        self.publishStreamInfo(taglist, keys)
+
+        #if there is no song information, there's no point in triggering song change event
+        if('artist' not in keys and 'title' not in keys):
+            return
+        # streams resend the same tags all the time, only publish real changes. Some send
+        # artist and title in separate messages, a tag missing from one keeps its last value
+        previous = self.songFingerprint or (None,) * len(SONG_TAGS)
+        fingerprint = tuple([(taglist[key] if key in keys else old) for key, old in zip(SONG_TAGS, previous)])
+        if(fingerprint == self.songFingerprint):
+            return
+        self.songFingerprint = fingerprint
+
+        metadata = {}
+        for key in keys:
+            metadata[key] = taglist[key]
+        for key, value in zip(SONG_TAGS, fingerprint):
+            if(value is not None):
+                metadata[key] = value
+        metadata['changed'] = [key for key, old, new in zip(SONG_TAGS, previous, fingerprint) if old != new]
+
+        # a time-shift splits the recording itself, when the tag is captured rather than played
+        if(self.recorder.isRecording() and not self.timeshifting):
+            self.recorder.split(metadata)
+        self.eventManager.notify(EventManager.SONG_CHANGED, metadata)
 
-           #if there is no song information, there's no point in triggering song change event
-           if('artist' in taglist.keys() or 'title' in taglist.keys()):
-               #station = self.mediator.getContext().station
-               metadata = {}
+    def publishStreamInfo(self, taglist, keys):
+        changed = {}
+        for key in STREAM_TAGS:
+            if(key in keys and self.streamInfo.get(key) != taglist[key]):
+                changed[key] = taglist[key]
+        if(len(changed) == 0):
+            return
+        self.streamInfo.update(changed)
+        info = dict(self.streamInfo)
+        info['changed'] = changed.keys()
+        # nothing on screen depends on it, let buffering and song changes go first
+        gobject.idle_add(self.notifyStreamInfo, info, priority=gobject.PRIORITY_LOW)
 
-               for key in taglist.keys():      
-                   metadata[key] = taglist[key]
-               #metadata['station'] = station
-           
-               self.eventManager.notify(EventManager.SONG_CHANGED, metadata)
+    def notifyStreamInfo(self, info):
+        self.eventManager.notify(EventManager.STREAM_INFO_CHANGED, info)
+        # run once
+        return False
 
+    def timeshiftTag(self, metadata):
+        self.publishTags(metadata)
+
+    def timeshiftUnsupported(self):
+        self.unshiftable.add(self.currentStream)
+        self.timeshifting = False
+        self.playStream(self.currentStream)
+
+    def notifyBuffer(self, percent, changed=False):
+        # the UI cannot show more than a couple of updates a second, but never miss a full buffer
+        if(percent == self.bufferNotifiedPercent):
+            return
+        now = time.time()
+        if(changed or percent >= 100 or now - self.bufferNotifiedAt >= BUFFER_NOTIFY_INTERVAL):
+            self.log.debug("Buffering %s" % percent)
+            self.bufferNotifiedAt = now
+            self.bufferNotifiedPercent = percent
+            self.eventManager.notify(EventManager.BUFFER_CHANGED, BufferData.of(percent))
+
+    def on_standby_message(self, bus, message):
+        # standby pipelines only stay paused; remember what they post, drop the ones that broke
+        t = message.type
+        if(t not in (gst.MESSAGE_ERROR, gst.MESSAGE_EOS, gst.MESSAGE_BUFFERING, gst.MESSAGE_TAG)):
+            return
+        entry = self.standby.findByBus(bus)
+        if(entry is None):
+            return
+
+        if t == gst.MESSAGE_BUFFERING:
+            entry.bufferPercent = message.structure['buffer-percent']
+        elif t == gst.MESSAGE_TAG:
+            taglist = message.parse_tag()
+            for key in taglist.keys():
+                entry.tags[key] = taglist[key]
+        elif t == gst.MESSAGE_ERROR and self.isAudioSinkError(message):
+            self.disableStandby()
+        else:
+            self.log.debug('Standby pipeline of %s failed', entry.station)
+            self.standby.remove(entry.station)
+
+    def isAudioSinkError(self, message):
+        factory = message.src.get_factory() if isinstance(message.src, gst.Element) else None
+        return factory is not None and 'Sink/Audio' in factory.get_klass()
+
+    def disableStandby(self):
+        # the audio device cannot be opened twice (ALSA without dmix), standby pipelines cannot work
+        if(self.standby.maxStandby == 0):
+            return False
+        self.log.warn('The audio device cannot be shared, disabling standby pipelines')
+        self.telemetry.count('standby.disabled')
+        for url in self.warming.keys():
+            self.warming.pop(url).cancel()
+        self.standby.disable()
+        if(self.spare is not None):
+            self.destroyPipeline(self.spare)
+            self.spare = None
         return True
 
     def redirect(self, name, value, data):
@@ -199,11 +972,39 @@ class AudioPlayerGStreamer:
         return True
 
 
-    def checkTimeout(self):
-        self.log.debug("Checking timeout...")
-        if self.retrying == True:
-            self.log.info("Timed out. Retrying...")
-            uri = self.player.get_property("uri")
-            self.playStream(uri)
-        else: 
-            self.log.info("Timed out, but not retrying anymore")
+    def streamFailed(self, error):
+        self.telemetry.count('streams.failed')
+        if(len(self.playlist)>0):
+            # cached or not, the other streams of the station come first
+            self.playNextStream()
+        elif(self.cachedPlayback):
+            self.resolveAgain()
+        else:
+            self.eventManager.notify(EventManager.STATION_ERROR, ErrorData(error))
+
+    def resolveAgain(self):
+        # none of the cached streams plays any more, resolve the station again
+        self.telemetry.count('resolve.cacheStale')
+        self.cache.invalidate(self.station)
+        self.start(self.station)
+
+    def reconnect(self):
+        # called by the reconnect scheduler on the main loop
+        if(self.bufferPercent > self.reconnectPercent):
+            # still filling up, give it more time
+            self.reconnectPercent = self.bufferPercent
+            return False
+
+        self.log.info("Reconnecting to %s", self.currentStream)
+        self.telemetry.count('reconnects')
+        self.telemetry.station(self.station, 'reconnects')
+        self.reconnectPercent = 0
+        self.bufferPercent = 0
+        self.player.set_state(gst.STATE_READY)
+        self.playStream(self.currentStream)
+        return True
+
+    def reconnectFailed(self):
+        self.log.info("Could not reconnect to %s", self.currentStream)
+        self.player.set_state(gst.STATE_READY)
+        self.streamFailed("Lost connection to radio station")
@@ -0,0 +1,197 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import os
+import json
+import time
+import threading
+import logging
+
+# weight of the newest session in the per station averages
+SMOOTHING = 0.3
+# sessions shorter than this say nothing about underruns
+MIN_PLAYED = 10.0
+
+# queue2 defaults, used until a station has some history
+DEFAULT_LOW_PERCENT = 10
+DEFAULT_HIGH_PERCENT = 99
+
+
+class BufferSession:
+    """What one listening session of a station measured."""
+
+    def __init__(self, station):
+        self.station = station
+        self.bufferingSince = None
+        self.playingSince = None
+        self.played = 0.0
+        self.startup = None
+        self.rebuffering = 0.0
+        self.underruns = 0
+        self.rateTotal = 0
+        self.rateSamples = 0
+
+    def buffering(self, avgIn):
+        if avgIn > 0:
+            self.rateTotal += avgIn
+            self.rateSamples += 1
+
+        if self.playingSince is None and self.bufferingSince is None:
+            self.bufferingSince = time.time()
+
+    def underrun(self):
+        # ran dry while playing
+        if self.playingSince is not None:
+            now = time.time()
+            self.underruns += 1
+            self.played += now - self.playingSince
+            self.playingSince = None
+            self.bufferingSince = now
+
+    def playing(self):
+        now = time.time()
+        if self.bufferingSince is not None:
+            if self.startup is None:
+                self.startup = now - self.bufferingSince
+            else:
+                self.rebuffering += now - self.bufferingSince
+            self.bufferingSince = None
+        elif self.startup is None:
+            self.startup = 0.0
+
+        if self.playingSince is None:
+            self.playingSince = now
+
+    def stop(self):
+        if self.playingSince is not None:
+            self.played += time.time() - self.playingSince
+            self.playingSince = None
+
+    def throughput(self):
+        if self.rateSamples == 0:
+            return None
+        return float(self.rateTotal) / self.rateSamples
+
+
+class BufferTuner:
+    """Picks the buffer size and watermarks of a station from its history.
+
+    Every station gets a running average of its throughput, of how long it
+    took to fill the buffer and of its underruns per minute played. Quiet
+    stations get a couple of seconds of buffer and start playing at half
+    fill; stations that ran dry before get more seconds and wait for a full
+    buffer. The history lives in a JSON file in the user directory.
+    """
+
+    def __init__(self, filename, defaultSize=164000, minSize=32000, maxSize=1048576, maxEntries=500):
+        self.log = logging.getLogger('radiotray')
+        self.filename = filename
+        self.defaultSize = defaultSize
+        self.minSize = minSize
+        self.maxSize = maxSize
+        self.maxEntries = maxEntries
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.loadFromFile()
+
+    def loadFromFile(self):
+        if not os.access(self.filename, os.R_OK):
+            return
+
+        try:
+            in_file = open(self.filename, "r")
+            try:
+                entries = json.load(in_file)
+            finally:
+                in_file.close()
+        except Exception, e:
+            self.log.warn('Could not read buffer history %s: %s', self.filename, str(e))
+            return
+
+        if isinstance(entries, dict):
+            self.entries = entries
+
+    def saveToFile(self):
+        tmpname = self.filename + '.tmp'
+        try:
+            out_file = open(tmpname, "w")
+            try:
+                json.dump(self.entries, out_file)
+            finally:
+                out_file.close()
+            os.rename(tmpname, self.filename)
+        except Exception, e:
+            self.log.warn('Could not write buffer history %s: %s', self.filename, str(e))
+
+    def settings(self, station):
+        """Returns the buffer size in bytes, duration in seconds and queue2 watermarks for station."""
+        with self.lock:
+            entry = self.entries.get(station)
+
+        if entry is None or entry.get('throughput') is None:
+            return {'size':self.defaultSize, 'duration':None,
+                    'low':DEFAULT_LOW_PERCENT, 'high':DEFAULT_HIGH_PERCENT}
+
+        underrunRate = entry.get('underrunRate') or 0.0
+        # two seconds for a station that never ran dry, up to twenty for one that does every minute
+        seconds = min(2.0 + 18.0 * underrunRate, 20.0)
+        size = int(min(max(entry['throughput'] * seconds, self.minSize), self.maxSize))
+
+        if underrunRate < 0.01:
+            low, high = DEFAULT_LOW_PERCENT, 50
+        else:
+            low, high = 20, min(50 + int(underrunRate * 500), DEFAULT_HIGH_PERCENT)
+
+        return {'size':size, 'duration':seconds, 'low':low, 'high':high}
+
+    def finish(self, session):
+        """Folds what session measured into the history of its station."""
+        session.stop()
+        throughput = session.throughput()
+        if throughput is None and session.played < MIN_PLAYED:
+            return
+
+        with self.lock:
+            entry = self.entries.setdefault(session.station, {'sessions':0})
+            if throughput is not None:
+                entry['throughput'] = self._smooth(entry.get('throughput'), throughput)
+            if session.startup is not None:
+                entry['startup'] = self._smooth(entry.get('startup'), session.startup)
+            if session.played >= MIN_PLAYED:
+                entry['underrunRate'] = self._smooth(entry.get('underrunRate'), session.underruns / (session.played / 60.0))
+            entry['sessions'] += 1
+            entry['used'] = time.time()
+            self._evict()
+            self.saveToFile()
+
+        self.log.debug('Buffer history of %s: %s', session.station, entry)
+
+    def _smooth(self, average, value):
+        if average is None:
+            return value
+        return (1 - SMOOTHING) * average + SMOOTHING * value
+
+    def _evict(self):
+        excess = len(self.entries) - self.maxEntries
+        if excess <= 0:
+            return
+
+        byAge = sorted(self.entries.iteritems(), key=lambda item: item[1].get('used', 0))
+        for station, entry in byAge[:excess]:
+            del self.entries[station]
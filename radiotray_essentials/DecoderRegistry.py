@@ -0,0 +1,138 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import re
+import logging
+
+ENTRY_POINT_GROUP = 'cursedradio.decoders'
+# longest magic prefix we ever need to look at
+MAGIC_LENGTH = 16
+
+def normalizeContentType(contentType):
+    if contentType is None:
+        return ''
+    return contentType.split(';', 1)[0].strip().lower()
+
+
+class DecoderRegistry:
+    """Finds the playlist decoder for a probed stream.
+
+    Decoders describe what they read with class attributes: contentTypes,
+    the MIME types they handle; magic, prefixes of the (stripped,
+    lowercased) first bytes that identify their format; magicRequired, set
+    when the content type alone is too ambiguous and the magic has to
+    match as well; and lineMagic, prefixes any of the first lines may
+    start with. Decoders that only implement
+    isStreamValid(contentType, firstBytes) still work, they are asked last.
+
+    Servers get playlist types wrong all the time, so the magic is checked
+    before the content type, then the content type, then the lines. All
+    magic prefixes are compiled into one pattern, so the magic check is a
+    single match however many decoders there are; where prefixes overlap
+    the longest one wins.
+    """
+
+    def __init__(self):
+        self.log = logging.getLogger('radiotray')
+        self.decoders = []
+        # MIME type -> (decoder, magic it also needs or None), in registration order
+        self.byType = {}
+        # prefix -> decoder for decoders the magic alone is enough for
+        self.magic = {}
+        self.magicPattern = None
+        # (prefix, decoder) for lines anywhere in the first bytes
+        self.lineMagic = []
+        # decoders without contentTypes/magic, checked with isStreamValid
+        self.legacy = []
+
+    def register(self, decoder):
+        self.decoders.append(decoder)
+        contentTypes = getattr(decoder, 'contentTypes', None)
+        magic = getattr(decoder, 'magic', None)
+        lineMagic = getattr(decoder, 'lineMagic', None)
+
+        if contentTypes is None and magic is None and lineMagic is None:
+            self.legacy.append(decoder)
+            return
+
+        for prefix in lineMagic or ():
+            self.lineMagic.append((prefix.lower(), decoder))
+
+        prefixes = tuple([prefix.lower() for prefix in magic or ()])
+        if getattr(decoder, 'magicRequired', False):
+            required = prefixes
+        else:
+            required = None
+            for prefix in prefixes:
+                self.magic.setdefault(prefix, decoder)
+            self.magicPattern = self._compile(self.magic)
+
+        for contentType in contentTypes or ():
+            self.byType.setdefault(normalizeContentType(contentType), []).append((decoder, required))
+
+    def loadEntryPoints(self, http):
+        try:
+            import pkg_resources
+        except ImportError:
+            return
+
+        for entryPoint in pkg_resources.iter_entry_points(ENTRY_POINT_GROUP):
+            try:
+                decoderClass = entryPoint.load()
+                self.register(decoderClass(http))
+                self.log.info('Loaded playlist decoder %s', entryPoint.name)
+            except Exception, e:
+                self.log.warn('Could not load playlist decoder %s: %s', entryPoint.name, str(e))
+
+    def lookup(self, contentType, firstBytes):
+        head = firstBytes[:MAGIC_LENGTH * 4].lstrip()[:MAGIC_LENGTH].lower()
+
+        if self.magicPattern is not None:
+            match = self.magicPattern.match(head)
+            if match is not None:
+                return self._found(self.magic[match.group(1)])
+
+        for decoder, required in self.byType.get(normalizeContentType(contentType), ()):
+            if required is None or head.startswith(required):
+                return self._found(decoder)
+
+        if len(self.lineMagic) > 0:
+            lowered = firstBytes.lower()
+            for prefix, decoder in self.lineMagic:
+                # most probes are audio, don't split those into lines
+                if prefix not in lowered:
+                    continue
+                for line in lowered.splitlines():
+                    if line.lstrip().startswith(prefix):
+                        return self._found(decoder)
+
+        for decoder in self.legacy:
+            if decoder.isStreamValid(contentType, firstBytes):
+                return self._found(decoder)
+
+        return None
+
+    def _compile(self, prefixes):
+        # longest first, a prefix must not hide a longer one that starts with it
+        alternatives = '|'.join([re.escape(prefix) for prefix in sorted(prefixes, key=len, reverse=True)])
+        return re.compile('(%s)' % alternatives)
+
+    def _found(self, decoder):
+        self.log.info('Stream is readable by %s', decoder.__class__.__name__)
+        return decoder
@@ -0,0 +1,251 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import sys
+import json
+import time
+import threading
+import curses
+import logging
+from optparse import OptionParser
+from events.EventManager import EventManager
+from events.EventQueue import EventQueue
+from events.EventSubscriber import EventSubscriber
+from events.EventJournal import replay
+from lib.common import EVENT_JOURNAL_FILE
+
+class ReplayCounter:
+    """Subscriber that counts what arrives, on the dispatcher thread or from a queue."""
+
+    def __init__(self):
+        self.counts = {}
+
+    def received(self, event):
+        def callback(data):
+            self.counts[event] = self.counts.get(event, 0) + 1
+        callback.__name__ = event
+        return callback
+
+
+class StubWindow:
+    """Stands in for a curses window and keeps the text drawn into it."""
+
+    def __init__(self, height, width, top, left):
+        self.top = top
+        self.left = left
+        self.resize(height, width)
+        self.refreshes = 0
+
+    def getmaxyx(self):
+        return (self.height, self.width)
+
+    def resize(self, height, width):
+        self.height = height
+        self.width = width
+        self.erase()
+
+    def mvwin(self, top, left):
+        self.top = top
+        self.left = left
+
+    def erase(self):
+        self.lines = [' ' * self.width] * self.height
+
+    def box(self):
+        pass
+
+    def refresh(self):
+        self.refreshes += 1
+
+    def addstr(self, y, x, s, attribs=0):
+        if y < 0 or y >= self.height or x < 0 or x >= self.width:
+            raise curses.error('addstr() returned ERR')
+        s = s[:self.width - x]
+        line = self.lines[y]
+        self.lines[y] = line[:x] + s + line[x + len(s):]
+
+
+class StubCurses:
+    """The curses module as the interface sees it, drawing into StubWindows."""
+
+    def __init__(self, curses):
+        self.curses = curses
+        self.windows = []
+
+    def __getattr__(self, name):
+        # constants and key codes come from the real module
+        return getattr(self.curses, name)
+
+    def newwin(self, height, width, top, left):
+        window = StubWindow(height, width, top, left)
+        self.windows.append(window)
+        return window
+
+    def color_pair(self, number):
+        return number << 8
+
+    def screen(self, height, width):
+        """The text of every window, drawn where it sits."""
+        lines = [[' '] * width for i in range(height)]
+        for window in self.windows:
+            for y, line in enumerate(window.lines):
+                for x, char in enumerate(line):
+                    if char != ' ' and 0 <= window.top + y < height and 0 <= window.left + x < width:
+                        lines[window.top + y][window.left + x] = char
+        return [''.join(line).rstrip() for line in lines]
+
+
+class StubPlayer:
+    prefetcher = None
+    timeshift = None
+
+    def warm(self, urls):
+        pass
+
+
+class StubProvider:
+
+    def listGroupNames(self):
+        return []
+
+
+class InterfaceTicker(threading.Thread):
+    """Runs the ticks of the real curses interface against a stub screen."""
+
+    TICK = 0.1
+
+    def __init__(self, eventManager, width, height):
+        threading.Thread.__init__(self, name='interface')
+        self.daemon = True
+        self.log = logging.getLogger('radiotray')
+        import MyCursesInterface
+        # the interface draws through its module's curses, stop() puts the real one back
+        self.curses = StubCurses(MyCursesInterface.curses)
+        MyCursesInterface.curses = self.curses
+
+        self.width = width
+        self.height = height
+        try:
+            self.interface = MyCursesInterface.CursesThread(StubPlayer(), StubProvider(), None)
+            self.interface.screenSize = {'width':width, 'height':height}
+            self.interface.initWindows()
+            self.interface.labelBar.draw()
+        except:
+            self.restoreCurses()
+            raise
+        # the title escape would end up in the report
+        self.interface.setTerminalTitle = lambda: None
+        self.interface.bindEvents(EventSubscriber(eventManager))
+
+        self.stopped = threading.Event()
+        self.ticks = 0
+        self.errors = 0
+
+    def run(self):
+        while not self.stopped.isSet():
+            self.tick()
+            self.stopped.wait(self.TICK)
+
+    def tick(self, ticks=None):
+        if ticks is None:
+            ticks = self.ticks % 30
+        try:
+            self.interface.tick(ticks)
+        except Exception:
+            self.errors += 1
+            self.log.exception('Interface tick failed')
+        self.ticks += 1
+
+    def stop(self):
+        try:
+            self.stopped.set()
+            self.join()
+            # whatever is still queued, then a full redraw
+            self.tick(0)
+        finally:
+            self.restoreCurses()
+
+    def restoreCurses(self):
+        import MyCursesInterface
+        MyCursesInterface.curses = self.curses.curses
+
+    def report(self):
+        return {'ticks':self.ticks, 'errors':self.errors, 'events':self.interface.events.stats(),
+                'playerState':self.interface.playerState, 'screen':self.curses.screen(self.height, self.width)}
+
+
+def main():
+    parser = OptionParser(usage='%prog [options] [journal]')
+    parser.add_option('-f', '--fast', dest='fast', action='store_true', default=False,
+                      help='send the events as fast as possible instead of as recorded')
+    parser.add_option('-s', '--speed', dest='speed', type='float', default=1.0,
+                      help='playback speed when not --fast')
+    parser.add_option('-q', '--queued', dest='queued', action='store_true', default=False,
+                      help='deliver through a drained subscriber queue, like the curses interface')
+    parser.add_option('-u', '--ui', dest='ui', action='store_true', default=False,
+                      help='also replay into the real curses interface, drawn on a stub screen')
+    parser.add_option('--width', dest='width', type='int', default=80, help='stub screen width for --ui')
+    parser.add_option('-b', '--budget', dest='budget', type='int', default=50,
+                      help='milliseconds after which a subscriber counts as slow')
+    parser.add_option('-v', '--verbose', dest='verbose', action='store_true', default=False)
+    (options, args) = parser.parse_args()
+
+    logging.basicConfig(level=options.verbose and logging.DEBUG or logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    journal = args and args[0] or EVENT_JOURNAL_FILE
+
+    eventManager = EventManager()
+    eventManager.enableProfiling(options.budget / 1000.0)
+    counter = ReplayCounter()
+    queue = options.queued and EventQueue() or None
+    callbacks = []
+    for event in eventManager.getObserversMap().keys():
+        callback = counter.received(event)
+        # bound methods are held weakly, plain functions are not, keep them anyway
+        callbacks.append(callback)
+        eventManager.subscribe(event, callback, queue)
+    ticker = None
+    if options.ui:
+        ticker = InterfaceTicker(eventManager, options.width, 24)
+        ticker.start()
+
+    started = time.time()
+    sent = replay(journal, eventManager, not options.fast, options.speed)
+    # let the dispatcher deliver the last event too, not just take it off the queue
+    eventManager.waitIdle()
+    if queue is not None:
+        for callback, data in queue.drain():
+            callback(data)
+    if ticker is not None:
+        ticker.stop()
+    elapsed = max(time.time() - started, 1e-6)
+
+    report = {'journal':journal, 'sent':sent, 'seconds':round(elapsed, 3), 'perSecond':round(sent / elapsed, 1),
+              'delivered':counter.counts, 'queue':eventManager.getQueueStats(), 'profile':eventManager.getProfile()}
+    if queue is not None:
+        report['subscriberQueue'] = queue.stats()
+    if ticker is not None:
+        report['interface'] = ticker.report()
+    eventManager.close()
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == "__main__":
+    main()
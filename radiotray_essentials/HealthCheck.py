@@ -0,0 +1,240 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+"""Checks every bookmark without playing it and writes a JSON report.
+
+usage: python HealthCheck.py [-b bookmarks.xml] [-o report.json] [-w workers]
+"""
+import os
+import sys
+import json
+import time
+import threading
+import collections
+import urlparse
+import logging
+from optparse import OptionParser
+from XmlDataProvider import XmlDataProvider
+from XmlConfigProvider import XmlConfigProvider
+from StreamDecoder import StreamDecoder, StreamFailure
+from StreamRacer import StreamRacer
+from PlaylistExpander import PlaylistExpander
+from lib.DnsCache import DnsCache
+from lib.common import USER_CFG_PATH, CFG_NAME, OPTIONS_CFG_NAME, DEFAULT_RADIO_LIST, DEFAULT_CONFIG_FILE
+
+ICY_HEADERS = ('icy-br', 'icy-sr', 'icy-name', 'icy-genre', 'icy-url', 'icy-metaint', 'ice-audio-info')
+
+STATUS_OK = 'ok'
+STATUS_FAILED = 'failed'
+# mms and other non-HTTP streams are left to gstreamer
+STATUS_UNCHECKED = 'unchecked'
+
+class HostScheduler:
+    """Hands out bookmarks so that no host has more than perHost of them checked at once.
+
+    next() blocks until a bookmark of a host with a free slot is pending and
+    returns None once every bookmark has been handed out.
+    """
+
+    def __init__(self, bookmarks, perHost):
+        self.perHost = perHost
+        self.lock = threading.Condition()
+        self.pending = collections.OrderedDict()
+        self.active = {}
+        for index, (name, url) in enumerate(bookmarks):
+            host = urlparse.urlsplit(url).hostname
+            self.pending.setdefault(host, collections.deque()).append((index, name, url))
+
+    def next(self):
+        with self.lock:
+            while self.pending:
+                for host, queue in self.pending.iteritems():
+                    if self.active.get(host, 0) < self.perHost:
+                        break
+                else:
+                    # every host with work left is busy, wait for a done()
+                    self.lock.wait()
+                    continue
+
+                job = queue.popleft()
+                if not queue:
+                    del self.pending[host]
+                else:
+                    # round robin, the next bookmark comes from another host
+                    self.pending[host] = self.pending.pop(host)
+                self.active[host] = self.active.get(host, 0) + 1
+                return host, job
+            return None
+
+    def done(self, host):
+        with self.lock:
+            self.active[host] -= 1
+            self.lock.notify_all()
+
+
+class HealthCheck:
+
+    def __init__(self, decoder, workers=32, perHost=4):
+        self.log = logging.getLogger('radiotray')
+        self.decoder = decoder
+        self.racer = StreamRacer(decoder)
+        self.workers = workers
+        self.perHost = perHost
+
+        # leave room for the racer's parallel probes
+        self.decoder.http.maxPerHost = perHost * self.racer.width
+
+    def run(self, bookmarks, progress=None):
+        scheduler = HostScheduler(bookmarks, self.perHost)
+        results = [None] * len(bookmarks)
+        done = [0]
+        lock = threading.Lock()
+
+        def work():
+            while True:
+                scheduled = scheduler.next()
+                if scheduled is None:
+                    return
+
+                host, (index, name, url) = scheduled
+                try:
+                    result = self.check(name, url)
+                finally:
+                    scheduler.done(host)
+
+                with lock:
+                    results[index] = result
+                    done[0] += 1
+                    if progress is not None:
+                        progress(done[0], len(results), result)
+
+        threads = [threading.Thread(target=work) for i in range(min(self.workers, max(len(bookmarks), 1)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def check(self, name, url):
+        result = {'name':name, 'url':url, 'status':STATUS_FAILED, 'latency':None, 'contentType':None,
+                  'decoder':None, 'playlistSize':None, 'stream':None, 'icy':{}, 'error':None}
+        started = time.time()
+
+        try:
+            if not url.startswith('http'):
+                result['status'] = STATUS_UNCHECKED
+                result['stream'] = url
+                return result
+
+            urlInfo = self.decoder.probeMediaStream(url)
+
+            stream = urlInfo
+            if urlInfo.isPlaylist():
+                result['decoder'] = urlInfo.getDecoder().__class__.__name__
+                entries = self.decoder.getPlaylist(urlInfo) or []
+                result['playlistSize'] = len(entries)
+
+                playlist = PlaylistExpander()
+                playlist.add([url])
+                playlist.expand(url, entries)
+                stream = self.racer.select(playlist)
+                if stream is None:
+                    result['error'] = 'no playable stream in playlist'
+                    return result
+
+            result['status'] = STATUS_OK
+            result['stream'] = stream.getUrl()
+            result['contentType'] = stream.getContentType()
+            for header in ICY_HEADERS:
+                value = stream.getHeader(header)
+                if value is not None:
+                    result['icy'][header] = value
+        except StreamFailure, e:
+            result['error'] = e.reason
+        except Exception, e:
+            result['status'] = STATUS_FAILED
+            result['error'] = str(e)
+        finally:
+            result['latency'] = round(time.time() - started, 3)
+
+        return result
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-b', '--bookmarks', dest='bookmarks', help='bookmarks file to check')
+    parser.add_option('-c', '--config', dest='config', help='configuration file')
+    parser.add_option('-o', '--output', dest='output', help='write the report here instead of stdout')
+    parser.add_option('-w', '--workers', dest='workers', type='int', default=32, help='bookmarks checked at once')
+    parser.add_option('--per-host', dest='perHost', type='int', default=4, help='bookmarks of one host checked at once')
+    parser.add_option('-t', '--timeout', dest='timeout', type='float', help='seconds to wait for a station')
+    parser.add_option('-v', '--verbose', dest='verbose', action='store_true', default=False)
+    (options, args) = parser.parse_args()
+
+    logging.basicConfig(level=options.verbose and logging.DEBUG or logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    bookmarks = options.bookmarks or os.path.join(USER_CFG_PATH, CFG_NAME)
+    if not os.access(bookmarks, os.R_OK):
+        bookmarks = DEFAULT_RADIO_LIST
+    config = options.config or os.path.join(USER_CFG_PATH, OPTIONS_CFG_NAME)
+    if not os.access(config, os.R_OK):
+        config = DEFAULT_CONFIG_FILE
+
+    provider = XmlDataProvider(bookmarks)
+    provider.loadFromFile()
+    cfg_provider = XmlConfigProvider(config)
+    cfg_provider.loadFromFile()
+
+    dnsCache = DnsCache(int(cfg_provider.getConfigValue("dns_cache_ttl", 300)), maxEntries=4096)
+    dnsCache.install()
+
+    decoder = StreamDecoder(cfg_provider)
+    if options.timeout is not None:
+        decoder.url_timeout = options.timeout
+        decoder.http.timeout = options.timeout
+
+    stations = [(name, provider.getRadioUrl(name)) for name in provider.listRadioNames()]
+    stations = [(name, url) for (name, url) in stations if url]
+
+    def progress(done, total, result):
+        sys.stderr.write('[%d/%d] %s: %s\n' % (done, total, result['name'].encode('utf-8'), result['status']))
+
+    started = time.time()
+    results = HealthCheck(decoder, options.workers, options.perHost).run(stations, progress)
+
+    report = {'bookmarks':bookmarks, 'checked':time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'elapsed':round(time.time() - started, 3), 'total':len(results), 'stations':results}
+    for status in (STATUS_OK, STATUS_FAILED, STATUS_UNCHECKED):
+        report[status] = len([r for r in results if r['status'] == status])
+    report['dns'] = dnsCache.stats()
+
+    if options.output:
+        out_file = open(options.output, 'w')
+        json.dump(report, out_file, indent=2)
+        out_file.close()
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == "__main__":
+    main()
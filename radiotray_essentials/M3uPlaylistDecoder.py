@@ -17,43 +17,39 @@
 # along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##########################################################################
-import urllib2
-from lib.common import USER_AGENT
 import logging
 
 class M3uPlaylistDecoder:
 
-    def __init__(self):
+    contentTypes = ('audio/mpegurl', 'audio/x-mpegurl')
+    magic = ('#extm3u',)
+    # a bare list of urls, possibly after some comments
+    lineMagic = ('http://',)
+
+    def __init__(self, http):
+        self.http = http
         self.log = logging.getLogger('radiotray')
         self.log.debug('M3U playlist decoder')
 
-    def isStreamValid(self, contentType, firstBytes):
-
-        if('audio/mpegurl' in contentType or 'audio/x-mpegurl' in contentType):
-            self.log.info('Stream is readable by M3U Playlist Decoder')
-            return True
-        else:
-            lines = firstBytes.splitlines()
-            for line in lines:
-                if(line.startswith("http://")):
-                    return True
-        return False
+    def extractPlaylist(self,  url):
+        self.log.info('Downloading playlist...')
 
+        f = self.http.open(url)
+        try:
+            return self.decodePlaylist(f)
+        finally:
+            f.close()
 
 
-    def extractPlaylist(self,  url):
-        self.log.info('Downloading playlist...')
+    def decodePlaylist(self, data):
 
-        req = urllib2.Request(url)
-        req.add_header('User-Agent', USER_AGENT)
-        f = urllib2.urlopen(req)
-        str = f.read()
-        f.close()
+        if hasattr(data, 'read'):
+            data = data.read()
 
         self.log.info('Playlist downloaded')
         self.log.info('Decoding playlist...')
 
-        lines = str.splitlines()
+        lines = data.splitlines()
         playlist = []
 
         for line in lines:
@@ -22,7 +22,10 @@ import curses
 import threading
 import time
 import logging
+import gobject
 from random import randint
+from events.EventQueue import EventQueue
+from events.EventManager import EventManager
 
 class Animation:
     def __init__(self,size):
@@ -211,12 +214,18 @@ class CursesWindow:
 
 
 class BookmarkSelector(CursesWindow):
-    def __init__(self,provider,urlChangeCallback):
+    # seconds the cursor has to rest on a station before it gets prefetched
+    PREFETCH_DWELL = 0.5
+    
+    def __init__(self,provider,urlChangeCallback,prefetcher=None,warmCallback=None):
         # Create window with border
         CursesWindow.__init__(self,self.drawImpl,{'border':True})
         # Process arguments
         self.provider = provider
         self.urlChangeCallback = urlChangeCallback
+        self.prefetcher = prefetcher
+        self.warmCallback = warmCallback
+        self.cursorMoved = None
         
         # Handle bookmarkvars
         self.radioStations = []   
@@ -267,6 +276,9 @@ class BookmarkSelector(CursesWindow):
             self.depth = 0
             self.menuIndex = 0
             self.populateMenu()
+            self.cursorMoved = None
+            if self.prefetcher != None:
+                self.prefetcher.focus([])
             
     def getIndex(self):
         return self.scrolled + self.menuCursor
@@ -281,11 +293,36 @@ class BookmarkSelector(CursesWindow):
             self.selectedGroup = self.getIndex()
             self.populateMenu()
             self.resetCursor()
+            self.cursorChanged()
         elif self.depth == 1:
             self.selectedStation = self.getIndex()
+            likelyNext = self.getNeighbourUrls()[1:]
             self.resetCursor()
             thisStation = self.radioStations[self.selectedGroup]['stationList'][self.selectedStation]
             self.urlChangeCallback(thisStation['url'],True,thisStation['name'])
+            if self.warmCallback != None:
+                self.warmCallback(likelyNext)
+            
+    def cursorChanged(self):
+        if self.depth == 1 and self.prefetcher != None:
+            self.cursorMoved = time.time()
+            self.prefetcher.focus(self.getNeighbourUrls())
+            
+    def getNeighbourUrls(self):
+        # the highlighted station first, then the ones right below and above it
+        stations = self.radioStations[self.selectedGroup]['stationList']
+        index = self.getIndex()
+        urls = []
+        for i in [index, index + 1, index - 1]:
+            if i >= 0 and i < len(stations):
+                urls.append(stations[i]['url'])
+        return urls
+        
+    def checkDwell(self):
+        if self.cursorMoved != None and time.time() - self.cursorMoved >= self.PREFETCH_DWELL:
+            self.cursorMoved = None
+            if self.depth == 1:
+                self.prefetcher.prefetch(self.getNeighbourUrls())
             
     def getMaxScroll(self):
         return len(self.currentMenu) - self.menuLines
@@ -297,6 +334,7 @@ class BookmarkSelector(CursesWindow):
             self.scrolled -= 1
             if self.scrolled < 0:
                 self.scrolled = 0
+        self.cursorChanged()
     
     def menuDown(self):
         maxScroll = self.getMaxScroll()
@@ -306,6 +344,7 @@ class BookmarkSelector(CursesWindow):
             self.scrolled += 1
             if self.scrolled >= maxScroll:
                 self.scrolled = maxScroll
+        self.cursorChanged()
 
                 
 class TitleBar(CursesWindow):
@@ -454,10 +493,11 @@ class AnimationWindow(CursesWindow):
 
     
 class KeyInfoBar(CursesWindow):
-    def __init__(self,mode):
+    def __init__(self,mode,timeshift=False):
         CursesWindow.__init__(self,self.drawImpl,{'border':False})
         self.firstCharColor = 4
         self.mode = mode
+        self.timeshift = timeshift
     
     def drawImpl(self):
         viewTextFirstChar = {'text':"m",'color':self.firstCharColor}
@@ -465,12 +505,14 @@ class KeyInfoBar(CursesWindow):
         if self.mode == CursesThread.MODE_MAIN:
             viewTextFirstChar = {'text':"b",'color':self.firstCharColor}
             viewText = {'text':"ookmarks view | "}        
-        CursesWindow.printString(self,{'y':0,'x':0,'strings':[{'text':"p",'color':self.firstCharColor}, \
-                                                              {'text':"lay/pause | "}, \
-                                                              viewTextFirstChar, \
-                                                              viewText, \
-                                                              {'text':"q",'color':self.firstCharColor}, \
-                                                              {'text':"uit"}],'centered':True})        
+        strings = [{'text':"p",'color':self.firstCharColor},{'text':"lay/pause | "}]
+        if self.timeshift and self.mode == CursesThread.MODE_MAIN:
+            strings += [{'text':"r",'color':self.firstCharColor},{'text':"ewind | "}, \
+                        {'text':"l",'color':self.firstCharColor},{'text':"ive | "}]
+        if self.mode == CursesThread.MODE_MAIN:
+            strings += [{'text':"c",'color':self.firstCharColor},{'text':"apture | "}]
+        strings += [viewTextFirstChar,viewText,{'text':"q",'color':self.firstCharColor},{'text':"uit"}]
+        CursesWindow.printString(self,{'y':0,'x':0,'strings':strings,'centered':True})        
     
     def setMode(self,newMode):
         self.mode = newMode
@@ -498,6 +540,8 @@ class BufferWindow(CursesWindow):
 class CursesThread(threading.Thread):
     MODE_MAIN = 0
     MODE_BOOKMARKS = 1
+    # how far one press of r goes back when time-shifting
+    REWIND_SECONDS = 30
         
     def __init__(self,audioplayer,provider,mainloop):
         threading.Thread.__init__(self)        
@@ -505,7 +549,7 @@ class CursesThread(threading.Thread):
         self.provider = provider
         self.mainloop = mainloop
         self.logger = logging.getLogger('curses')
-        self.bookmarkSelector = BookmarkSelector(self.provider,self.urlChange)
+        self.bookmarkSelector = BookmarkSelector(self.provider,self.urlChange,self.player.prefetcher,self.player.warm)
         
         self.mode = self.MODE_MAIN        
                 
@@ -521,6 +565,8 @@ class CursesThread(threading.Thread):
         
         self.playerState={'artist':"",'title':"",'streamState':"",'buffer':0}
         self.currentStation={'url':"http://icecast.omroep.nl/radio1-bb-mp3",'bookmarked':False,'name':"Radio1 NL"}
+        # player events for this thread, delivered at the start of every tick
+        self.events = EventQueue()
         
     def run(self):
         #Initialize Curses
@@ -546,17 +592,7 @@ class CursesThread(threading.Thread):
         c = ""
         ticks = 0
         while c != ord("q"):
-            #refresh windows on certain intervals            
-            if ticks % 5 == 0:
-                if self.mode == self.MODE_MAIN:
-                    self.mainWindow.draw()
-                else:
-                    self.bookmarkSelector.draw()
-                self.animationWindow.draw()
-                self.bufferWindow.draw()
-                            
-            if ticks % 30 == 0:
-                self.titleBar.draw()
+            self.tick(ticks)
             
             c = self.screen.getch(7,0)
             ticks += 1
@@ -572,6 +608,31 @@ class CursesThread(threading.Thread):
         
         self.endCurses()        
     
+    def bindEvents(self,eventSubscriber):
+        # curses is only touched from this thread, it drains self.events every tick
+        eventSubscriber.bind(EventManager.SONG_CHANGED, self.updateSong, self.events)
+        eventSubscriber.bind(EventManager.STATE_CHANGED, self.updateState, self.events)
+        eventSubscriber.bind(EventManager.BUFFER_CHANGED, self.updateBuffer, self.events)
+    
+    # player events and redraws of one tick, EventReplay runs these against a stub screen
+    def tick(self,ticks):
+        for callback, data in self.events.drain():
+            callback(data)
+        #refresh windows on certain intervals            
+        if ticks % 5 == 0:
+            if self.mode == self.MODE_MAIN:
+                self.mainWindow.draw()
+            else:
+                self.bookmarkSelector.draw()
+            self.animationWindow.draw()
+            self.bufferWindow.draw()
+                        
+        if ticks % 30 == 0:
+            self.titleBar.draw()
+        
+        if self.mode == self.MODE_BOOKMARKS:
+            self.bookmarkSelector.checkDwell()
+    
     def endCurses(self):      
         self.screen.keypad(0)
         curses.endwin()
@@ -621,18 +682,32 @@ class CursesThread(threading.Thread):
             self.currentStation['name'] = newStationName
         else:
             self.currentStation['name'] = None
-        self.player.stop()
-        self.player.start(self.currentStation['url'])
+        # no stop() here, start() keeps the station we leave on standby
+        self.post(self.player.start, self.currentStation['url'])
         self.titleBar.setStation(self.currentStation)
         
+    def post(self, func, *args):
+        # the player belongs to the main loop, never change it from this thread
+        def run():
+            func(*args)
+            # run once
+            return False
+        gobject.idle_add(run)
+
     def handleKeyPress(self,c):
         if self.mode == self.MODE_MAIN:
                 if c == ord("p"):
                     if self.playerState['streamState'] != "playing":
-                        self.player.start(self.currentStation['url'])
+                        self.post(self.player.start, self.currentStation['url'])
                     else:
-                        self.player.stop()
+                        self.post(self.player.stop)
                     self.mainWindow.draw()                    
+                if c == ord("c"):
+                    self.post(self.player.toggleRecording, self.currentStation['name'])
+                if c == ord("r"):
+                    self.post(self.player.rewind, self.REWIND_SECONDS)
+                if c == ord("l"):
+                    self.post(self.player.goLive)
                 if c == ord("b"):
                     self.mode = self.MODE_BOOKMARKS
                     self.bookmarkSelector.draw()
@@ -667,7 +742,7 @@ class CursesThread(threading.Thread):
         self.bookmarkSelector.setWindow(curses.newwin(5,self.screenSize['width']-10,1,0))
         self.animationWindow = AnimationWindow()
         self.animationWindow.setWindow(curses.newwin(5,9,1,self.screenSize['width']-10))
-        self.labelBar = KeyInfoBar(self.mode)
+        self.labelBar = KeyInfoBar(self.mode,self.player.timeshift != None)
         self.labelBar.setWindow(curses.newwin(1,self.screenSize['width']-10,6,0))
         self.bufferWindow = BufferWindow(self.playerState)
         self.bufferWindow.setWindow(curses.newwin(1,9,6,self.screenSize['width']-10))
@@ -677,6 +752,9 @@ class CursesThread(threading.Thread):
         sys.stdout.write("\x1b]2;%s\x07" % termTitle)
                             
     def updateSong(self, data):
+        if('changed' in data and 'artist' not in data['changed'] and 'title' not in data['changed']):
+            # only the album or station name changed, nothing shown here
+            return
         if('artist' in data.keys()):
             self.playerState['artist'] = data['artist']
         else:
@@ -0,0 +1,136 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import urlparse
+import logging
+
+DEFAULT_PORTS = {'http':80, 'https':443, 'mms':1755, 'rtsp':554}
+
+def normalizeUrl(url):
+    """Reduces equivalent spellings of a URL to one key."""
+    url = url.strip()
+    try:
+        parts = urlparse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        host = (parts.hostname or '').lower()
+        port = parts.port
+    except ValueError:
+        return url
+
+    if port is not None and DEFAULT_PORTS.get(scheme) != port:
+        host = '%s:%d' % (host, port)
+    return urlparse.urlunsplit((scheme, host, parts.path or '/', parts.query, ''))
+
+
+class Candidate:
+
+    PENDING = 'pending'
+    PLAYED = 'played'
+    EXPANDED = 'expanded'
+    DROPPED = 'dropped'
+
+    def __init__(self, url, depth):
+        self.url = url
+        self.depth = depth
+        self.status = self.PENDING
+        self.reason = None
+
+    def __repr__(self):
+        return '%s (depth %d): %s, %s' % (self.url, self.depth, self.status, self.reason)
+
+
+class PlaylistExpander:
+    """Flat, ordered list of streams to try for one station.
+
+    Nested playlists are expanded in place instead of recursing, so a
+    playlist that includes itself or a long chain of playlists cannot
+    blow up the stack. Entries deeper than maxDepth, URLs seen before and
+    anything past maxCandidates are dropped. Every decision is kept in
+    history with the reason for it.
+    """
+
+    def __init__(self, maxDepth=4, maxCandidates=50):
+        self.log = logging.getLogger('radiotray')
+        self.maxDepth = maxDepth
+        self.maxCandidates = maxCandidates
+        self.pending = []
+        self.visited = set()
+        self.history = []
+        self.accepted = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def urls(self):
+        return [candidate.url for candidate in self.pending]
+
+    def add(self, urls, depth=0, position=None):
+        if position is None:
+            position = len(self.pending)
+
+        for url in urls:
+            if url is None or len(url.strip()) == 0:
+                continue
+
+            candidate = Candidate(url.strip(), depth)
+            self.history.append(candidate)
+            key = normalizeUrl(candidate.url)
+
+            if key in self.visited:
+                self._decide(candidate, Candidate.DROPPED, 'already seen')
+            elif depth > self.maxDepth:
+                self._decide(candidate, Candidate.DROPPED, 'playlists nested too deep')
+            elif self.accepted >= self.maxCandidates:
+                self._decide(candidate, Candidate.DROPPED, 'too many candidates')
+            else:
+                self.visited.add(key)
+                self.accepted += 1
+                candidate.reason = 'queued'
+                self.pending.insert(position, candidate)
+                position += 1
+
+    def expand(self, url, urls):
+        """Replaces the playlist at url by its entries."""
+        index, candidate = self._remove(url)
+        if candidate is None:
+            return
+        self._decide(candidate, Candidate.EXPANDED, 'playlist with %d entries' % len(urls))
+        self.add(urls, candidate.depth + 1, index)
+
+    def take(self, url, reason):
+        index, candidate = self._remove(url)
+        if candidate is not None:
+            self._decide(candidate, Candidate.PLAYED, reason)
+
+    def drop(self, url, reason):
+        index, candidate = self._remove(url)
+        if candidate is not None:
+            self._decide(candidate, Candidate.DROPPED, reason)
+
+    def _remove(self, url):
+        for index, candidate in enumerate(self.pending):
+            if candidate.url == url:
+                del self.pending[index]
+                return index, candidate
+        return None, None
+
+    def _decide(self, candidate, status, reason):
+        candidate.status = status
+        candidate.reason = reason
+        self.log.debug('Candidate %s', candidate)
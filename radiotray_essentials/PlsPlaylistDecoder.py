@@ -17,42 +17,40 @@
 # along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##########################################################################
-import urllib2
-from lib.common import USER_AGENT
 import logging
 
 class PlsPlaylistDecoder:
 
-    def __init__(self):
+    contentTypes = ('audio/x-scpls', 'application/pls+xml')
+    magic = ('[playlist]',)
+
+    def __init__(self, http):
+        self.http = http
         self.log = logging.getLogger('radiotray')
         self.log.debug('PLS playlist decoder')
         
 
-    def isStreamValid(self, contentType, firstBytes):
-
-        if(('audio/x-scpls' in contentType) or ('application/pls+xml' in contentType) or (firstBytes.strip().lower().startswith('[playlist]'))):
-            self.log.info('Stream is readable by PLS Playlist Decoder')
-            return True
-        else:
-            return False
-
-
-
     def extractPlaylist(self,  url):
             
             self.log.info('Downloading playlist...')
             
-            req = urllib2.Request(url)
-            req.add_header('User-Agent', USER_AGENT)
-            f = urllib2.urlopen(req)
-            str = f.read()
-            f.close()
+            f = self.http.open(url)
+            try:
+                return self.decodePlaylist(f)
+            finally:
+                f.close()
+
+
+    def decodePlaylist(self, data):
+
+            if hasattr(data, 'read'):
+                data = data.read()
             
             self.log.info('Playlist downloaded')
             self.log.info('Decoding playlist...')
             
-	    playlist = []
-            lines = str.splitlines()
+            playlist = []
+            lines = data.splitlines()
             for line in lines:
 
                 if line.startswith("File") == True:
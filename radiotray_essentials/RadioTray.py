@@ -27,9 +27,11 @@ import os
 from shutil import move, copy2
 from lib.common import APPDIRNAME, USER_CFG_PATH, CFG_NAME, OLD_USER_CFG_PATH,\
     DEFAULT_RADIO_LIST, OPTIONS_CFG_NAME, DEFAULT_CONFIG_FILE,\
-   LOGFILE
+   LOGFILE, EVENT_JOURNAL_FILE
+from lib.DnsCache import DnsCache
 import logging
 from logging import handlers
+import urlparse
 import gobject
 
 # My own imports
@@ -38,6 +40,9 @@ from MyCursesInterface import CursesThread
 class RadioTray(object):
 
     def __init__(self):
+        # station resolution and the curses interface run on their own threads
+        gobject.threads_init()
+
         # load configuration
         self.loadConfiguration()
         self.logger.info('**********************')
@@ -55,25 +60,43 @@ class RadioTray(object):
         self.default_cfg_provider = XmlConfigProvider(self.default_cfg_filename)
         self.default_cfg_provider.loadFromFile()
 
+        # cache host name lookups of the stream resolver
+        self.dnsCache = DnsCache(int(self.cfg_provider.getConfigValue("dns_cache_ttl", 300)))
+        self.dnsCache.install()
+        if(self.cfg_provider.getConfigValue("dns_prewarm", "true") == "true"):
+            self.dnsCache.prewarm(self.getBookmarkHosts())
+
         # load Event Manager
         eventManager = EventManager()
+        if(self.cfg_provider.getConfigValue("event_profiling", "false") == "true"):
+            eventManager.enableProfiling(float(self.cfg_provider.getConfigValue("event_budget_ms", 50)) / 1000)
+        if(self.cfg_provider.getConfigValue("event_journal", "false") == "true"):
+            eventManager.startJournal(self.cfg_provider.getConfigValue("event_journal_file", EVENT_JOURNAL_FILE))
 
         # load audio player
-        self.audio = AudioPlayerGStreamer(self.cfg_provider, eventManager)
+        self.audio = AudioPlayerGStreamer(self.cfg_provider, eventManager, self.dnsCache)
 
         # Start main loop and interface (curses) thread.
         loop = gobject.MainLoop()
         t = CursesThread(self.audio,self.provider,loop)
-        eventSubscriber = EventSubscriber(eventManager)
-        eventSubscriber.bind(EventManager.SONG_CHANGED, t.updateSong)
-        eventSubscriber.bind(EventManager.STATE_CHANGED, t.updateState)
-        eventSubscriber.bind(EventManager.BUFFER_CHANGED, t.updateBuffer)
+        t.bindEvents(EventSubscriber(eventManager))
         t.start()
                 
-        gobject.threads_init()
         loop.run()
+        self.audio.close()
+        eventManager.close()
         
 
+    def getBookmarkHosts(self):
+        hosts = set()
+        for name in self.provider.listRadioNames():
+            url = self.provider.getRadioUrl(name)
+            if url and url.startswith("http"):
+                host = urlparse.urlsplit(url).hostname
+                if host:
+                    hosts.add(host)
+        return list(hosts)
+
     def loadConfiguration(self):
         if not os.path.exists(USER_CFG_PATH):
             self.logger.info("user's directory created")
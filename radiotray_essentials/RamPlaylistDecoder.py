@@ -17,39 +17,36 @@
 # along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##########################################################################
-import urllib2
-from lib.common import USER_AGENT
 import logging
 
 class RamPlaylistDecoder:
 
-    def __init__(self):
+    contentTypes = ('audio/x-pn-realaudio', 'audio/vnd.rn-realaudio')
+
+    def __init__(self, http):
+        self.http = http
         self.log = logging.getLogger('radiotray')
         self.log.debug('RAM playlist decoder')
 
-    def isStreamValid(self, contentType, firstBytes):
-
-        if('audio/x-pn-realaudio' in contentType or 'audio/vnd.rn-realaudio' in contentType):
-            self.log.info('Stream is readable by RAM Playlist Decoder')
-            return True
-        else:
-            return False
+    def extractPlaylist(self,  url):
+        self.log.info('Downloading playlist...')
 
+        f = self.http.open(url)
+        try:
+            return self.decodePlaylist(f)
+        finally:
+            f.close()
 
 
-    def extractPlaylist(self,  url):
-        self.log.info('Downloading playlist...')
+    def decodePlaylist(self, data):
 
-        req = urllib2.Request(url)
-        req.add_header('User-Agent', USER_AGENT)
-        f = urllib2.urlopen(req)
-        str = f.read()
-        f.close()
+        if hasattr(data, 'read'):
+            data = data.read()
 
         self.log.info('Playlist downloaded')
         self.log.info('Decoding playlist...')
 
-        lines = str.splitlines()
+        lines = data.splitlines()
         playlist = []
 
         for line in lines:
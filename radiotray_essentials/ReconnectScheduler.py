@@ -0,0 +1,121 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import time
+import random
+import logging
+import gobject
+
+class ReconnectScheduler:
+    """Brings a stalled stream back, driven by timeouts on the GLib main loop.
+
+    Attempts are spaced by an exponential backoff starting at initialDelay
+    and capped at maxDelay, each delay randomly stretched or shrunk by up
+    to jitter. reconnect returns False when the stream was still making
+    progress, which does not use up an attempt. Once maxAttempts attempts
+    did not help, fallback is called. All methods must be called from the
+    main loop.
+    """
+
+    IDLE = 'idle'
+    WAITING = 'waiting'
+
+    def __init__(self, reconnect, fallback, initialDelay=1.0, maxDelay=20.0, maxAttempts=5, jitter=0.3):
+        self.log = logging.getLogger('radiotray')
+        self.reconnect = reconnect
+        self.fallback = fallback
+        self.initialDelay = initialDelay
+        self.maxDelay = maxDelay
+        self.maxAttempts = maxAttempts
+        self.jitter = jitter
+
+        self.state = self.IDLE
+        self.source = None
+        self.attempt = 0
+        self.stalledAt = None
+
+        # counters over the whole run
+        self.stalls = 0
+        self.attempts = 0
+        self.recoveries = 0
+        self.giveUps = 0
+        self.recoveryTime = 0.0
+        self.lastRecoveryTime = None
+
+    def isActive(self):
+        return self.state != self.IDLE
+
+    def stalled(self):
+        if self.isActive():
+            return
+        self.stalls += 1
+        self.stalledAt = time.time()
+        self.attempt = 0
+        self._schedule()
+
+    def recovered(self):
+        if not self.isActive():
+            return
+        self._cancelTimeout()
+        self.state = self.IDLE
+        self.recoveries += 1
+        self.lastRecoveryTime = time.time() - self.stalledAt
+        self.recoveryTime += self.lastRecoveryTime
+        self.log.info('Stream recovered after %.1f s and %d attempts', self.lastRecoveryTime, self.attempt)
+
+    def cancel(self):
+        self._cancelTimeout()
+        self.state = self.IDLE
+
+    def stats(self):
+        averageRecovery = None
+        if self.recoveries > 0:
+            averageRecovery = self.recoveryTime / self.recoveries
+        return {'stalls':self.stalls, 'attempts':self.attempts, 'recoveries':self.recoveries,
+                'giveUps':self.giveUps, 'lastRecoveryTime':self.lastRecoveryTime,
+                'averageRecoveryTime':averageRecovery}
+
+    def _schedule(self):
+        delay = min(self.initialDelay * (2 ** self.attempt), self.maxDelay)
+        delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        self.log.debug('Next reconnect attempt in %.2f s', delay)
+        self.state = self.WAITING
+        self.source = gobject.timeout_add(int(delay * 1000), self._fire)
+
+    def _fire(self):
+        self.source = None
+        if self.attempt >= self.maxAttempts:
+            self.log.info('Giving up reconnecting after %d attempts', self.attempt)
+            self.state = self.IDLE
+            self.giveUps += 1
+            self.fallback()
+            return False
+
+        if self.reconnect():
+            self.attempt += 1
+            self.attempts += 1
+        # check again later unless recovered() comes first
+        self._schedule()
+        # run once
+        return False
+
+    def _cancelTimeout(self):
+        if self.source is not None:
+            gobject.source_remove(self.source)
+            self.source = None
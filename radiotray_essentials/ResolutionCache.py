@@ -0,0 +1,175 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import os
+import json
+import time
+import threading
+import logging
+
+class ResolutionCache:
+    """Maps a station URL to the streams it resolved to the last time it played.
+
+    Entries live in a JSON file in the user directory. Fresh entries are
+    played without any HTTP request; stale ones keep their ETag and
+    Last-Modified headers so they can be revalidated with a conditional GET.
+    The file is written on a writer thread, changes made while it writes
+    are folded into the next write.
+    """
+
+    def __init__(self, filename, ttl=86400, maxEntries=500):
+        self.log = logging.getLogger('radiotray')
+        self.filename = filename
+        self.ttl = ttl
+        self.maxEntries = maxEntries
+        self.lock = threading.Lock()
+        self.entries = {}
+        # wakes the writer thread, which is started with the first change
+        self.writeLock = threading.Condition()
+        self.dirty = False
+        self.closed = False
+        self.writer = None
+        self.loadFromFile()
+
+    def loadFromFile(self):
+        if not os.access(self.filename, os.R_OK):
+            return
+
+        try:
+            in_file = open(self.filename, "r")
+            try:
+                entries = json.load(in_file)
+            finally:
+                in_file.close()
+        except Exception, e:
+            self.log.warn('Could not read resolution cache %s: %s', self.filename, str(e))
+            return
+
+        if isinstance(entries, dict):
+            self.entries = entries
+        self.log.debug('Resolution cache loaded with %d entries', len(self.entries))
+
+    def saveToFile(self):
+        """Has the writer thread save the entries, the caller never waits for the disk."""
+        with self.writeLock:
+            self.dirty = True
+            if self.writer is None and not self.closed:
+                self.writer = threading.Thread(target=self._writeLoop, name='resolution-cache')
+                self.writer.daemon = True
+                self.writer.start()
+            self.writeLock.notify()
+
+    def close(self):
+        """Writes what is left and stops the writer thread."""
+        with self.writeLock:
+            self.closed = True
+            self.writeLock.notify()
+            writer = self.writer
+        if writer is not None:
+            writer.join()
+
+    def _writeLoop(self):
+        while True:
+            with self.writeLock:
+                while not self.dirty and not self.closed:
+                    self.writeLock.wait()
+                if not self.dirty:
+                    return
+                self.dirty = False
+            self._write()
+
+    def _write(self):
+        with self.lock:
+            # entries change in place, dump a copy
+            entries = dict([(url, dict(entry)) for url, entry in self.entries.iteritems()])
+        tmpname = self.filename + '.tmp'
+        try:
+            out_file = open(tmpname, "w")
+            try:
+                json.dump(entries, out_file)
+            finally:
+                out_file.close()
+            os.rename(tmpname, self.filename)
+        except Exception, e:
+            self.log.warn('Could not write resolution cache %s: %s', self.filename, str(e))
+
+    def lookup(self, url):
+        """Returns the cache entry for url, fresh or not, or None."""
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is not None:
+                entry['used'] = time.time()
+            return entry
+
+    def isFresh(self, entry):
+        return entry is not None and entry['expires'] > time.time()
+
+    def getValidators(self, entry):
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('lastModified'):
+                headers['If-Modified-Since'] = entry['lastModified']
+        return headers
+
+    def store(self, url, streams, contentType, decoderName, etag=None, lastModified=None):
+        if len(streams) == 0:
+            return
+
+        now = time.time()
+        with self.lock:
+            self.entries[url] = {'streams':streams, 'contentType':contentType, 'decoder':decoderName,
+                                 'etag':etag, 'lastModified':lastModified,
+                                 'expires':now + self.ttl, 'used':now}
+            self._evict()
+            self.saveToFile()
+        self.log.debug('Cached resolution of %s: %s', url, streams)
+
+    def refresh(self, url):
+        """Extends the lifetime of an entry that was revalidated by the server."""
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is not None:
+                entry['expires'] = time.time() + self.ttl
+                self.saveToFile()
+
+    def promote(self, url, stream):
+        """Moves stream to the front of the cached streams of url, it is the one that played."""
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is not None and stream in entry['streams'] and entry['streams'][0] != stream:
+                entry['streams'].remove(stream)
+                entry['streams'].insert(0, stream)
+                self.saveToFile()
+
+    def invalidate(self, url):
+        with self.lock:
+            if self.entries.pop(url, None) is not None:
+                self.log.info('Dropped cached resolution of %s', url)
+                self.saveToFile()
+
+    def _evict(self):
+        excess = len(self.entries) - self.maxEntries
+        if excess <= 0:
+            return
+
+        byAge = sorted(self.entries.iteritems(), key=lambda item: item[1]['used'])
+        for url, entry in byAge[:excess]:
+            del self.entries[url]
@@ -0,0 +1,90 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import threading
+import Queue
+import logging
+import gobject
+from lib.Cancellation import Cancellation
+
+class ResolutionJob(Cancellation):
+    """A queued resolution; cancelling it also aborts the HTTP requests made for it."""
+
+    def __init__(self, func, args, callback):
+        Cancellation.__init__(self)
+        self.func = func
+        self.args = args
+        self.callback = callback
+
+    def redirect(self, callback):
+        """Hands the result to callback instead, if it is not delivered yet."""
+        self.callback = callback
+
+
+class ResolverQueue:
+    """Runs blocking station resolution on worker threads.
+
+    The job function gets the job as its first argument so it can give up
+    early once cancelled, and pass it on as the cancellation of its HTTP
+    requests so a cancelled job frees its worker right away. Its result is handed to the callback on the GLib
+    main loop, unless the job was cancelled in the meantime.
+    """
+
+    def __init__(self, workers=2):
+        self.log = logging.getLogger('radiotray')
+        self.jobs = Queue.Queue()
+
+        for i in range(workers):
+            worker = threading.Thread(target=self._work, name='resolver-%d' % i)
+            worker.daemon = True
+            worker.start()
+
+    def submit(self, func, args, callback):
+        job = ResolutionJob(func, args, callback)
+        self.jobs.put(job)
+        return job
+
+    def post(self, result, callback):
+        """Hands an already known result to callback on the main loop, as a cancellable job."""
+        job = ResolutionJob(None, (), callback)
+        gobject.idle_add(self._deliver, job, result)
+        return job
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job.isCancelled():
+                continue
+
+            try:
+                result = job.func(job, *job.args)
+            except Exception, e:
+                self.log.exception('Resolution job failed: %s', str(e))
+                result = None
+
+            if not job.isCancelled():
+                gobject.idle_add(self._deliver, job, result)
+
+    def _deliver(self, job, result):
+        if job.isCancelled():
+            self.log.debug('Dropping result of cancelled resolution')
+        else:
+            job.callback(result)
+        # run once
+        return False
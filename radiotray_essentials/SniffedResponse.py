@@ -0,0 +1,61 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+
+# Playlists bigger than this are not playlists.
+MAX_PLAYLIST_SIZE = 1024 * 1024
+
+class SniffedResponse(object):
+    """An open HTTP response whose first bytes were already read for sniffing.
+
+    Reading from it returns the sniffed prefix first and then the rest of
+    the response, so the playlist can be decoded without downloading it again.
+    """
+
+    def __init__(self, response, prefix):
+        self.response = response
+        self.prefix = prefix
+        self.closed = False
+
+    def info(self):
+        return self.response.info()
+
+    def geturl(self):
+        return self.response.geturl()
+
+    def read(self, size=-1):
+        if self.closed:
+            return ''
+
+        if size is None or size < 0:
+            data = self.prefix + self.response.read(MAX_PLAYLIST_SIZE)
+            self.prefix = ''
+            return data
+
+        data = self.prefix[:size]
+        self.prefix = self.prefix[size:]
+        if len(data) < size:
+            data += self.response.read(size - len(data))
+        return data
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.prefix = ''
+            self.response.close()
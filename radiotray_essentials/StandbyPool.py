@@ -0,0 +1,131 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import time
+import threading
+import logging
+from collections import OrderedDict
+
+class StandbyPipeline:
+
+    def __init__(self, station, pipeline, stream, playlist, pendingCache=None, cachedPlayback=False):
+        self.station = station
+        self.pipeline = pipeline
+        self.stream = stream
+        self.playlist = playlist
+        self.pendingCache = pendingCache
+        self.cachedPlayback = cachedPlayback
+        self.created = time.time()
+        # last buffering level it posted, None until it posts one
+        self.bufferPercent = None
+        # tags it posted while on standby, published once it is switched to
+        self.tags = {}
+        # source position and time of the last throughput sample
+        self.sampledPosition = 0
+        self.sampledAt = self.created
+
+
+class StandbyPool:
+    """Stations kept prerolled in PAUSED so switching to them is instant.
+
+    Every standby pipeline holds a connection to its station and up to
+    buffer-size bytes of audio, so at most maxStandby of them are kept,
+    each for at most ttl seconds. Pipelines pushed out of the pool are
+    handed to discard.
+
+    Each standby pipeline also keeps its own audio sink open. That needs
+    an audio device that can be opened more than once (PulseAudio, ALSA
+    with dmix); on a plain hw: device the second open fails and the pool
+    has to be disabled.
+    """
+
+    def __init__(self, discard, maxStandby=2, ttl=120):
+        self.log = logging.getLogger('radiotray')
+        self.discard = discard
+        self.maxStandby = maxStandby
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # station -> StandbyPipeline, least recently used first
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, station):
+        return station in self.entries
+
+    def put(self, entry):
+        with self.lock:
+            evicted = []
+            old = self.entries.pop(entry.station, None)
+            if old is not None:
+                evicted.append(old)
+            self.entries[entry.station] = entry
+            while len(self.entries) > self.maxStandby:
+                evicted.append(self.entries.popitem(last=False)[1])
+        self._discard(evicted)
+
+    def values(self):
+        with self.lock:
+            return self.entries.values()
+
+    def take(self, station):
+        """Returns and forgets the standby pipeline of station, if there is a fresh one."""
+        self.expire()
+        with self.lock:
+            return self.entries.pop(station, None)
+
+    def findByBus(self, bus):
+        with self.lock:
+            for entry in self.entries.values():
+                if entry.pipeline.get_bus() is bus:
+                    return entry
+        return None
+
+    def remove(self, station):
+        with self.lock:
+            entry = self.entries.pop(station, None)
+        if entry is not None:
+            self._discard([entry])
+
+    def expire(self):
+        limit = time.time() - self.ttl
+        with self.lock:
+            evicted = [entry for entry in self.entries.values() if entry.created < limit]
+            for entry in evicted:
+                del self.entries[entry.station]
+        self._discard(evicted)
+        # keep running as a gobject timeout
+        return True
+
+    def disable(self):
+        """Drops every standby pipeline and keeps none from now on."""
+        self.maxStandby = 0
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            evicted = self.entries.values()
+            self.entries.clear()
+        self._discard(evicted)
+
+    def _discard(self, entries):
+        for entry in entries:
+            self.log.debug('Dropping standby pipeline of %s', entry.station)
+            self.discard(entry.pipeline)
@@ -0,0 +1,447 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+"""Follows now-playing metadata, uptime and data rate of many stations at once.
+
+usage: python StationMonitor.py [-b bookmarks.xml] [-o report.json] [-i seconds]
+
+Every station gets a pipeline that never decodes:
+
+    souphttpsrc iradio-mode=true ! icydemux ! fakesink sync=false
+
+or, for streams without icecast metadata, souphttpsrc ! fakesink. The
+audio is thrown away as soon as it arrives, so nothing is buffered beyond
+what libsoup holds for the socket. Every stream costs one streaming
+thread.
+
+Two limits keep a large bookmark list from swamping the machine:
+
+  STREAMS_PER_CORE    default for --max-streams, times the online cores.
+  MEMORY_PER_STREAM   memory budget. A station is only connected while the
+                      memory grown since start stays below the budget of
+                      the streams already connected; otherwise it waits
+                      in the 'deferred' state and tries again later.
+
+benchmarks/MonitorScaling.py prints the 'streams/core' and 'KB/stream'
+columns to set them from; --streams-per-core and --memory-per-stream
+override the defaults.
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import logging
+from optparse import OptionParser
+import pygst
+pygst.require("0.10")
+import gst
+import gobject
+from XmlDataProvider import XmlDataProvider
+from XmlConfigProvider import XmlConfigProvider
+from StreamDecoder import StreamDecoder
+from StreamRacer import StreamRacer
+from ResolverQueue import ResolverQueue
+from PlaylistExpander import PlaylistExpander
+from lib.DnsCache import DnsCache
+from lib.common import USER_AGENT, USER_CFG_PATH, CFG_NAME, OPTIONS_CFG_NAME, DEFAULT_RADIO_LIST, DEFAULT_CONFIG_FILE
+
+# resident memory one monitored stream may use, in bytes
+MEMORY_PER_STREAM = 512 * 1024
+# streams followed per online core unless --max-streams is given
+STREAMS_PER_CORE = 200
+
+STATE_RESOLVING = 'resolving'
+STATE_CONNECTING = 'connecting'
+STATE_PLAYING = 'playing'
+STATE_STALLED = 'stalled'
+STATE_WAITING = 'waiting'
+STATE_DEFERRED = 'deferred'
+STATE_FAILED = 'failed'
+
+
+class MonitoredStation:
+
+    def __init__(self, index, name, url):
+        self.index = index
+        self.name = name
+        self.url = url
+        self.stream = None
+        self.state = STATE_WAITING
+        # False once the stream turned out to carry no icecast metadata
+        self.icy = True
+
+        self.pipeline = None
+        self.source = None
+        self.timeout = None
+
+        self.title = None
+        self.titleChanged = None
+        self.titles = 0
+        self.error = None
+
+        self.added = time.time()
+        self.connectedSince = None
+        self.connectedTime = 0.0
+        self.connects = 0
+        self.failures = 0
+        # failures since data last came in, drives the backoff
+        self.retries = 0
+        self.stalls = 0
+        self.bytes = 0
+        # source position at the last sample of the current connection
+        self.position = 0
+        self.rate = None
+        self.lastData = None
+
+    def uptime(self):
+        connected = self.connectedTime
+        if self.connectedSince is not None:
+            connected += time.time() - self.connectedSince
+        return connected / max(time.time() - self.added, 1.0)
+
+    def report(self):
+        return {'name':self.name, 'url':self.url, 'stream':self.stream, 'state':self.state,
+                'metadata':self.icy, 'title':self.title, 'titleChanged':self.titleChanged, 'titles':self.titles,
+                'uptime':round(self.uptime(), 4), 'connects':self.connects, 'failures':self.failures,
+                'stalls':self.stalls, 'bytes':self.bytes, 'kbps':self.rate and round(self.rate * 8 / 1000.0, 1),
+                'lastData':self.lastData, 'error':self.error}
+
+
+class StationMonitor:
+    """Keeps lightweight pipelines connected to many stations.
+
+    Stations are resolved on a shared resolver with a shared HTTP pool and
+    connected stagger seconds apart, so a restart does not hit every server
+    at once. Every interval seconds the byte position of each source is
+    sampled; a station that received nothing for stallTimeout seconds is
+    reconnected with exponential backoff.
+    """
+
+    def __init__(self, decoder, workers=4, stagger=0.2, interval=5, stallTimeout=15, maxStreams=None,
+                 streamsPerCore=STREAMS_PER_CORE, memoryPerStream=MEMORY_PER_STREAM):
+        self.log = logging.getLogger('radiotray')
+        self.decoder = decoder
+        self.racer = StreamRacer(decoder)
+        self.resolver = ResolverQueue(workers)
+        self.stagger = stagger
+        self.interval = interval
+        self.stallTimeout = stallTimeout
+        self.maxStreams = maxStreams or streamsPerCore * self._cores()
+        self.memoryPerStream = memoryPerStream
+        self.stations = []
+        self.started = time.time()
+        # what the process used before the first stream, the budget is on top of it
+        self.baseMemory = self._residentMemory()
+
+    def add(self, name, url):
+        if len(self.stations) >= self.maxStreams:
+            self.log.warn('Not monitoring %s, limit of %d streams reached', name, self.maxStreams)
+            return None
+        station = MonitoredStation(len(self.stations), name, url)
+        self.stations.append(station)
+        return station
+
+    def start(self):
+        for station in self.stations:
+            self._later(station, station.index * self.stagger, self.resolve)
+        gobject.timeout_add_seconds(self.interval, self.sample)
+
+    def stop(self):
+        for station in self.stations:
+            self.disconnect(station)
+            if station.timeout is not None:
+                gobject.source_remove(station.timeout)
+                station.timeout = None
+
+    def resolve(self, station):
+        station.state = STATE_RESOLVING
+        self.resolver.submit(self.resolveStation, (station.url,), lambda stream: self.resolved(station, stream))
+
+    def resolveStation(self, job, url):
+        # runs on a resolver thread
+        if not url.startswith('http'):
+            return None
+        urlInfo = self.decoder.getMediaStreamInfo(url, cancellation=job)
+        if urlInfo is not None and urlInfo.isPlaylist():
+            playlist = PlaylistExpander()
+            playlist.add([url])
+            playlist.expand(url, self.decoder.getPlaylist(urlInfo) or [])
+            urlInfo = self.racer.select(playlist, job)
+        if urlInfo is None:
+            return None
+        urlInfo.close()
+        return urlInfo.getUrl()
+
+    def resolved(self, station, stream):
+        # back on the main loop
+        if stream is None or not stream.startswith('http'):
+            station.error = 'could not resolve to an HTTP stream'
+            self.failed(station)
+            return
+        station.stream = stream
+        self.connect(station)
+
+    def connect(self, station):
+        if not self.withinBudget():
+            station.state = STATE_DEFERRED
+            self.log.debug('Deferring %s, memory budget of %d streams used up', station.name, self.connected())
+            self._later(station, self.interval, self.connect)
+            return
+
+        station.state = STATE_CONNECTING
+        station.position = 0
+        station.pipeline = gst.Pipeline('monitor-%d' % station.index)
+        station.source = gst.element_factory_make('souphttpsrc', 'source')
+        station.source.set_property('location', station.stream)
+        station.source.set_property('user-agent', USER_AGENT)
+        station.source.set_property('iradio-mode', station.icy)
+        sink = gst.element_factory_make('fakesink', 'sink')
+        sink.set_property('sync', False)
+        sink.set_property('async', False)
+
+        if station.icy:
+            demuxer = gst.element_factory_make('icydemux', 'demuxer')
+            station.pipeline.add(station.source, demuxer, sink)
+            station.source.link(demuxer)
+            demuxer.connect('pad-added', lambda demuxer, pad: pad.link(sink.get_pad('sink')))
+        else:
+            station.pipeline.add(station.source, sink)
+            station.source.link(sink)
+
+        bus = station.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect('message', self.onMessage, station)
+        station.pipeline.set_state(gst.STATE_PLAYING)
+
+    def connected(self):
+        return len([station for station in self.stations if station.pipeline is not None])
+
+    def withinBudget(self):
+        """True while the memory grown since start fits the budget of the connected streams."""
+        resident = self._residentMemory()
+        if resident is None or self.baseMemory is None:
+            return True
+        return resident - self.baseMemory < self.memoryPerStream * max(self.connected(), 1)
+
+    def disconnect(self, station):
+        if station.pipeline is not None:
+            station.pipeline.set_state(gst.STATE_NULL)
+            station.pipeline.get_bus().remove_signal_watch()
+            station.pipeline = None
+            station.source = None
+        if station.connectedSince is not None:
+            station.connectedTime += time.time() - station.connectedSince
+            station.connectedSince = None
+
+    def failed(self, station):
+        self.disconnect(station)
+        station.failures += 1
+        station.retries += 1
+        station.rate = None
+        station.state = STATE_FAILED
+        # back off up to ten minutes, jittered so stations do not come back all at once
+        delay = min(5 * (2 ** min(station.retries - 1, 7)), 600) * random.uniform(0.75, 1.25)
+        self.log.debug('%s failed (%s), retrying in %.0f s', station.name, station.error, delay)
+        self._later(station, delay, self.resolve)
+
+    def onMessage(self, bus, message, station):
+        t = message.type
+        if t == gst.MESSAGE_TAG:
+            taglist = message.parse_tag()
+            if 'title' in taglist.keys() and taglist['title'] != station.title:
+                station.title = taglist['title']
+                station.titleChanged = time.strftime('%Y-%m-%dT%H:%M:%S')
+                station.titles += 1
+        elif t == gst.MESSAGE_STATE_CHANGED and message.src is station.pipeline:
+            oldstate, newstate, pending = message.parse_state_changed()
+            if newstate == gst.STATE_PLAYING and station.connectedSince is None:
+                station.state = STATE_PLAYING
+                station.connectedSince = time.time()
+                station.lastData = station.connectedSince
+                station.connects += 1
+        elif t == gst.MESSAGE_ERROR:
+            err, debug = message.parse_error()
+            if station.icy and station.position == 0 and err.domain == gst.STREAM_ERROR:
+                # no icecast metadata in this stream, follow it without icydemux
+                self.log.debug('%s has no icecast metadata', station.name)
+                station.icy = False
+                self.disconnect(station)
+                self.connect(station)
+            else:
+                station.error = str(err)
+                self.failed(station)
+        elif t == gst.MESSAGE_EOS:
+            station.error = 'end of stream'
+            self.failed(station)
+        return True
+
+    def sample(self):
+        now = time.time()
+        for station in self.stations:
+            if station.source is None or station.connectedSince is None:
+                continue
+            try:
+                position, format = station.source.query_position(gst.FORMAT_BYTES)
+            except gst.QueryError:
+                continue
+
+            if position > station.position:
+                station.rate = (position - station.position) / float(self.interval)
+                station.bytes += position - station.position
+                station.position = position
+                station.lastData = now
+                station.state = STATE_PLAYING
+                # it works again, the next failure starts the backoff over
+                station.retries = 0
+            else:
+                station.rate = 0.0
+                if station.state != STATE_STALLED:
+                    station.state = STATE_STALLED
+                    station.stalls += 1
+                if now - station.lastData >= self.stallTimeout:
+                    station.error = 'no data for %d seconds' % self.stallTimeout
+                    self.failed(station)
+        # keep sampling
+        return True
+
+    def snapshot(self):
+        stations = [station.report() for station in self.stations]
+        report = {'time':time.strftime('%Y-%m-%dT%H:%M:%S'), 'running':round(time.time() - self.started, 1),
+                  'streams':len(stations), 'maxStreams':self.maxStreams, 'stations':stations}
+        for state in (STATE_PLAYING, STATE_STALLED, STATE_CONNECTING, STATE_RESOLVING, STATE_FAILED, STATE_DEFERRED):
+            report[state] = len([s for s in stations if s['state'] == state])
+
+        resident = self._residentMemory()
+        if resident is not None and self.baseMemory is not None:
+            connected = self.connected()
+            perStream = (resident - self.baseMemory) / max(connected, 1)
+            report['memory'] = {'resident':resident, 'base':self.baseMemory, 'connected':connected,
+                                'perStream':perStream, 'budgetPerStream':self.memoryPerStream,
+                                'overBudget':perStream > self.memoryPerStream}
+            if perStream > self.memoryPerStream:
+                self.log.warn('Using %d KB per stream for %d streams, over the budget of %d KB per stream',
+                              perStream / 1024, connected, self.memoryPerStream / 1024)
+        return report
+
+    def _later(self, station, delay, func):
+        def fire():
+            station.timeout = None
+            func(station)
+            return False
+        if station.timeout is not None:
+            gobject.source_remove(station.timeout)
+        station.timeout = gobject.timeout_add(int(delay * 1000), fire)
+
+    def _cores(self):
+        try:
+            return max(os.sysconf('SC_NPROCESSORS_ONLN'), 1)
+        except (ValueError, OSError, AttributeError):
+            return 1
+
+    def _residentMemory(self):
+        try:
+            statm = open('/proc/self/statm')
+            try:
+                return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+            finally:
+                statm.close()
+        except (IOError, ValueError, OSError):
+            return None
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-b', '--bookmarks', dest='bookmarks', help='bookmarks file with the stations to follow')
+    parser.add_option('-c', '--config', dest='config', help='configuration file')
+    parser.add_option('-o', '--output', dest='output', help='rewrite this file with every report instead of printing it')
+    parser.add_option('-i', '--interval', dest='interval', type='int', default=5, help='seconds between reports')
+    parser.add_option('-w', '--workers', dest='workers', type='int', default=4, help='stations resolved at once')
+    parser.add_option('-s', '--stagger', dest='stagger', type='float', default=0.2, help='seconds between two connects')
+    parser.add_option('--stall-timeout', dest='stallTimeout', type='int', default=15,
+                      help='seconds without data before reconnecting')
+    parser.add_option('--max-streams', dest='maxStreams', type='int',
+                      help='streams to follow at most, --streams-per-core times the cores by default')
+    parser.add_option('--streams-per-core', dest='streamsPerCore', type='int', default=STREAMS_PER_CORE,
+                      help='default stream limit per core')
+    parser.add_option('--memory-per-stream', dest='memoryPerStream', type='int', default=MEMORY_PER_STREAM / 1024,
+                      help='memory budget per stream in KB')
+    parser.add_option('-v', '--verbose', dest='verbose', action='store_true', default=False)
+    (options, args) = parser.parse_args()
+
+    logging.basicConfig(level=options.verbose and logging.DEBUG or logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    bookmarks = options.bookmarks or os.path.join(USER_CFG_PATH, CFG_NAME)
+    if not os.access(bookmarks, os.R_OK):
+        bookmarks = DEFAULT_RADIO_LIST
+    config = options.config or os.path.join(USER_CFG_PATH, OPTIONS_CFG_NAME)
+    if not os.access(config, os.R_OK):
+        config = DEFAULT_CONFIG_FILE
+
+    gobject.threads_init()
+
+    provider = XmlDataProvider(bookmarks)
+    provider.loadFromFile()
+    cfg_provider = XmlConfigProvider(config)
+    cfg_provider.loadFromFile()
+
+    dnsCache = DnsCache(int(cfg_provider.getConfigValue("dns_cache_ttl", 300)), maxEntries=4096)
+    dnsCache.install()
+
+    decoder = StreamDecoder(cfg_provider)
+    monitor = StationMonitor(decoder, options.workers, options.stagger, options.interval,
+                             options.stallTimeout, options.maxStreams, options.streamsPerCore,
+                             options.memoryPerStream * 1024)
+    decoder.http.maxPerHost = options.workers * monitor.racer.width
+    for name in provider.listRadioNames():
+        url = provider.getRadioUrl(name)
+        if url:
+            monitor.add(name, url)
+
+    def report():
+        snapshot = monitor.snapshot()
+        snapshot['dns'] = dnsCache.stats()
+        if options.output:
+            tmpname = options.output + '.tmp'
+            out_file = open(tmpname, 'w')
+            json.dump(snapshot, out_file, indent=2)
+            out_file.close()
+            os.rename(tmpname, options.output)
+        else:
+            json.dump(snapshot, sys.stdout, indent=2)
+            sys.stdout.write('\n')
+            sys.stdout.flush()
+        return True
+
+    loop = gobject.MainLoop()
+    signal.signal(signal.SIGINT, lambda signum, frame: loop.quit())
+    signal.signal(signal.SIGTERM, lambda signum, frame: loop.quit())
+
+    monitor.start()
+    gobject.timeout_add_seconds(options.interval, report)
+    loop.run()
+
+    monitor.stop()
+    report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import time
+import threading
+import logging
+from collections import OrderedDict
+from ResolverQueue import ResolverQueue
+
+class StationPrefetcher:
+    """Resolves stations the user is likely to pick before they pick them.
+
+    Jobs run on their own resolver threads so they never delay a real
+    station switch. At most maxQueued stations are resolved at a time and
+    jobs for stations that are no longer wanted are cancelled. Finished
+    resolutions wait in a small LRU for up to ttl seconds.
+    """
+
+    def __init__(self, resolveFunc, workers=1, maxQueued=3, maxReady=8, ttl=60):
+        self.log = logging.getLogger('radiotray')
+        self.resolveFunc = resolveFunc
+        self.resolver = ResolverQueue(workers)
+        self.maxQueued = maxQueued
+        self.maxReady = maxReady
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # url -> job in flight
+        self.jobs = {}
+        # url -> (time resolved, result), least recently used first
+        self.ready = OrderedDict()
+
+    def focus(self, urls):
+        """Cancels the prefetches of stations that are not in urls."""
+        with self.lock:
+            for url in self.jobs.keys():
+                if url not in urls:
+                    self.log.debug('Cancelling prefetch of %s', url)
+                    self.jobs.pop(url).cancel()
+
+    def prefetch(self, urls):
+        """Starts resolving urls, most wanted first."""
+        self.focus(urls)
+        with self.lock:
+            self._expire()
+            for url in urls:
+                if len(self.jobs) >= self.maxQueued:
+                    break
+                if url is None or url in self.jobs or url in self.ready:
+                    continue
+                self.log.debug('Prefetching %s', url)
+                self.jobs[url] = self.resolver.submit(self.resolveFunc, (url,), lambda result, url=url: self._resolved(url, result))
+
+    def take(self, url):
+        """Returns and forgets the prefetched resolution of url, if there is a fresh one."""
+        with self.lock:
+            self._expire()
+            entry = self.ready.pop(url, None)
+        if entry is None:
+            return None
+        self.log.info('Using prefetched resolution of %s', url)
+        return entry[1]
+
+    def adopt(self, url):
+        """Returns the job still resolving url and stops tracking it, or None.
+
+        The caller redirects its result; focus() no longer cancels it.
+        """
+        with self.lock:
+            job = self.jobs.pop(url, None)
+        if job is not None:
+            self.log.info('Taking over the prefetch of %s', url)
+        return job
+
+    def _resolved(self, url, result):
+        with self.lock:
+            self.jobs.pop(url, None)
+            if result is None:
+                return
+            self.ready.pop(url, None)
+            self.ready[url] = (time.time(), result)
+            while len(self.ready) > self.maxReady:
+                self.ready.popitem(last=False)
+
+    def _expire(self):
+        limit = time.time() - self.ttl
+        for url, (resolved, result) in self.ready.items():
+            if resolved < limit:
+                del self.ready[url]
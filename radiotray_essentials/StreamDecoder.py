@@ -18,30 +18,52 @@
 #
 ##########################################################################
 import urllib2
-from lib.common import USER_AGENT
-from lib.DummyMMSHandler import DummyMMSHandler
+import socket
+from lib.HttpClient import HttpClient
 from PlsPlaylistDecoder import PlsPlaylistDecoder
 from M3uPlaylistDecoder import M3uPlaylistDecoder
 from AsxPlaylistDecoder import AsxPlaylistDecoder
 from XspfPlaylistDecoder import XspfPlaylistDecoder
 from AsfPlaylistDecoder import AsfPlaylistDecoder
 from RamPlaylistDecoder import RamPlaylistDecoder
+from DecoderRegistry import DecoderRegistry
+from SniffedResponse import SniffedResponse
 from UrlInfo import UrlInfo
+from lib.Telemetry import Telemetry
+import time
 import logging
 
-class StreamDecoder:
+class StreamFailure(Exception):
+    """Why a station could not be probed: HTTP status, DNS, timeout, cancel..."""
+
+    def __init__(self, reason):
+        Exception.__init__(self, reason)
+        self.reason = reason
+
 
-    def __init__(self, cfg_provider):
-        plsDecoder = PlsPlaylistDecoder()
-        m3uDecoder = M3uPlaylistDecoder()
-        asxDecoder = AsxPlaylistDecoder()
-        xspfDecoder = XspfPlaylistDecoder()
-        asfDecoder = AsfPlaylistDecoder()
-        ramDecoder = RamPlaylistDecoder()
+def failureReason(error):
+    """Short description of an exception raised while opening or reading a stream."""
+    if isinstance(error, urllib2.HTTPError):
+        return 'HTTP %d %s' % (error.code, error.msg)
+    if isinstance(error, urllib2.URLError):
+        error = error.reason
+    if isinstance(error, socket.gaierror):
+        return 'DNS lookup failed: %s' % error.args[-1]
+    if isinstance(error, socket.timeout):
+        return 'timed out'
+    if str(error) == 'cancelled':
+        return 'cancelled'
+    if isinstance(error, socket.error) and len(error.args) > 1:
+        return 'connection failed: %s' % error.args[-1]
+    return str(error) or error.__class__.__name__
+
+
+class StreamDecoder:
 
+    def __init__(self, cfg_provider, telemetry=None):
         self.log = logging.getLogger('radiotray')
-        
-        self.decoders = [plsDecoder, asxDecoder, asfDecoder, xspfDecoder, ramDecoder, m3uDecoder]
+        # resolution phase timings end up here
+        self.telemetry = telemetry or Telemetry()
 
         self.url_timeout = None
 
@@ -58,24 +80,55 @@ class StreamDecoder:
 
         self.log.info('Using url timeout = %s', str(self.url_timeout))
 
+        # one keep-alive connection pool for the probes and all playlist downloads
+        maxPerHost = int(cfg_provider.getConfigValue("http_host_connections", 4))
+        maxIdle = int(cfg_provider.getConfigValue("http_pool_size", 16))
+        self.http = HttpClient(float(self.url_timeout), maxPerHost, maxIdle)
+
+        plsDecoder = PlsPlaylistDecoder(self.http)
+        m3uDecoder = M3uPlaylistDecoder(self.http)
+        asxDecoder = AsxPlaylistDecoder(self.http)
+        xspfDecoder = XspfPlaylistDecoder(self.http)
+        asfDecoder = AsfPlaylistDecoder(self.http)
+        ramDecoder = RamPlaylistDecoder(self.http)
+
+        self.registry = DecoderRegistry()
+        for decoder in [plsDecoder, asxDecoder, asfDecoder, xspfDecoder, ramDecoder, m3uDecoder]:
+            self.registry.register(decoder)
+        self.registry.loadEntryPoints(self.http)
 
-    def getMediaStreamInfo(self, url):
+
+    def getMediaStreamInfo(self, url, headers=None, cancellation=None, phase='resolve'):
+        """Like probeMediaStream, but returns None instead of the failure."""
+        try:
+            return self.probeMediaStream(url, headers, cancellation, phase)
+        except StreamFailure:
+            return None
+
+    def probeMediaStream(self, url, headers=None, cancellation=None, phase='resolve'):
+        """Returns the UrlInfo of url, raises StreamFailure with the reason it could not be had.
+
+        The timings go to the telemetry as <phase>.connect and <phase>.sniff,
+        so background resolutions do not mix with the ones a user waits for.
+        """
 
         if url.startswith("http") == False:
             self.log.info('Not an HTTP url. Maybe direct stream...')
             return UrlInfo(url, False, None)
 
         self.log.info('Requesting stream... %s', url)
-        req = urllib2.Request(url)
-        req.add_header('User-Agent', USER_AGENT)
 
+        started = time.time()
         try:
-            opener = urllib2.build_opener(DummyMMSHandler())
-            f = opener.open(req, timeout=float(self.url_timeout))
+            f = self.http.open(url, headers, cancellation=cancellation)
+            self.telemetry.observe(phase + '.connect', time.time() - started)
 
         except urllib2.HTTPError, e:
+            if e.code == 304:
+                self.log.info('Stream %s not modified', url)
+                return UrlInfo(url, False, None, headers=e.info(), notModified=True)
             self.log.warn('HTTP Error: No radio stream found for %s - %s', url, str(e))
-            return None
+            raise StreamFailure(failureReason(e))
         except urllib2.URLError, e:
             self.log.info('No radio stream found for %s', url)
             if str(e.reason).startswith('MMS REDIRECT'):
@@ -83,14 +136,20 @@ class StreamDecoder:
                 self.log.info('Found mms redirect for: %s', newurl)
                 return UrlInfo(newurl, False, None)
             else:
-                return None
+                raise StreamFailure(failureReason(e))
         except Exception, e:
             self.log.warn('No radio stream found. Error: %s', str(e))
-            return None
+            raise StreamFailure(failureReason(e))
 
         metadata = f.info()
-        firstbytes = f.read(500)
-        f.close()
+        started = time.time()
+        try:
+            firstbytes = f.read(500)
+            self.telemetry.observe(phase + '.sniff', time.time() - started)
+        except Exception, e:
+            self.log.warn('Could not read from %s. Error: %s', url, str(e))
+            f.close()
+            raise StreamFailure('read failed: %s' % failureReason(e))
         
         try:            
             self.log.debug('Metadata obtained...')
@@ -101,22 +160,30 @@ class StreamDecoder:
         except Exception, e:
             self.log.info("Couldn't read content-type. Maybe direct stream...")
             self.log.info('Error: %s',e)
-            return UrlInfo(url, False, None)
-
-        for decoder in self.decoders:
-                
-            self.log.info('Checking decoder')
-            if(decoder.isStreamValid(contentType, firstbytes)):
+            f.close()
+            return UrlInfo(url, False, None, headers=metadata)
 
-                return UrlInfo(url, True, contentType, decoder)
+        decoder = self.registry.lookup(contentType, firstbytes)
+        if(decoder is not None):
+            # keep the connection open, the decoder reads the playlist from it
+            return UrlInfo(url, True, contentType, decoder, SniffedResponse(f, firstbytes), metadata)
             
         # no playlist decoder found. Maybe a direct stream
+        f.close()
         self.log.info('No playlist decoder could handle the stream. Maybe direct stream...')
-        return UrlInfo(url, False, contentType)
+        return UrlInfo(url, False, contentType, headers=metadata)
         
 
 
-    def getPlaylist(self, urlInfo):
+    def getPlaylist(self, urlInfo, phase='resolve'):
 
-        return urlInfo.getDecoder().extractPlaylist(urlInfo.getUrl())
+        response = urlInfo.getResponse()
+        started = time.time()
+        try:
+            if response is None:
+                return urlInfo.getDecoder().extractPlaylist(urlInfo.getUrl())
+            return urlInfo.getDecoder().decodePlaylist(response)
+        finally:
+            urlInfo.close()
+            self.telemetry.observe(phase + '.playlist', time.time() - started)
 
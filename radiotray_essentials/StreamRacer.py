@@ -0,0 +1,211 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import time
+import threading
+import Queue
+import logging
+from lib.Cancellation import Cancellation
+
+AUDIO_TYPES = ('audio/', 'application/ogg', 'video/x-ms-asf')
+
+def isAudioStream(urlInfo):
+    if urlInfo is None or urlInfo.isPlaylist():
+        return False
+    contentType = urlInfo.getContentType()
+    # non-HTTP urls (mms, rtsp...) come without a content type
+    return contentType is None or contentType.lower().startswith(AUDIO_TYPES)
+
+
+class RaceResult:
+
+    def __init__(self, winner, winnerUrl, answered, dead):
+        # the first stream that answered with audio, or None
+        self.winner = winner
+        # the candidate that won; the winner's own url differs after an mms redirect
+        self.winnerUrl = winnerUrl
+        # url -> UrlInfo of the candidates that answered with something else
+        self.answered = answered
+        # urls that failed or did not answer in time
+        self.dead = dead
+
+    def close(self):
+        for urlInfo in self.answered.itervalues():
+            urlInfo.close()
+
+
+class StreamRacer:
+    """Probes several playlist entries at once and keeps the first one that plays.
+
+    Probes are started a short delay apart, like Happy Eyeballs, and the
+    next one starts right away when a probe fails. Once an entry answered
+    with something other than audio, the others get grace seconds more to
+    do better. Probes still running when the race is decided are
+    cancelled, which closes their connections and frees their per host
+    slots in the HTTP client.
+    """
+
+    def __init__(self, decoder, width=3, stagger=0.25, grace=1.0):
+        self.log = logging.getLogger('radiotray')
+        self.decoder = decoder
+        self.width = width
+        self.stagger = stagger
+        self.grace = grace
+
+    def race(self, urls, job=None, phase='resolve'):
+        """Races urls; cancelling job cancels every probe still running."""
+        results = Queue.Queue()
+        lock = threading.Lock()
+        state = {'done':False}
+
+        def probe(url, cancellation):
+            try:
+                urlInfo = self.decoder.getMediaStreamInfo(url, cancellation=cancellation, phase=phase)
+            except Exception, e:
+                self.log.warn('Probe of %s failed: %s', url, str(e))
+                urlInfo = None
+            with lock:
+                if state['done']:
+                    if urlInfo is not None:
+                        urlInfo.close()
+                    return
+                results.put((url, urlInfo))
+
+        pending = list(urls)
+        running = []
+        # url -> Cancellation of its probe
+        probes = {}
+        winner = None
+        winnerUrl = None
+        answered = {}
+        dead = set()
+        # set once something usable answered, hanging probes are not waited for beyond it
+        graceDeadline = None
+
+        def startNext():
+            url = pending.pop(0)
+            self.log.debug('Racing %s', url)
+            probes[url] = Cancellation(job)
+            thread = threading.Thread(target=probe, args=(url, probes[url]))
+            thread.daemon = True
+            thread.start()
+            running.append(url)
+
+        startNext()
+        while winner is None and (len(running) > 0 or len(pending) > 0):
+            if job is not None and job.isCancelled():
+                break
+            if len(pending) > 0:
+                timeout = self.stagger
+            else:
+                timeout = float(self.decoder.url_timeout)
+            if graceDeadline is not None:
+                timeout = min(timeout, graceDeadline - time.time())
+                if timeout <= 0:
+                    self.log.debug('Not waiting any longer for %s', ', '.join(running))
+                    break
+
+            try:
+                url, urlInfo = results.get(timeout=timeout)
+            except Queue.Empty:
+                if len(pending) > 0:
+                    startNext()
+                    continue
+                break
+
+            running.remove(url)
+            if isAudioStream(urlInfo):
+                self.log.info('%s won the race', url)
+                winner = urlInfo
+                winnerUrl = url
+            elif urlInfo is None:
+                dead.add(url)
+            else:
+                answered[url] = urlInfo
+                if graceDeadline is None:
+                    graceDeadline = time.time() + self.grace
+
+            if winner is None and len(pending) > 0:
+                startNext()
+
+        with lock:
+            state['done'] = True
+
+        # results that came in together with the winner
+        while True:
+            try:
+                url, urlInfo = results.get_nowait()
+            except Queue.Empty:
+                break
+            running.remove(url)
+            if urlInfo is None:
+                dead.add(url)
+            else:
+                answered[url] = urlInfo
+
+        # the losers would hold on to their connection until url_timeout
+        for url in running:
+            probes[url].cancel()
+
+        if job is not None and job.isCancelled():
+            # failures caused by the cancel say nothing about the streams
+            dead = set()
+        elif winner is None and len(answered) == 0:
+            # nobody answered in time; probes cut short by the grace period stay as fallback
+            dead.update(running)
+
+        return RaceResult(winner, winnerUrl, answered, dead)
+
+    def select(self, playlist, job=None, phase='resolve'):
+        """Races the entries of a PlaylistExpander until one of them plays.
+
+        Nested playlists are expanded along the way. Returns the UrlInfo of
+        the chosen stream, or None when nothing is left to try.
+        """
+        while(len(playlist) > 0 and (job is None or not job.isCancelled())):
+            candidates = playlist.urls()[:self.width]
+            result = self.race(candidates, job, phase)
+            if(job is not None and job.isCancelled()):
+                result.close()
+                if(result.winner is not None):
+                    result.winner.close()
+                return None
+
+            # whatever was not found dead is dropped, the rest stays behind as fallback
+            for url in result.dead:
+                playlist.drop(url, 'no answer')
+
+            if(result.winner is not None):
+                result.close()
+                playlist.take(result.winnerUrl, 'first to answer with audio')
+                return result.winner
+
+            # no audio yet; continue with the first entry that answered at all
+            for url in candidates:
+                urlInfo = result.answered.pop(url, None)
+                if(urlInfo is not None):
+                    result.close()
+                    if(urlInfo.isPlaylist()):
+                        playlist.expand(url, self.decoder.getPlaylist(urlInfo, phase) or [])
+                        break
+                    else:
+                        playlist.take(url, 'answered with %s' % urlInfo.getContentType())
+                        return urlInfo
+
+        return None
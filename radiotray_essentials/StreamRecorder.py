@@ -0,0 +1,361 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import os
+import re
+import json
+import time
+import threading
+import Queue
+import logging
+
+# bytes collected before they go to disk
+WRITE_BUFFER_SIZE = 1024 * 1024
+STREAM_TITLE = re.compile(r"StreamTitle='(.*?)';", re.DOTALL)
+# what a metadata block that is not empty starts with
+ICY_FIELD = re.compile(r"[A-Za-z]+='")
+# metadata blocks in a row that must line up before a recording trusts where they are
+ICY_LOCATE_BLOCKS = 4
+
+def safeName(name):
+    return re.sub(r'[\\/:*?"<>|\x00-\x1f]+', '_', name).strip(' .')[:100] or 'unknown'
+
+def sniffExtension(data):
+    if data.startswith('OggS'):
+        return 'ogg'
+    if data.startswith('ID3'):
+        return 'mp3'
+    for i in range(min(len(data) - 1, 4096)):
+        if data[i] == '\xff' and (ord(data[i + 1]) & 0xe0) == 0xe0:
+            # ADTS frames have layer 0, MPEG audio frames never do
+            if (ord(data[i + 1]) & 0xf6) == 0xf0:
+                return 'aac'
+            return 'mp3'
+    return 'bin'
+
+
+def parseStreamTitle(meta):
+    match = STREAM_TITLE.search(meta)
+    if match is None:
+        return None
+    title = match.group(1)
+    try:
+        return title.decode('utf-8')
+    except UnicodeDecodeError:
+        return title.decode('latin-1')
+
+
+class IcyStripper:
+    """Removes the icecast metadata blocks interleaved with the audio.
+
+    It has to see the stream from its first byte to know where the blocks
+    are. IcyLocator finds them when a recording starts in the middle.
+    """
+
+    def __init__(self, metaint):
+        self.metaint = metaint
+        self.audioLeft = metaint
+        self.metaLeft = None
+        # the metadata block read so far, None if it started before we did
+        self.meta = []
+
+    def strip(self, data):
+        """Returns the audio in data as (audio, title) pieces.
+
+        title is the StreamTitle announced right after that audio, or None.
+        """
+        pieces = []
+        audio = []
+        position = 0
+        while position < len(data):
+            if self.metaLeft is None:
+                if self.audioLeft > 0:
+                    chunk = data[position:position + self.audioLeft]
+                    audio.append(chunk)
+                    self.audioLeft -= len(chunk)
+                    position += len(chunk)
+                else:
+                    # length byte of the metadata block, in units of 16 bytes
+                    self.metaLeft = ord(data[position]) * 16
+                    self.meta = []
+                    position += 1
+            else:
+                chunk = data[position:position + self.metaLeft]
+                if self.meta is not None:
+                    self.meta.append(chunk)
+                self.metaLeft -= len(chunk)
+                position += len(chunk)
+
+            if self.metaLeft == 0:
+                title = None
+                if self.meta:
+                    title = parseStreamTitle(''.join(self.meta))
+                if title is not None:
+                    pieces.append((''.join(audio), title))
+                    audio = []
+                self.metaLeft = None
+                self.meta = []
+                self.audioLeft = self.metaint
+        pieces.append((''.join(audio), None))
+        return pieces
+
+
+class IcyLocator:
+    """Strips a stream that was joined in the middle, once it found the metadata blocks.
+
+    Until then it holds the data back. Every metadata block is a length
+    byte followed by that many times 16 bytes, metaint audio bytes apart;
+    the blocks are found where ICY_LOCATE_BLOCKS of them line up, empty
+    or starting with a field like StreamTitle='.
+    """
+
+    def __init__(self, metaint):
+        self.metaint = metaint
+        self.pending = ''
+        self.stripper = None
+
+    def strip(self, data):
+        if self.stripper is not None:
+            return self.stripper.strip(data)
+
+        self.pending += data
+        start = self._locate()
+        if start is None:
+            if len(self.pending) > 4 * ICY_LOCATE_BLOCKS * (self.metaint + 4081):
+                # no way to tell, give up what cannot be placed
+                self.pending = self.pending[self.metaint + 1:]
+            return [('', None)]
+
+        # everything before the first length byte is audio
+        self.stripper = IcyStripper(self.metaint)
+        self.stripper.audioLeft = start
+        pending = self.pending
+        self.pending = None
+        return self.stripper.strip(pending)
+
+    def _locate(self):
+        found = None
+        for start in xrange(min(self.metaint + 1, len(self.pending))):
+            position = start
+            for block in xrange(ICY_LOCATE_BLOCKS):
+                if position >= len(self.pending):
+                    # not enough data to tell yet
+                    return None
+                length = ord(self.pending[position]) * 16
+                if length > 0 and not ICY_FIELD.match(self.pending, position + 1):
+                    break
+                position += 1 + length + self.metaint
+            else:
+                if found is not None:
+                    # more than one way to line them up, wait for more data
+                    return None
+                found = start
+        return found
+
+
+class IcyTap:
+    """Buffer probe on a source pad, put on it only while a recording runs.
+
+    It passes the raw stream to the recorder queue. When the probe sees
+    the stream from its first byte the metadata blocks are known right
+    away, otherwise the writer thread has to locate them.
+    """
+
+    def __init__(self, pad, queue):
+        self.pad = pad
+        self.queue = queue
+        self.first = True
+        self.probe = pad.add_buffer_probe(self._captured)
+
+    def remove(self):
+        self.queue = None
+        self.pad.remove_buffer_probe(self.probe)
+
+    def _captured(self, pad, buffer):
+        # streaming thread, keep it cheap
+        queue = self.queue
+        if queue is None:
+            return True
+        if self.first:
+            self.first = False
+            stripper = None
+            caps = buffer.get_caps()
+            if caps is not None and caps[0].get_name() == 'application/x-icy':
+                metaint = caps[0]['metadata-interval']
+                stripper = buffer.offset == 0 and IcyStripper(metaint) or IcyLocator(metaint)
+            queue.put(('sync', stripper))
+        queue.put(('icy', buffer.data))
+        return True
+
+
+class Recording:
+    """The files of one recording, only used by the writer thread."""
+
+    def __init__(self, path, station):
+        self.log = logging.getLogger('radiotray')
+        self.path = path
+        self.index = {'station':station, 'started':time.strftime('%Y-%m-%dT%H:%M:%S'), 'tracks':[]}
+        self.offset = 0
+        self.track = None
+        self.out_file = None
+        self.extension = None
+
+    def split(self, metadata):
+        track = self.track
+        if track is not None and (track['artist'], track['title']) == (metadata.get('artist'), metadata.get('title')):
+            # the same song announced again
+            return
+        if self.out_file is not None:
+            self.out_file.close()
+            self.out_file = None
+        self.track = {'artist':metadata.get('artist'), 'title':metadata.get('title'), 'offset':self.offset,
+                      'time':time.strftime('%Y-%m-%dT%H:%M:%S'), 'length':0}
+
+    def write(self, data):
+        if len(data) == 0:
+            return
+        if self.out_file is None:
+            if self.extension is None:
+                self.extension = sniffExtension(data)
+            if self.track is None:
+                self.track = {'artist':None, 'title':None, 'offset':self.offset,
+                              'time':time.strftime('%Y-%m-%dT%H:%M:%S'), 'length':0}
+            track = self.track
+            number = len(self.index['tracks']) + 1
+            name = ' - '.join([safeName(part) for part in (track['artist'], track['title']) if part])
+            track['file'] = '%03d %s.%s' % (number, name or 'untitled', self.extension)
+            self.index['tracks'].append(track)
+            self.out_file = open(os.path.join(self.path, track['file']), 'wb', WRITE_BUFFER_SIZE)
+            self.saveIndex()
+
+        self.out_file.write(data)
+        self.track['length'] += len(data)
+        self.offset += len(data)
+
+    def close(self):
+        if self.out_file is not None:
+            self.out_file.close()
+            self.out_file = None
+        self.index['stopped'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.saveIndex()
+        self.log.info('Recording stopped after %d bytes', self.offset)
+
+    def saveIndex(self):
+        try:
+            out_file = open(os.path.join(self.path, 'index.json'), 'w')
+            try:
+                json.dump(self.index, out_file, indent=2)
+            finally:
+                out_file.close()
+        except Exception, e:
+            self.log.warn('Could not write recording index: %s', str(e))
+
+
+class StreamRecorder:
+    """Writes the compressed stream of a station to disk, one file per song.
+
+    The streaming thread only queues the buffers it sees, a writer thread
+    strips the icecast metadata and does large buffered writes. Icecast
+    streams are split on the StreamTitle found in the stream itself, so
+    the split lands on the exact byte; other streams are split on the tags
+    that make the player report a song change. Each recording gets a
+    directory with the tracks and an index.json listing where every track
+    starts in the stream.
+    """
+
+    def __init__(self, directory):
+        self.log = logging.getLogger('radiotray')
+        self.directory = directory
+        self.queue = None
+        self.thread = None
+        self.tap = None
+
+    def isRecording(self):
+        return self.thread is not None
+
+    def start(self, station, name=None):
+        """Starts a new recording, raises OSError if its directory cannot be made."""
+        if self.isRecording():
+            self.stop()
+
+        folder = '%s %s' % (time.strftime('%Y-%m-%d %H.%M.%S'), safeName(name or station))
+        path = os.path.join(self.directory, folder)
+        os.makedirs(path)
+        self.log.info('Recording %s to %s', station, path)
+
+        self.queue = Queue.Queue()
+        self.thread = threading.Thread(target=self._write, name='recorder',
+                                       args=(self.queue, Recording(path, station)))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if not self.isRecording():
+            return
+        self.detach()
+        self.queue.put(('stop', None))
+        self.thread.join()
+        self.thread = None
+        self.queue = None
+
+    def attach(self, pad):
+        """Records the raw stream leaving pad, or with pad None whatever is passed to write()."""
+        self.detach()
+        if pad is None:
+            self.queue.put(('sync', None))
+            return
+        self.tap = IcyTap(pad, self.queue)
+
+    def detach(self):
+        if self.tap is not None:
+            self.tap.remove()
+            self.tap = None
+
+    def write(self, data):
+        """Records data that is free of icecast metadata already."""
+        if self.queue is not None:
+            self.queue.put(('data', data))
+
+    def split(self, metadata):
+        if self.queue is not None:
+            self.queue.put(('split', dict(metadata)))
+
+    def _write(self, queue, recording):
+        stripper = None
+
+        while True:
+            kind, value = queue.get()
+
+            if kind == 'stop':
+                break
+            elif kind == 'sync':
+                stripper = value
+            elif kind == 'split':
+                # icecast streams split themselves, on the byte the title changes
+                if stripper is None:
+                    recording.split(value)
+            elif kind == 'icy' and stripper is not None:
+                for audio, title in stripper.strip(value):
+                    recording.write(audio)
+                    if title is not None:
+                        recording.split({'title':title})
+            else:
+                recording.write(value)
+
+        recording.close()
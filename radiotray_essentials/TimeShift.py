@@ -0,0 +1,291 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import time
+import bisect
+import threading
+import logging
+import pygst
+pygst.require("0.10")
+import gst
+import gobject
+from lib.RingFile import RingFile
+from lib.common import USER_AGENT
+
+# bytes handed to appsrc at a time
+CHUNK_SIZE = 4096
+# assumed until the capture has run long enough to measure it, 128 kbit/s
+DEFAULT_BYTE_RATE = 16000
+# formats that can be decoded starting from any byte, decodebin2 stops there
+SHIFTABLE_CAPS = 'audio/mpeg'
+
+class TimeShift:
+    """Plays a station through a ring file so it can be paused and rewound.
+
+    The capture pipeline (souphttpsrc ! decodebin2 ! fakesink) strips the
+    icecast metadata and writes the still compressed stream into the ring
+    from a buffer probe. The playback pipeline (appsrc ! decodebin2 !
+    audioconvert ! volume ! autoaudiosink) reads from any position still in
+    the ring. Only self-synchronising formats (MP3, AAC in ADTS) can start
+    at an arbitrary byte; for other streams onUnsupported is called. All
+    callbacks run on the main loop.
+    """
+
+    def __init__(self, filename, size, onPlaying, onError, onTag, onUnsupported):
+        self.log = logging.getLogger('radiotray')
+        self.filename = filename
+        self.size = size
+        self.onPlaying = onPlaying
+        self.onError = onError
+        self.onTag = onTag
+        self.onUnsupported = onUnsupported
+        # StreamRecorder that gets a copy of everything captured, if any
+        self.recorder = None
+
+        self.feedLock = threading.Lock()
+        self.ring = None
+        self.capture = None
+        self.playback = None
+        self.appsrc = None
+        self.paused = False
+        self.wanted = False
+        self.readPosition = 0
+        self.captureStarted = None
+        # ring positions and the tags that start there, oldest first
+        self.tagPositions = []
+        self.tags = []
+        self.lastTag = None
+
+    def isActive(self):
+        return self.capture is not None
+
+    def isPaused(self):
+        return self.isActive() and self.paused
+
+    def start(self, uri, volume=1.0):
+        self.stop()
+        self.ring = RingFile(self.filename, self.size)
+        self.paused = False
+        self.wanted = False
+        self.readPosition = 0
+        self.captureStarted = None
+        self.tagPositions = []
+        self.tags = []
+        self.lastTag = None
+
+        self.capture = gst.Pipeline("timeshift-capture")
+        source = gst.element_factory_make("souphttpsrc", "source")
+        source.set_property("location", uri)
+        source.set_property("user-agent", USER_AGENT)
+        source.set_property("iradio-mode", True)
+        demuxer = gst.element_factory_make("decodebin2", "demuxer")
+        demuxer.set_property("caps", gst.Caps(SHIFTABLE_CAPS + "; audio/x-raw-int; audio/x-raw-float"))
+        demuxer.connect("pad-added", self.capturePadAdded)
+        sink = gst.element_factory_make("fakesink", "sink")
+        sink.set_property("sync", False)
+        self.capture.add(source, demuxer, sink)
+        source.link(demuxer)
+        sink.get_pad("sink").add_buffer_probe(self.captured)
+        self.watch(self.capture, self.onCaptureMessage)
+
+        self.playback = gst.parse_launch("appsrc name=src ! decodebin2 ! audioconvert ! volume name=volume ! autoaudiosink")
+        self.appsrc = self.playback.get_by_name("src")
+        self.appsrc.set_property("max-bytes", CHUNK_SIZE * 16)
+        self.appsrc.connect("need-data", self.needData)
+        self.appsrc.connect("enough-data", self.enoughData)
+        self.playback.get_by_name("volume").set_property("volume", volume)
+        self.watch(self.playback, self.onPlaybackMessage)
+
+        self.log.info('Time-shifting %s', uri)
+        self.capture.set_state(gst.STATE_PLAYING)
+
+    def stop(self):
+        for pipeline in (self.playback, self.capture):
+            if pipeline is not None:
+                pipeline.set_state(gst.STATE_NULL)
+                pipeline.get_bus().remove_signal_watch()
+        self.playback = None
+        self.capture = None
+        self.appsrc = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def pause(self):
+        if self.isActive():
+            self.paused = True
+            self.playback.set_state(gst.STATE_PAUSED)
+
+    def play(self):
+        if self.isActive():
+            self.paused = False
+            self.playback.set_state(gst.STATE_PLAYING)
+
+    def rewind(self, seconds):
+        if not self.isActive():
+            return
+        with self.feedLock:
+            self.readPosition = max(self.readPosition - int(seconds * self.byteRate()), self.ring.oldest())
+        self.flush()
+
+    def live(self):
+        if not self.isActive():
+            return
+        with self.feedLock:
+            self.readPosition = self.ring.newest()
+        self.flush()
+
+    def delay(self):
+        """Seconds between what is played and the live broadcast."""
+        if not self.isActive():
+            return 0.0
+        return max(self.ring.newest() - self.readPosition, 0) / float(self.byteRate())
+
+    def byteRate(self):
+        if self.captureStarted is not None:
+            elapsed = time.time() - self.captureStarted
+            if elapsed > 10:
+                return max(int(self.ring.newest() / elapsed), 1)
+        return DEFAULT_BYTE_RATE
+
+    def setVolume(self, volume):
+        if self.isActive():
+            self.playback.get_by_name("volume").set_property("volume", volume)
+
+    def getVolume(self):
+        if self.isActive():
+            return self.playback.get_by_name("volume").get_property("volume")
+        return None
+
+    def watch(self, pipeline, callback):
+        bus = pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message", callback)
+
+    def flush(self):
+        # going through READY drops whatever appsrc and the decoder still hold
+        self.playback.set_state(gst.STATE_READY)
+        if self.paused:
+            self.playback.set_state(gst.STATE_PAUSED)
+        else:
+            self.playback.set_state(gst.STATE_PLAYING)
+
+    def capturePadAdded(self, demuxer, pad):
+        # streaming thread
+        caps = pad.get_caps()
+        if caps[0].get_name() != SHIFTABLE_CAPS:
+            self.log.info('Cannot time-shift %s', caps.to_string())
+            gobject.idle_add(self.unsupported)
+            return
+
+        self.appsrc.set_property("caps", caps)
+        pad.link(self.capture.get_by_name("sink").get_pad("sink"))
+        gobject.idle_add(self.startPlayback)
+
+    def captured(self, pad, buffer):
+        # streaming thread
+        if self.captureStarted is None:
+            self.captureStarted = time.time()
+        self.ring.write(buffer.data)
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.write(buffer.data)
+        self.feed()
+        return True
+
+    def needData(self, appsrc, length):
+        self.wanted = True
+        self.feed()
+
+    def enoughData(self, appsrc):
+        self.wanted = False
+
+    def feed(self):
+        with self.feedLock:
+            while self.wanted and self.appsrc is not None:
+                position, data = self.ring.read(self.readPosition, CHUNK_SIZE)
+                if len(data) == 0:
+                    break
+                self.readPosition = position + len(data)
+                self.checkTags(position)
+                self.appsrc.emit("push-buffer", gst.Buffer(data))
+
+    def checkTags(self, position):
+        index = bisect.bisect_right(self.tagPositions, position) - 1
+        if index >= 0 and self.tags[index] is not self.lastTag:
+            self.lastTag = self.tags[index]
+            gobject.idle_add(self.deliverTag, self.lastTag)
+
+    def startPlayback(self):
+        if self.playback is not None and not self.paused:
+            self.playback.set_state(gst.STATE_PLAYING)
+        # run once
+        return False
+
+    def unsupported(self):
+        if self.isActive():
+            self.stop()
+            self.onUnsupported()
+        return False
+
+    def deliverTag(self, metadata):
+        if self.isActive():
+            self.onTag(metadata)
+        return False
+
+    def onCaptureMessage(self, bus, message):
+        t = message.type
+        if t == gst.MESSAGE_TAG:
+            taglist = message.parse_tag()
+            metadata = {}
+            for key in taglist.keys():
+                metadata[key] = taglist[key]
+            if self.recorder is not None and ('artist' in metadata or 'title' in metadata):
+                self.recorder.split(metadata)
+            with self.feedLock:
+                # the tag applies from the next byte written
+                oldest = self.ring.oldest()
+                while len(self.tagPositions) > 1 and self.tagPositions[1] <= oldest:
+                    del self.tagPositions[0]
+                    del self.tags[0]
+                self.tagPositions.append(self.ring.newest())
+                self.tags.append(metadata)
+        elif t == gst.MESSAGE_ERROR:
+            err, debug = message.parse_error()
+            self.log.warn('Time-shift capture failed: %s', debug)
+            self.stop()
+            self.onError(debug)
+        elif t == gst.MESSAGE_EOS:
+            self.log.info('Time-shift capture reached the end of the stream')
+            self.stop()
+            self.onError("Radio station closed the stream")
+        return True
+
+    def onPlaybackMessage(self, bus, message):
+        t = message.type
+        if t == gst.MESSAGE_ERROR:
+            err, debug = message.parse_error()
+            self.log.warn('Time-shift playback failed: %s', debug)
+            self.stop()
+            self.onError(debug)
+        elif t == gst.MESSAGE_STATE_CHANGED and message.src is self.playback:
+            oldstate, newstate, pending = message.parse_state_changed()
+            if newstate == gst.STATE_PLAYING:
+                self.onPlaying()
+        return True
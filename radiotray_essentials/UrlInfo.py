@@ -20,11 +20,14 @@
 
 class UrlInfo(object):
 
-    def __init__(self, url, playlist, contentType, decoder = None):
+    def __init__(self, url, playlist, contentType, decoder = None, response = None, headers = None, notModified = False):
         self.url = url
         self.playlist = playlist
         self.contentType = contentType
         self.decoder = decoder
+        self.response = response
+        self.headers = headers
+        self.notModified = notModified
 
     def isPlaylist(self):
         return self.playlist
@@ -37,3 +40,19 @@ class UrlInfo(object):
 
     def getUrl(self):
         return self.url
+
+    def getHeader(self, name):
+        if self.headers is None:
+            return None
+        return self.headers.get(name)
+
+    def isNotModified(self):
+        return self.notModified
+
+    def getResponse(self):
+        return self.response
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+            self.response = None
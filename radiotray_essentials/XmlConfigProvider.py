@@ -43,10 +43,11 @@ class XmlConfigProvider:
         out_file.close()
 
 
-    def getConfigValue(self, name):
+    def getConfigValue(self, name, default=None):
         result = self.root.xpath("//option[@name=$var]/@value", var=name)
         if(len(result) >= 1):
             return result[0]
+        return default
 
 
     def setConfigValue(self, name, value):
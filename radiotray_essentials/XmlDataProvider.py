@@ -34,6 +34,11 @@ class XmlDataProvider:
         else: # if can't read, give error.
             raise Exception('Bookmarks file not found: ' + filename)
 
+        # name -> bookmark or group elements with that name, in document order;
+        # kept up to date by every change so no lookup has to search the tree
+        self.radios = {}
+        self.groups = {}
+
 
 
 
@@ -56,8 +61,73 @@ class XmlDataProvider:
             self.root.append(new_group)
             self.saveToFile()
 
+        self._buildIndexes()
         self.log.debug('Bookmarks file loaded with success')
 
+    def _key(self, name):
+        # lxml hands out str for ascii names and unicode otherwise, callers may pass utf-8
+        if isinstance(name, str):
+            try:
+                return name.decode('utf-8')
+            except UnicodeDecodeError:
+                pass
+        return name
+
+    def _buildIndexes(self):
+        self.radios = {}
+        self.groups = {}
+        for element in self.root.iter():
+            self._index(element)
+
+    def _position(self, element):
+        # path of child indexes from the root, orders elements like the document does
+        path = []
+        parent = element.getparent()
+        while parent is not None:
+            path.append(parent.index(element))
+            element = parent
+            parent = element.getparent()
+        path.reverse()
+        return path
+
+    def _index(self, element):
+        name = element.get('name')
+        if name is None or element.tag not in ('bookmark', 'group'):
+            return
+        index = self.radios if element.tag == 'bookmark' else self.groups
+        elements = index.get(self._key(name))
+        if elements is None:
+            index[self._key(name)] = [element]
+        elif element not in elements:
+            # duplicate names only come from hand edited files, keep them in document order
+            position = self._position(element)
+            at = 0
+            while at < len(elements) and self._position(elements[at]) < position:
+                at += 1
+            elements.insert(at, element)
+
+    def _unindex(self, element, name=None):
+        if name is None:
+            name = element.get('name')
+        if name is None or element.tag not in ('bookmark', 'group'):
+            return
+        index = self.radios if element.tag == 'bookmark' else self.groups
+        elements = index.get(self._key(name))
+        if elements is not None and element in elements:
+            elements.remove(element)
+            if len(elements) == 0:
+                del index[self._key(name)]
+
+    def _unindexTree(self, element):
+        for child in element.iter():
+            self._unindex(child)
+
+    def _first(self, index, name):
+        elements = index.get(self._key(name))
+        if elements is None:
+            return None
+        return elements[0]
+
 
 
     def saveToFile(self):
@@ -77,27 +147,34 @@ class XmlDataProvider:
   
     def listRadiosInGroup(self, group):
 
-        return self.root.xpath("//group[@name=$var]/bookmark/@name", var=group)
+        groups = self.groups.get(self._key(group), ())
+        if len(groups) == 1:
+            return [child.get('name') for child in groups[0].iterchildren('bookmark')]
+        # every group of that name, like //group[@name=...]/bookmark did
+        bookmarks = [child for element in groups for child in element.iterchildren('bookmark')]
+        bookmarks.sort(key=self._position)
+        return [child.get('name') for child in bookmarks]
 
     def getRadioUrl(self, name):
 
-        result = self.root.xpath("//bookmark[@name=$var]/@url", var=name)
-        if(len(result) >= 1):
-            return result[0]
+        radio = self._first(self.radios, name)
+        if radio is not None:
+            return radio.get('url')
 
     def addGroup(self, parent_group_name, new_group_name):
     
         # gettting parent group
         self.log.debug('Adding group %s to parent group %s ...', new_group_name, parent_group_name)
-        parent_group = self.root.xpath("//group[@name=$var]", var=parent_group_name)
+        parent_group = self._first(self.groups, parent_group_name)
         
         if parent_group != None:
-            group = self.root.xpath("//group[@name=$var]", var=new_group_name)
+            group = self._first(self.groups, new_group_name)
             
-            if group == None or len(group) == 0:
+            if group == None:
                 self.log.debug('Group is new. Saving with name %s', new_group_name)
-                new_group = etree.SubElement(parent_group[0], 'group')
+                new_group = etree.SubElement(parent_group, 'group')
                 new_group.set("name", unicode(new_group_name))
+                self._index(new_group)
                 self.saveToFile()                
                 return True        
             
@@ -114,7 +191,7 @@ class XmlDataProvider:
 
         self.log.info('Adding radio "%s" to group %s', name, group_name)
         self.log.debug('Radio URL: %s', url)
-        group = self.root.xpath("//group[@name=$var]", var=group_name)
+        group = self._first(self.groups, group_name)
 
 
         if group != None:
@@ -122,9 +199,10 @@ class XmlDataProvider:
             result = self._radioExists(name)
     
             if result is None:
-                radio = etree.SubElement(group[0], 'bookmark')
+                radio = etree.SubElement(group, 'bookmark')
                 radio.set("name", unicode(name))
                 radio.set("url", unicode(url))
+                self._index(radio)
                 self.log.debug('Radio added with success')
                 self.saveToFile()
                 return True
@@ -160,8 +238,10 @@ class XmlDataProvider:
                     self.log.warn('A radio with the name "%s" already exists.', newName)
                     radioAdded = False
                 else:
+                    self._unindex(result)
                     result.set("name", unicode(newName))
                     result.set("url", unicode(url))
+                    self._index(result)
                     self.saveToFile()
                     radioAdded = True
                     self.log.debug('Radio updated with success')
@@ -186,7 +266,9 @@ class XmlDataProvider:
                     self.log.warn('A group with the name "%s" already exists.', newName)
                     groupAdded = False
                 else:
+                    self._unindex(result)
                     result.set("name", unicode(newNameStr))
+                    self._index(result)
                     self.saveToFile()
                     groupAdded = True
                     self.log.debug('Group updated with success')
@@ -203,6 +285,7 @@ class XmlDataProvider:
         if radio != None:
             self.log.debug('Removing radio with name %s', name)
             radio.getparent().remove(radio)            
+            self._unindex(radio)
             self.log.info('Radio removed with success')
         else:
             group = self._groupExists(name)
@@ -210,6 +293,7 @@ class XmlDataProvider:
             if group != None:
                 self.log.debug('Removing group with name %s', name)
                 group.getparent().remove(group)
+                self._unindexTree(group)
                 self.log.info('Group removed with success')
                 
         self.saveToFile()
@@ -219,8 +303,8 @@ class XmlDataProvider:
 
         self.log.info('Moving "%s" from %s to %s ...', name, old_group_name, new_group_name)
 
-        old_group = self.root.xpath("//group[@name=$var]", var=old_group_name)
-        new_group = self.root.xpath("//group[@name=$var]", var=new_group_name)
+        old_group = self._first(self.groups, old_group_name)
+        new_group = self._first(self.groups, new_group_name)
 
         if old_group != None and new_group != None:
             radioXml = self._radioExists(name)
@@ -228,10 +312,12 @@ class XmlDataProvider:
             if radioXml is None:
                 self.log.error('Could not find a radio with the name "%s"', name)
             else:                                          
-                old_group[0].remove(radioXml)
-                radio = etree.SubElement(new_group[0], 'bookmark')
+                self._unindex(radioXml)
+                old_group.remove(radioXml)
+                radio = etree.SubElement(new_group, 'bookmark')
                 radio.set("name", name)
                 radio.set("url", radioXml.get('url'))
+                self._index(radio)
                 self.log.debug('%s moved with success', name)
                 self.saveToFile()
                 return True
@@ -250,20 +336,22 @@ class XmlDataProvider:
             previous = radio.getprevious()
 
             if previous != None:
-                index=self.root.xpath("count(//bookmark[@name=$var]/preceding-sibling::*)+1", var=name)                       
+                index=group.index(radio)+1
+                self._unindex(radio)
                 group.remove(radio)
                 group.insert(int(index)-2,radio)
+                self._index(radio)
                 self.log.debug('%s moved with success', name)
                 self.saveToFile()    
                 return True
         else:
             # could be a group?
-            group = self.root.xpath("//group[@name=$var]", var=name)
-            if group:
-                parent_group = group[0].getparent()                                
-                index=self.root.xpath("count(//group[@name=$var]/preceding-sibling::*)+1", var=name)                                       
-                parent_group.remove(group[0])
-                parent_group.insert(int(index)-2,group[0])     
+            group = self._first(self.groups, name)
+            if group is not None:
+                parent_group = group.getparent()                                
+                index=parent_group.index(group)+1
+                parent_group.remove(group)
+                parent_group.insert(int(index)-2,group)     
                 self.log.debug('%s moved with success', name)           
                 self.saveToFile()    
                 return True
@@ -280,20 +368,22 @@ class XmlDataProvider:
             next = radio.getnext()        
             if next != None:
                 group = radio.getparent()
-                index=self.root.xpath("count(//bookmark[@name=$var]/preceding-sibling::*)+1", var=name)
+                index=group.index(radio)+1
+                self._unindex(radio)
                 group.remove(radio)
                 group.insert(int(index),radio)
+                self._index(radio)
                 self.log.debug('%s moved with success', name)
                 self.saveToFile()
                 return True
         else:
             # could be a group?
-            group = self.root.xpath("//group[@name=$var]", var=name)
-            if group:
-                parent_group = group[0].getparent()                                
-                index=self.root.xpath("count(//group[@name=$var]/preceding-sibling::*)+1", var=name)                       
-                parent_group.remove(group[0])
-                parent_group.insert(int(index),group[0])
+            group = self._first(self.groups, name)
+            if group is not None:
+                parent_group = group.getparent()                                
+                index=parent_group.index(group)+1
+                parent_group.remove(group)
+                parent_group.insert(int(index),group)
                 self.log.debug('%s moved with success', name)
                 self.saveToFile()    
                 return True
@@ -331,22 +421,18 @@ class XmlDataProvider:
 
     
     def _radioExists(self, name):
-        radio = None
+        radio = self._first(self.radios, name)
 
-        try:
-            radio = self.root.xpath("//bookmark[@name=$var]", var=name)[0]
-        except IndexError, e:
+        if radio is None:
             # No radio was found
             self.log.warn('Could not find a radio with the name "%s".', name)
 
         return radio
         
     def _groupExists(self, name):
-        group = None
+        group = self._first(self.groups, name)
 
-        try:
-            group = self.root.xpath("//group[@name=$var]", var=name)[0]
-        except IndexError, e:
+        if group is None:
             # No group was found
             self.log.warn('Could not find a group with the name "%s".', name)
 
@@ -371,7 +457,7 @@ class XmlDataProvider:
         
 
     def getRootGroup(self):
-        return self.root.xpath("//group[@name='root']")[0]
+        return self.groups['root'][0]
         
         
     def updateElementGroup(self, element, group_name):
@@ -380,8 +466,10 @@ class XmlDataProvider:
         
         if group != None:
             old_group = element.getparent()
+            self._unindex(element)
             old_group.remove(element)
             group.append(element)
+            self._index(element)
             self.saveToFile()
         else:
             self.log.warn('Could not move element group')
@@ -17,45 +17,42 @@
 # along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##########################################################################
-import urllib2
 from lxml import etree
 from lxml import objectify
 from StringIO import StringIO
-from lib.common import USER_AGENT
 import logging
 
 class XspfPlaylistDecoder:
 
-    def __init__(self):
+    contentTypes = ('application/xspf+xml',)
+
+    def __init__(self, http):
+        self.http = http
         self.log = logging.getLogger('radiotray')
         self.log.debug('XSPF playlist decoder')
 
 
-    def isStreamValid(self, contentType, firstBytes):
+    def extractPlaylist(self,  url):
 
-        if('application/xspf+xml' in contentType):
-            self.log.info('Stream is readable by XSPF Playlist Decoder')
-            return True
-        else:
-            return False
-        
+        self.log.info('Downloading playlist...')
 
+        f = self.http.open(url)
+        try:
+            return self.decodePlaylist(f)
+        finally:
+            f.close()
 
-    def extractPlaylist(self,  url):
 
-        self.log.info('Downloading playlist...')
+    def decodePlaylist(self, data):
 
-        req = urllib2.Request(url)
-        req.add_header('User-Agent', USER_AGENT)
-        f = urllib2.urlopen(req)
-        str = f.read()
-        f.close()
+        if hasattr(data, 'read'):
+            data = data.read()
 
         self.log.info('Playlist downloaded')
         self.log.info('Decoding playlist...')
 
         parser = etree.XMLParser(recover=True)
-        root = etree.parse(StringIO(str),parser)
+        root = etree.parse(StringIO(data),parser)
 
         elements = root.xpath("//xspf:track/xspf:location",namespaces={'xspf':'http://xspf.org/ns/0/'})
 
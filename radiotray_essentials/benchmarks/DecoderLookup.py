@@ -0,0 +1,141 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+"""Compares the playlist decoder lookup with the old isStreamValid chain.
+
+Run from radiotray_essentials with: python -m benchmarks.DecoderLookup
+"""
+import logging
+import timeit
+from DecoderRegistry import DecoderRegistry
+from PlsPlaylistDecoder import PlsPlaylistDecoder
+from M3uPlaylistDecoder import M3uPlaylistDecoder
+from AsxPlaylistDecoder import AsxPlaylistDecoder
+from XspfPlaylistDecoder import XspfPlaylistDecoder
+from AsfPlaylistDecoder import AsfPlaylistDecoder
+from RamPlaylistDecoder import RamPlaylistDecoder
+
+NUMBER = 20000
+# best of, the lookups are short enough for the noise to matter
+REPEAT = 5
+
+# (name, content type, first bytes) as the probes see them
+PROBES = [
+    ('mp3 stream', 'audio/mpeg', '\xff\xfb\x90\x64' + '\x00\x55\xaa\x13' * 124),
+    ('aac stream', 'audio/aacp', '\xff\xf1\x50\x80' + '\x21\x1b\x94\x05' * 124),
+    ('pls', 'audio/x-scpls', '[playlist]\nNumberOfEntries=1\nFile1=http://example.com:8000/\n'),
+    ('pls as m3u', 'audio/x-mpegurl', '[playlist]\nNumberOfEntries=1\nFile1=http://example.com:8000/\n'),
+    ('m3u', 'audio/x-mpegurl', '#EXTM3U\n#EXTINF:-1,Station\nhttp://example.com:8000/\n'),
+    ('m3u as text', 'text/plain', '# station list\nhttp://example.com:8000/\n'),
+    ('asx', 'video/x-ms-asf', '<asx version="3.0"><entry><ref href="mms://example.com/"/></entry></asx>'),
+    ('asf reference', 'video/x-ms-asf', '[Reference]\nRef1=http://example.com/stream?MSWMExt=.asf\n'),
+    ('xspf', 'application/xspf+xml', '<?xml version="1.0"?><playlist version="1" xmlns="http://xspf.org/ns/0/">'),
+    ('ram', 'audio/x-pn-realaudio', 'rtsp://example.com/stream.rm\n'),
+]
+
+
+class OldDecoder:
+    """One link of the chain as it was before the registry."""
+
+    def __init__(self, name, check):
+        self.log = logging.getLogger('radiotray')
+        self.name = name
+        self.check = check
+
+    def isStreamValid(self, contentType, firstBytes):
+        if self.check(contentType, firstBytes):
+            self.log.info('Stream is readable by %s', self.name)
+            return True
+        return False
+
+
+def isPls(contentType, firstBytes):
+    return ('audio/x-scpls' in contentType or 'application/pls+xml' in contentType or
+            firstBytes.strip().lower().startswith('[playlist]'))
+
+def isM3u(contentType, firstBytes):
+    if 'audio/mpegurl' in contentType or 'audio/x-mpegurl' in contentType:
+        return True
+    for line in firstBytes.splitlines():
+        if line.startswith('http://'):
+            return True
+    return False
+
+def isAsx(contentType, firstBytes):
+    return (contentType in ('audio/x-ms-wax', 'video/x-ms-wvx', 'video/x-ms-asf', 'video/x-ms-wmv') and
+            firstBytes.strip().lower().startswith('<asx'))
+
+def isXspf(contentType, firstBytes):
+    return 'application/xspf+xml' in contentType
+
+def isAsf(contentType, firstBytes):
+    return 'video/x-ms-asf' in contentType and firstBytes.strip().lower().startswith('[reference]')
+
+def isRam(contentType, firstBytes):
+    return 'audio/x-pn-realaudio' in contentType or 'audio/vnd.rn-realaudio' in contentType
+
+OLD_CHAIN = [OldDecoder('PlsPlaylistDecoder', isPls), OldDecoder('M3uPlaylistDecoder', isM3u),
+             OldDecoder('AsxPlaylistDecoder', isAsx), OldDecoder('XspfPlaylistDecoder', isXspf),
+             OldDecoder('AsfPlaylistDecoder', isAsf), OldDecoder('RamPlaylistDecoder', isRam)]
+
+
+def oldLookup(contentType, firstBytes):
+    for decoder in OLD_CHAIN:
+        if decoder.isStreamValid(contentType, firstBytes):
+            return decoder
+    return None
+
+
+def oldName(contentType, firstBytes):
+    decoder = oldLookup(contentType, firstBytes)
+    if decoder is None:
+        return None
+    return decoder.name
+
+
+def buildRegistry():
+    registry = DecoderRegistry()
+    for decoderClass in [PlsPlaylistDecoder, AsxPlaylistDecoder, AsfPlaylistDecoder,
+                         XspfPlaylistDecoder, RamPlaylistDecoder, M3uPlaylistDecoder]:
+        registry.register(decoderClass(None))
+    return registry
+
+
+def newLookup(registry, contentType, firstBytes):
+    decoder = registry.lookup(contentType, firstBytes)
+    if decoder is None:
+        return None
+    return decoder.__class__.__name__
+
+
+def main():
+    registry = buildRegistry()
+
+    print '%-14s %-20s %-20s %9s %9s' % ('probe', 'old', 'new', 'old us', 'new us')
+    for name, contentType, firstBytes in PROBES:
+        old = oldName(contentType, firstBytes)
+        new = newLookup(registry, contentType, firstBytes)
+        oldTime = min(timeit.Timer(lambda: oldLookup(contentType, firstBytes)).repeat(REPEAT, NUMBER))
+        newTime = min(timeit.Timer(lambda: registry.lookup(contentType, firstBytes)).repeat(REPEAT, NUMBER))
+        print '%-14s %-20s %-20s %9.2f %9.2f' % (name, old, new,
+                                                oldTime * 1e6 / NUMBER, newTime * 1e6 / NUMBER)
+
+
+if __name__ == '__main__':
+    main()
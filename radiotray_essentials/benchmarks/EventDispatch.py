@@ -0,0 +1,165 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+"""Measures event dispatch throughput and what a waiting event holds on to.
+
+Events go through the EventManager dispatcher thread to a direct
+subscriber, to a subscriber behind an EventQueue like the curses thread,
+and as coalesced buffer updates. Allocations are counted as the growth
+of Python's container count while events wait, with the collector off.
+
+Run from radiotray_essentials with: python -m benchmarks.EventDispatch [-n events]
+"""
+import gc
+import time
+import threading
+from optparse import OptionParser
+from events.EventManager import EventManager
+from events.EventQueue import EventQueue
+from events.EventData import BufferData
+
+
+class Counter:
+
+    def __init__(self, expected):
+        self.expected = expected
+        self.count = 0
+        self.done = threading.Event()
+        self.release = None
+
+    def received(self, data):
+        if self.release is not None:
+            # hold the dispatcher until the allocations are counted
+            self.release.wait()
+            self.release = None
+        self.count += 1
+        if self.count >= self.expected:
+            self.done.set()
+
+
+def containers():
+    return gc.get_count()[0]
+
+
+def direct(events):
+    manager = EventManager()
+    counter = Counter(events)
+    manager.subscribe(EventManager.SONG_CHANGED, counter.received)
+    data = {'artist':'Artist', 'title':'Title'}
+
+    started = time.time()
+    for i in xrange(events):
+        manager.notify(EventManager.SONG_CHANGED, data)
+    notified = time.time()
+    counter.done.wait()
+    finished = time.time()
+    manager.close()
+    return notified - started, finished - started, counter.count
+
+
+def queued(events):
+    manager = EventManager()
+    queue = EventQueue()
+    counter = Counter(events)
+    manager.subscribe(EventManager.SONG_CHANGED, counter.received, queue)
+    data = {'artist':'Artist', 'title':'Title'}
+
+    started = time.time()
+    for i in xrange(events):
+        manager.notify(EventManager.SONG_CHANGED, data)
+    notified = time.time()
+    # the owner thread, draining as fast as it can
+    while counter.count < events:
+        for callback, data in queue.drain():
+            callback(data)
+    finished = time.time()
+    manager.close()
+    return notified - started, finished - started, counter.count
+
+
+def coalesced(events):
+    manager = EventManager()
+    queue = EventQueue()
+    counter = Counter(events)
+    manager.subscribe(EventManager.BUFFER_CHANGED, counter.received, queue)
+
+    started = time.time()
+    for i in xrange(events):
+        manager.notify(EventManager.BUFFER_CHANGED, BufferData.of(i % 101))
+    notified = time.time()
+    manager.waitIdle()
+    for callback, data in queue.drain():
+        callback(data)
+    finished = time.time()
+    manager.close()
+    return notified - started, finished - started, counter.count
+
+
+def held(events, behindQueue):
+    """Containers alive per event waiting for a stalled consumer."""
+    manager = EventManager()
+    queue = behindQueue and EventQueue() or None
+    counter = Counter(events + 1)
+    counter.release = threading.Event()
+    manager.subscribe(EventManager.SONG_CHANGED, counter.received, queue)
+    data = {'artist':'Artist', 'title':'Title'}
+
+    gc.collect()
+    gc.disable()
+    try:
+        if behindQueue:
+            # nobody drains the queue, the dispatcher itself runs free
+            before = containers()
+            for i in xrange(events):
+                manager.notify(EventManager.SONG_CHANGED, data)
+            manager.waitIdle()
+            after = containers()
+        else:
+            manager.notify(EventManager.SONG_CHANGED, data)
+            # wait for the dispatcher to block in the subscriber
+            while manager.queue.depth() > 0:
+                time.sleep(0.001)
+            before = containers()
+            for i in xrange(events):
+                manager.notify(EventManager.SONG_CHANGED, data)
+            after = containers()
+            counter.release.set()
+    finally:
+        gc.enable()
+    manager.close()
+    return (after - before) / float(events)
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--events', dest='events', type='int', default=100000, help='events per run')
+    (options, args) = parser.parse_args()
+    events = options.events
+
+    print '%-10s %12s %14s %12s %10s' % ('path', 'notify us', 'events/s', 'delivered', 'held')
+    for name, run, behindQueue in (('direct', direct, False), ('queued', queued, True),
+                                   ('coalesced', coalesced, None)):
+        notifying, total, delivered = run(events)
+        heldPerEvent = behindQueue is not None and '%.2f' % held(min(events, 10000), behindQueue) or '-'
+        print '%-10s %12.2f %14d %12d %10s' % (name, notifying * 1e6 / events, events / total,
+                                               delivered, heldPerEvent)
+
+
+if __name__ == '__main__':
+    main()
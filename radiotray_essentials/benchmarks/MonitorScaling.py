@@ -0,0 +1,181 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+"""Measures what StationMonitor pipelines cost per stream.
+
+Serves endless fake icecast streams from a local server process and
+follows increasing numbers of them, each count in a fresh process.
+Reports resident memory and CPU per stream and how many streams one core
+could follow at that rate.
+
+Run from radiotray_essentials with:
+    python -m benchmarks.MonitorScaling [-n 25,50,100,200,400] [-t seconds]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import subprocess
+import multiprocessing
+import BaseHTTPServer
+import SocketServer
+from optparse import OptionParser
+
+# 128 kbit/s, sent in quarter second slices
+BYTE_RATE = 16000
+METAINT = 8192
+# an MPEG audio frame header followed by silence
+FRAME = '\xff\xfb\x90\x64' + '\x00' * 413
+
+
+class StreamHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.0'
+    # bytes sent right away on connect, like an icecast burst-on-connect
+    burst = 0
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/mpeg')
+        if self.headers.get('Icy-MetaData') == '1':
+            self.send_header('icy-metaint', str(METAINT))
+            metaint = METAINT
+        else:
+            metaint = None
+        self.end_headers()
+
+        audio = (FRAME * (BYTE_RATE / len(FRAME) + 1))[:BYTE_RATE / 4]
+        audioLeft = metaint
+        song = 0
+        data = (FRAME * (self.burst / len(FRAME) + 1))[:self.burst] + audio
+        try:
+            while True:
+                if metaint is not None:
+                    parts = []
+                    while len(data) >= audioLeft:
+                        parts.append(data[:audioLeft])
+                        data = data[audioLeft:]
+                        song += 1
+                        meta = "StreamTitle='Artist - Song %d';" % (song / 10)
+                        meta += '\x00' * (-len(meta) % 16)
+                        parts.append(chr(len(meta) / 16) + meta)
+                        audioLeft = metaint
+                    parts.append(data)
+                    audioLeft -= len(data)
+                    data = ''.join(parts)
+                self.wfile.write(data)
+                time.sleep(0.25)
+                data = audio
+        except socket.error:
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StreamServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def serve(server):
+    server.serve_forever()
+
+
+def cpuTime():
+    times = os.times()
+    return times[0] + times[1]
+
+
+def measure(streams, port, seconds):
+    """Follows streams fake stations for seconds, in this process."""
+    import gobject
+    from StationMonitor import StationMonitor, STATE_PLAYING
+
+    gobject.threads_init()
+    # no stream limit and no memory budget, they are what is being measured
+    monitor = StationMonitor(None, workers=1, stagger=0.01, interval=1, stallTimeout=seconds,
+                             maxStreams=streams, memoryPerStream=sys.maxint)
+    residentBefore = monitor._residentMemory()
+    for index in range(streams):
+        station = monitor.add('station %d' % index, 'http://127.0.0.1:%d/%d' % (port, index))
+        station.stream = station.url
+        monitor.connect(station)
+    gobject.timeout_add_seconds(monitor.interval, monitor.sample)
+
+    loop = gobject.MainLoop()
+    # let them all connect, then measure a steady state
+    gobject.timeout_add_seconds(2, loop.quit)
+    loop.run()
+    cpuBefore = cpuTime()
+    started = time.time()
+    gobject.timeout_add_seconds(seconds, loop.quit)
+    loop.run()
+    elapsed = time.time() - started
+    cpu = (cpuTime() - cpuBefore) / elapsed
+
+    resident = monitor._residentMemory() - residentBefore
+    playing = len([station for station in monitor.stations if station.state == STATE_PLAYING])
+    monitor.stop()
+    return {'streams':streams, 'playing':playing, 'memory':resident, 'cpu':cpu}
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--streams', dest='streams', default='25,50,100,200,400',
+                      help='comma separated stream counts to measure')
+    parser.add_option('-t', '--time', dest='seconds', type='int', default=20, help='seconds to measure each count')
+    parser.add_option('--run', dest='run', type='int', help=None)
+    parser.add_option('--port', dest='port', type='int', help=None)
+    (options, args) = parser.parse_args()
+
+    if options.run is not None:
+        # child: one count, the result as json on stdout
+        print json.dumps(measure(options.run, options.port, options.seconds))
+        return
+
+    server = StreamServer(('127.0.0.1', 0), StreamHandler)
+    port = server.server_address[1]
+    # in its own process, the serving threads must not count as monitor CPU
+    serverProcess = multiprocessing.Process(target=serve, args=(server,))
+    serverProcess.daemon = True
+    serverProcess.start()
+
+    print '%8s %8s %10s %10s %8s %10s %14s' % ('streams', 'playing', 'memory MB', 'KB/stream',
+                                              'cpu %', 'cpu %/str', 'streams/core')
+    try:
+        for streams in [int(count) for count in options.streams.split(',')]:
+            child = subprocess.Popen([sys.executable, '-m', 'benchmarks.MonitorScaling', '--run', str(streams),
+                                      '--port', str(port), '--time', str(options.seconds)], stdout=subprocess.PIPE)
+            output = child.communicate()[0]
+            if child.returncode != 0:
+                print '%8d failed' % streams
+                break
+            result = json.loads(output.strip().splitlines()[-1])
+            perStream = result['cpu'] / max(result['playing'], 1)
+            print '%8d %8d %10.1f %10.1f %8.1f %10.3f %14s' % (
+                streams, result['playing'], result['memory'] / 1048576.0,
+                result['memory'] / 1024.0 / max(result['playing'], 1), result['cpu'] * 100, perStream * 100,
+                perStream > 0 and int(1 / perStream) or '-')
+    finally:
+        serverProcess.terminate()
+
+
+if __name__ == '__main__':
+    main()
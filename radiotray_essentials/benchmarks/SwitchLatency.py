@@ -0,0 +1,166 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+"""Measures how long a station switch takes and what it allocates.
+
+Switches a playbin2 back and forth between two fake streams served from
+a local process, the way the player does it: through READY, which keeps
+the audio sink, or through NULL, which rebuilds everything. For every
+switch it records the time until the pipeline is PLAYING again, the
+GStreamer elements created and the Python objects left behind. The
+player records the same latency in its stats as firstAudio.<path>.
+
+Run from radiotray_essentials with:
+    python -m benchmarks.SwitchLatency [-n switches] [--sink autoaudiosink]
+"""
+import gc
+import time
+import multiprocessing
+from optparse import OptionParser
+import pygst
+pygst.require("0.10")
+import gst
+import gobject
+from lib.Telemetry import Histogram
+from benchmarks.MonitorScaling import StreamServer, StreamHandler, serve
+
+# the player's default buffer size and marks
+BUFFER_SIZE = 164000
+BUFFER_HIGH_MARK = 100
+
+
+class BurstHandler(StreamHandler):
+    # enough for the buffer to fill at once, so the switch itself is measured
+    burst = BUFFER_SIZE * 2
+
+
+class SwitchRun:
+    """Switches one pipeline count times through state, then quits loop."""
+
+    def __init__(self, loop, sink, urls, state, count):
+        self.loop = loop
+        self.urls = urls
+        self.state = state
+        self.count = count
+        self.switches = 0
+        self.latency = Histogram()
+        # every element made so far, and those made by the measured switches
+        self.elements = 0
+        self.elementsBefore = 0
+        self.created = 0
+        self.objects = 0
+        self.started = None
+        self.objectsBefore = None
+
+        self.player = gst.element_factory_make("playbin2", "player")
+        self.player.set_property("video-sink", gst.element_factory_make("fakesink", "video"))
+        audioSink = gst.element_factory_make(sink, "audio")
+        if sink == 'fakesink':
+            audioSink.set_property("sync", True)
+        self.player.set_property("audio-sink", audioSink)
+        self.player.set_property("buffer-size", BUFFER_SIZE)
+        self.player.connect("element-added", self.elementAdded)
+        bus = self.player.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message", self.onMessage)
+
+    def elementAdded(self, bin, element):
+        self.elements += 1
+        if isinstance(element, gst.Bin):
+            element.connect("element-added", self.elementAdded)
+
+    def switch(self):
+        gc.collect()
+        self.objectsBefore = len(gc.get_objects())
+        self.elementsBefore = self.elements
+        self.started = time.time()
+        self.player.set_state(self.state)
+        self.player.set_property("uri", self.urls[self.switches % len(self.urls)])
+        # buffer before starting playback, like the player
+        self.player.set_state(gst.STATE_PAUSED)
+        return False
+
+    def onMessage(self, bus, message):
+        t = message.type
+        if t == gst.MESSAGE_BUFFERING:
+            if message.structure['buffer-percent'] >= BUFFER_HIGH_MARK and self.started is not None:
+                self.player.set_state(gst.STATE_PLAYING)
+        elif t == gst.MESSAGE_STATE_CHANGED and message.src is self.player:
+            oldstate, newstate, pending = message.parse_state_changed()
+            if newstate == gst.STATE_PLAYING and self.started is not None:
+                self.switched()
+        elif t == gst.MESSAGE_ERROR:
+            err, debug = message.parse_error()
+            print 'Switch failed: %s' % debug
+            self.loop.quit()
+        return True
+
+    def switched(self):
+        elapsed = time.time() - self.started
+        self.started = None
+        gc.collect()
+        # the first start builds what later switches reuse, it is not measured
+        if self.switches > 0:
+            self.latency.observe(elapsed)
+            self.created += self.elements - self.elementsBefore
+            self.objects += len(gc.get_objects()) - self.objectsBefore
+        self.switches += 1
+        if self.switches > self.count:
+            self.player.set_state(gst.STATE_NULL)
+            self.loop.quit()
+        else:
+            # play a little before switching on
+            gobject.timeout_add(500, self.switch)
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--switches', dest='switches', type='int', default=20, help='switches per path')
+    parser.add_option('--sink', dest='sink', default='fakesink', help='audio sink to switch with')
+    (options, args) = parser.parse_args()
+
+    gobject.threads_init()
+    server = StreamServer(('127.0.0.1', 0), BurstHandler)
+    serverProcess = multiprocessing.Process(target=serve, args=(server,))
+    serverProcess.daemon = True
+    serverProcess.start()
+    port = server.server_address[1]
+    urls = ['http://127.0.0.1:%d/a' % port, 'http://127.0.0.1:%d/b' % port]
+
+    print '%-6s %8s %8s %8s %8s %8s %12s %12s' % ('path', 'switches', 'mean ms', 'p50 ms', 'p90 ms', 'max ms',
+                                                 'elements', 'py objects')
+    try:
+        for name, state in (('null', gst.STATE_NULL), ('ready', gst.STATE_READY)):
+            loop = gobject.MainLoop()
+            run = SwitchRun(loop, options.sink, urls, state, options.switches)
+            gobject.idle_add(run.switch)
+            loop.run()
+            measured = run.switches - 1
+            if measured < 1:
+                continue
+            latency = run.latency.snapshot()
+            print '%-6s %8d %8.1f %8s %8s %8.1f %12.1f %12.1f' % (
+                name, measured, latency['mean'] * 1000, int(latency['p50'] * 1000), int(latency['p90'] * 1000),
+                latency['max'] * 1000, run.created / float(measured), run.objects / float(measured))
+    finally:
+        serverProcess.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+
+class EventData(object):
+    """Event payload with fixed fields that reads like the dicts it replaces.
+
+    Subscribers keep using data['state'], 'state' in data, data.keys()
+    and dict(data). Instances are shared between events, treat them as
+    read-only.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __eq__(self, other):
+        return dict(self) == dict(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def keys(self):
+        return list(self.__slots__)
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.__slots__]
+
+    def get(self, key, default=None):
+        if key not in self.__slots__:
+            return default
+        return getattr(self, key)
+
+
+class StateData(EventData):
+    __slots__ = ('state',)
+
+    def __init__(self, state):
+        self.state = state
+
+StateData.PLAYING = StateData('playing')
+StateData.PAUSED = StateData('paused')
+
+
+class BufferData(EventData):
+    __slots__ = ('buffer',)
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    @staticmethod
+    def of(percent):
+        """Returns the shared payload for a fill level of 0 to 100 percent."""
+        if 0 <= percent <= 100:
+            return BUFFER_LEVELS[percent]
+        return BufferData(percent)
+
+BUFFER_LEVELS = tuple([BufferData(percent) for percent in range(101)])
+
+
+class ErrorData(EventData):
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+
+
+class NotificationData(EventData):
+    __slots__ = ('title', 'message', 'icon')
+
+    def __init__(self, title, message, icon=None):
+        self.title = title
+        self.message = message
+        self.icon = icon
@@ -0,0 +1,136 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import json
+import time
+import ctypes
+import ctypes.util
+import threading
+import logging
+from EventData import StateData, BufferData, ErrorData, NotificationData
+
+# bytes collected before they go to disk
+WRITE_BUFFER_SIZE = 64 * 1024
+# seconds between two flushes, so a crash loses little
+FLUSH_INTERVAL = 5
+
+# turns the recorded dicts back into the payloads the player sends
+PAYLOADS = {'state_changed':lambda d: StateData(d.get('state')),
+            'buffer_changed':lambda d: BufferData.of(d.get('buffer')),
+            'station_error':lambda d: ErrorData(d.get('error')),
+            'notification':lambda d: NotificationData(d.get('title'), d.get('message'), d.get('icon'))}
+
+# clock_gettime(2) clock id
+CLOCK_MONOTONIC = 1
+
+class Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def monotonicClock():
+    """Returns a function giving CLOCK_MONOTONIC seconds, or None where there is no clock_gettime."""
+    try:
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1', use_errno=True)
+        clock_gettime = librt.clock_gettime
+    except (OSError, AttributeError):
+        return None
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(Timespec)]
+
+    def monotonic():
+        timespec = Timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(timespec)) != 0:
+            raise OSError(ctypes.get_errno(), 'clock_gettime failed')
+        return timespec.tv_sec + timespec.tv_nsec * 1e-9
+    return monotonic
+
+
+class EventJournal:
+    """Appends every event to a JSONL file, one {"t", "e", "d"} object per line.
+
+    t is the number of seconds since the journal was opened, e the event
+    name and d its payload. Values JSON cannot hold are written as
+    strings. t comes from the monotonic clock, so setting the system
+    clock neither stretches nor reorders a replay; where there is none the
+    wall clock is used and t is only kept from going backwards.
+    """
+
+    def __init__(self, filename):
+        self.log = logging.getLogger('radiotray')
+        self.lock = threading.Lock()
+        self.out_file = open(filename, 'a', WRITE_BUFFER_SIZE)
+        self.clock = monotonicClock() or time.time
+        self.started = self.clock()
+        self.last = 0.0
+        self.flushed = self.started
+
+    def record(self, event, data):
+        now = self.clock()
+        with self.lock:
+            if self.out_file is None:
+                return
+            # only the wall clock fallback can go back, keep the journal ordered anyway
+            self.last = max(now - self.started, self.last)
+            try:
+                self.out_file.write(json.dumps({'t':round(self.last, 4), 'e':event, 'd':dict(data)},
+                                               separators=(',', ':'), default=str) + '\n')
+                if now - self.flushed > FLUSH_INTERVAL:
+                    self.out_file.flush()
+                    self.flushed = now
+            except (IOError, TypeError, ValueError), e:
+                self.log.warn('Could not journal %s: %s', event, str(e))
+
+    def close(self):
+        with self.lock:
+            if self.out_file is not None:
+                self.out_file.close()
+                self.out_file = None
+
+
+def readJournal(filename):
+    """Yields (seconds, event, data) for every event in the journal."""
+    in_file = open(filename)
+    try:
+        for line in in_file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            event = str(entry['e'])
+            data = entry['d']
+            if event in PAYLOADS:
+                data = PAYLOADS[event](data)
+            yield entry['t'], event, data
+    finally:
+        in_file.close()
+
+
+def replay(filename, eventManager, realtime=True, speed=1.0):
+    """Feeds a journal into eventManager, as recorded or as fast as possible.
+
+    Returns the number of events sent.
+    """
+    count = 0
+    started = time.time()
+    for seconds, event, data in readJournal(filename):
+        if realtime:
+            delay = started + seconds / speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        eventManager.notify(event, data)
+        count += 1
+    return count
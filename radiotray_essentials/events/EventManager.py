@@ -20,6 +20,13 @@
 ##########################################################################
 
 
+import logging
+import threading
+from EventQueue import EventQueue, QueuedCallback
+from WeakCallback import WeakCallback
+from EventProfiler import EventProfiler, ProfiledCallback
+from EventJournal import EventJournal
+
 class EventManager:
 
     STATE_CHANGED = 'state_changed'
@@ -30,19 +37,154 @@ class EventManager:
     BOOKMARKS_RELOADED = 'bookmarks_reloaded'
     NOTIFICATION = 'notification'
     BUFFER_CHANGED = 'buffer_changed'
+    STREAM_INFO_CHANGED = 'stream_info_changed'
+
+    # delivery order when events wait, lower goes first
+    PRIORITIES = {STATION_ERROR:0, STATE_CHANGED:0, SONG_CHANGED:1, NOTIFICATION:1, BOOKMARKS_CHANGED:1,
+                  BOOKMARKS_RELOADED:1, VOLUME_CHANGED:2, BUFFER_CHANGED:2, STREAM_INFO_CHANGED:3}
+    # only the latest value of these matters, a newer one replaces the one still waiting
+    COALESCED = (BUFFER_CHANGED, VOLUME_CHANGED)
 
     def __init__(self):
 
-        
-        self.observersMap = {self.STATE_CHANGED:[], self.SONG_CHANGED:[], self.BOOKMARKS_CHANGED:[], self.STATION_ERROR:[], self.VOLUME_CHANGED:[], self.BOOKMARKS_RELOADED:[], self.NOTIFICATION:[], self.BUFFER_CHANGED:[] }
-        
+        self.log = logging.getLogger('radiotray')
+        # event -> tuple of subscribers, replaced as a whole under the lock so notify() needs none;
+        # reentrant because a collected subscriber can be pruned from within a change
+        self.lock = threading.RLock()
+        self.observersMap = {self.STATE_CHANGED:(), self.SONG_CHANGED:(), self.BOOKMARKS_CHANGED:(), self.STATION_ERROR:(), self.VOLUME_CHANGED:(), self.BOOKMARKS_RELOADED:(), self.NOTIFICATION:(), self.BUFFER_CHANGED:(), self.STREAM_INFO_CHANGED:() }
+
+        # notify() only queues, subscribers are called from the dispatcher thread
+        self.queue = EventQueue()
+        # set while subscribers are profiled, see enableProfiling()
+        self.profiler = None
+        # set while events are journaled, see startJournal()
+        self.journal = None
+        self.thread = threading.Thread(target=self.dispatch, name='events')
+        self.thread.daemon = True
+        self.thread.start()
     
     def getObserversMap(self):
         return self.observersMap
+
+    def subscribe(self, event, callback, queue=None):
+        """Subscribes callback, bound methods are only weakly referenced."""
+        observer = WeakCallback(callback, lambda ref: self.prune(event))
+        if queue is not None:
+            observer = QueuedCallback(queue, observer, self.PRIORITIES.get(event, 1), event in self.COALESCED)
+        with self.lock:
+            if self.profiler is not None:
+                observer = self.profile(event, observer)
+            self.observersMap[event] = self.observersMap[event] + (observer,)
+
+    def unsubscribe(self, event, callback):
+        with self.lock:
+            observers = self.observersMap[event]
+            remaining = tuple([observer for observer in observers if not observer.matches(callback)])
+            self.observersMap[event] = remaining
+        return len(remaining) < len(observers)
+
+    def prune(self, event):
+        with self.lock:
+            self.observersMap[event] = tuple([observer for observer in self.observersMap[event] if observer.isAlive()])
     
     def notify(self, event, data):
-        
-        observersList = self.observersMap[event]
-        
-        for callback in observersList:
-            callback(data)
+        self.queue.put(event, data, self.PRIORITIES.get(event, 1), event in self.COALESCED)
+
+    def notifyJournaled(self, event, data):
+        self.journal.record(event, data)
+        EventManager.notify(self, event, data)
+
+    def startJournal(self, filename):
+        """Appends every event to filename until stopJournal(), see EventJournal."""
+        with self.lock:
+            if self.journal is not None:
+                self.journal.close()
+            self.journal = EventJournal(filename)
+            self.notify = self.notifyJournaled
+
+    def stopJournal(self):
+        with self.lock:
+            if self.journal is None:
+                return
+            del self.notify
+            self.journal.close()
+            self.journal = None
+
+    def dispatch(self):
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                break
+            try:
+                self.deliver(entry[0], entry[1])
+            finally:
+                self.queue.done()
+
+    def waitIdle(self, timeout=None):
+        """Waits until every event notified so far reached its subscribers."""
+        return self.queue.join(timeout)
+
+    def deliver(self, event, data):
+        for callback in self.observersMap[event]:
+            try:
+                callback(data)
+            except Exception:
+                self.log.exception('Subscriber of %s failed', event)
+
+    def deliverProfiled(self, event, data):
+        self.profiler.event(event)
+        EventManager.deliver(self, event, data)
+
+    def enableProfiling(self, budget=0.05):
+        """Times every subscriber and warns about those taking longer than budget seconds.
+
+        Subscribers are wrapped and the dispatcher switches to a counting
+        deliver, with profiling off none of this costs anything.
+        """
+        with self.lock:
+            if self.profiler is not None:
+                self.profiler.budget = budget
+                return
+            self.profiler = EventProfiler(budget)
+            for event, observers in self.observersMap.items():
+                self.observersMap[event] = tuple([self.profile(event, observer) for observer in observers])
+            self.deliver = self.deliverProfiled
+
+    def disableProfiling(self):
+        with self.lock:
+            if self.profiler is None:
+                return
+            for event, observers in self.observersMap.items():
+                self.observersMap[event] = tuple([self.unprofile(observer) for observer in observers])
+            del self.deliver
+            self.profiler = None
+
+    def profile(self, event, observer):
+        if isinstance(observer, QueuedCallback):
+            # time the call on the owner's thread, not the queueing
+            observer.callback = ProfiledCallback(event, observer.callback, self.profiler)
+            return observer
+        return ProfiledCallback(event, observer, self.profiler)
+
+    def unprofile(self, observer):
+        if isinstance(observer, QueuedCallback):
+            if isinstance(observer.callback, ProfiledCallback):
+                observer.callback = observer.callback.callback
+            return observer
+        if isinstance(observer, ProfiledCallback):
+            return observer.callback
+        return observer
+
+    def getProfile(self):
+        """Returns the profiling snapshot, None while profiling is off."""
+        profiler = self.profiler
+        if profiler is None:
+            return None
+        return profiler.snapshot()
+
+    def getQueueStats(self):
+        return self.queue.stats()
+
+    def close(self):
+        self.stopJournal()
+        self.queue.close()
@@ -19,6 +19,7 @@
 ##########################################################################
 
 import EventManager
+from EventData import NotificationData
 
 class EventMngNotificationWrapper:
 
@@ -28,7 +29,7 @@ class EventMngNotificationWrapper:
 
 
     def notify(self, title, message):
-        self.eventManager.notify(self.eventManager.NOTIFICATION, {'title': title, 'message':message})
+        self.eventManager.notify(self.eventManager.NOTIFICATION, NotificationData(title, message))
 
     def notify_icon(self, title, message, icon):
-        self.eventManager.notify(self.eventManager.NOTIFICATION, {'title': title, 'message':message, 'icon':icon})
+        self.eventManager.notify(self.eventManager.NOTIFICATION, NotificationData(title, message, icon))
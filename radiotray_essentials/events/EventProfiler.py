@@ -0,0 +1,87 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import time
+import threading
+import logging
+from lib.Telemetry import Histogram
+
+class EventProfiler:
+    """Latency histograms per event and per subscriber, and a warning for slow ones.
+
+    Only used while profiling is switched on; EventManager then wraps every
+    subscriber in a ProfiledCallback.
+    """
+
+    def __init__(self, budget=0.05):
+        self.log = logging.getLogger('radiotray')
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.events = {}
+        # event -> latency of all its subscribers together, callback name -> latency
+        self.eventLatency = {}
+        self.callbackLatency = {}
+
+    def event(self, event):
+        with self.lock:
+            self.events[event] = self.events.get(event, 0) + 1
+
+    def observe(self, event, name, seconds):
+        with self.lock:
+            for histograms, key in ((self.eventLatency, event), (self.callbackLatency, name)):
+                histogram = histograms.get(key)
+                if histogram is None:
+                    histogram = histograms[key] = Histogram()
+                histogram.observe(seconds)
+        if seconds > self.budget:
+            self.log.warn('Slow subscriber %s took %.1f ms for %s', name, seconds * 1000, event)
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = max(time.time() - self.started, 1e-6)
+            events = dict((event, {'count':count, 'perSecond':round(count / elapsed, 2)})
+                          for event, count in self.events.iteritems())
+            return {'events':events,
+                    'eventLatency':dict((key, h.snapshot()) for key, h in self.eventLatency.iteritems()),
+                    'callbackLatency':dict((key, h.snapshot()) for key, h in self.callbackLatency.iteritems())}
+
+
+class ProfiledCallback(object):
+    """Times a subscriber callback and reports it to an EventProfiler."""
+    __slots__ = ('event', 'callback', 'profiler', 'name')
+
+    def __init__(self, event, callback, profiler):
+        self.event = event
+        self.callback = callback
+        self.profiler = profiler
+        self.name = callback.name()
+
+    def __call__(self, data):
+        started = time.time()
+        try:
+            return self.callback(data)
+        finally:
+            self.profiler.observe(self.event, self.name, time.time() - started)
+
+    def isAlive(self):
+        return self.callback.isAlive()
+
+    def matches(self, callback):
+        return self.callback.matches(callback)
@@ -0,0 +1,158 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import time
+import threading
+from collections import deque
+
+class EventQueue:
+    """Thread-safe event queue with priorities and latest-value-wins slots.
+
+    put() never blocks. Items with a lower priority number come out first.
+    A coalesced put replaces the value still waiting under the same key
+    instead of queueing another one, so high rate events like buffer
+    updates cannot pile up behind a slow consumer. get() and drain() hand
+    out the entries themselves, [key, value] lists, so a put allocates
+    nothing else. A consumer that takes entries with get() calls done()
+    once it handled each, so join() can tell when everything was handled.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        # priority -> entries [key, value], oldest first
+        self.queues = {}
+        # key -> entry still waiting in one of the queues
+        self.pending = {}
+        self.size = 0
+        # entries handed out by get() and not done() yet
+        self.busy = 0
+        self.closed = False
+        self.queued = 0
+        self.coalesced = 0
+        self.maxDepth = 0
+
+    def put(self, key, value, priority=0, coalesce=False):
+        with self.condition:
+            if coalesce:
+                entry = self.pending.get(key)
+                if entry is not None:
+                    entry[1] = value
+                    self.coalesced += 1
+                    return
+            entry = [key, value]
+            if coalesce:
+                self.pending[key] = entry
+            queue = self.queues.get(priority)
+            if queue is None:
+                queue = self.queues[priority] = deque()
+            queue.append(entry)
+            self.size += 1
+            self.queued += 1
+            self.maxDepth = max(self.maxDepth, self.size)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """Returns the next [key, value], or None once closed or after timeout seconds."""
+        with self.condition:
+            if self.size == 0 and not self.closed:
+                self.condition.wait(timeout)
+            if self.size == 0:
+                return None
+            self.busy += 1
+            return self._pop()
+
+    def done(self):
+        """Marks an entry from get() as handled."""
+        with self.condition:
+            self.busy -= 1
+            if self.busy == 0 and self.size == 0:
+                self.condition.notifyAll()
+
+    def join(self, timeout=None):
+        """Waits until the queue is empty and every entry taken with get() is done.
+
+        Returns False if that did not happen within timeout seconds.
+        """
+        deadline = timeout is not None and time.time() + timeout
+        with self.condition:
+            while self.size > 0 or self.busy > 0:
+                remaining = None
+                if deadline:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                self.condition.wait(remaining)
+            return True
+
+    def drain(self):
+        """Returns everything waiting, in delivery order, without blocking."""
+        with self.condition:
+            items = []
+            while self.size > 0:
+                items.append(self._pop())
+            return items
+
+    def depth(self):
+        with self.condition:
+            return self.size
+
+    def stats(self):
+        with self.condition:
+            return {'depth':self.size, 'maxDepth':self.maxDepth, 'queued':self.queued, 'coalesced':self.coalesced}
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notifyAll()
+
+    def _pop(self):
+        for priority in sorted(self.queues):
+            queue = self.queues[priority]
+            if len(queue) > 0:
+                entry = queue.popleft()
+                if self.pending.get(entry[0]) is entry:
+                    del self.pending[entry[0]]
+                self.size -= 1
+                return entry
+
+
+class QueuedCallback(object):
+    """Stands in for a callback in the observers and queues the event instead.
+
+    The callback is the key, so coalescing works per subscriber, and the
+    owner of the queue delivers the events on its own thread, e.g.
+    for callback, data in queue.drain(): callback(data)
+    """
+    __slots__ = ('queue', 'callback', 'priority', 'coalesce')
+
+    def __init__(self, queue, callback, priority=0, coalesce=False):
+        self.queue = queue
+        # usually a WeakCallback
+        self.callback = callback
+        self.priority = priority
+        self.coalesce = coalesce
+
+    def __call__(self, data):
+        self.queue.put(self.callback, data, self.priority, self.coalesce)
+
+    def isAlive(self):
+        return self.callback.isAlive()
+
+    def matches(self, callback):
+        return self.callback.matches(callback)
@@ -25,16 +25,18 @@ class EventSubscriber:
     
         self.eventManager = eventManager
 
-    def bind(self, event, callback):
-    
-        observersList = self.eventManager.getObserversMap()[event]
-        observersList.append(callback)
+    def bind(self, event, callback, queue=None):
+        """Subscribes callback to event.
+
+        Without a queue callback runs on the event dispatcher thread. With an
+        EventQueue the event is queued there and the owner of the queue
+        calls callback on its own thread. Bound methods are held weakly and
+        dropped once their object is gone.
+        """
+        self.eventManager.subscribe(event, callback, queue)
         
         
     def unbind(self, event, observer):
     
-        observersList = self.eventManager.getObserversMap()[event]
-        try:
-            observersList.remove(observer)
-        except:
-            print "no observer in list"
\ No newline at end of file
+        if not self.eventManager.unsubscribe(event, observer):
+            print "no observer in list"
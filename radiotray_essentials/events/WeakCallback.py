@@ -0,0 +1,56 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import weakref
+
+class WeakCallback(object):
+    """Calls a function, or a bound method without keeping its object alive.
+
+    onDead is called with the weak reference once the object of a bound
+    method is collected, so the owner can drop the subscription.
+    """
+    __slots__ = ('obj', 'func')
+
+    def __init__(self, callback, onDead=None):
+        self.obj = None
+        self.func = callback
+        if getattr(callback, 'im_self', None) is not None:
+            self.obj = weakref.ref(callback.im_self, onDead)
+            self.func = callback.im_func
+
+    def __call__(self, data):
+        if self.obj is None:
+            return self.func(data)
+        obj = self.obj()
+        if obj is not None:
+            return self.func(obj, data)
+
+    def isAlive(self):
+        return self.obj is None or self.obj() is not None
+
+    def matches(self, callback):
+        if self.obj is None:
+            return self.func == callback
+        return getattr(callback, 'im_func', None) is self.func and callback.im_self is self.obj()
+
+    def name(self):
+        if self.obj is None:
+            return getattr(self.func, '__name__', repr(self.func))
+        obj = self.obj()
+        return '%s.%s' % (obj.__class__.__name__ if obj is not None else '?', self.func.__name__)
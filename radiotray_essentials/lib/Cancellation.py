@@ -0,0 +1,85 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import socket
+import threading
+
+class Cancellation(object):
+    """Lets one thread abort the HTTP requests another thread makes on its behalf.
+
+    HttpClient registers every connection it opens for a cancellation.
+    cancel() shuts their sockets down, which wakes up a blocked connect()
+    or read(), and makes new requests fail right away. Cancelling also
+    cancels the children, e.g. the probes of a resolution job.
+    """
+
+    def __init__(self, parent=None):
+        self.cancelLock = threading.Lock()
+        self.cancelled = False
+        self.conns = set()
+        self.children = []
+        if parent is not None:
+            parent.adopt(self)
+
+    def adopt(self, child):
+        with self.cancelLock:
+            cancelled = self.cancelled
+            if not cancelled:
+                self.children.append(child)
+        if cancelled:
+            child.cancel()
+
+    def isCancelled(self):
+        return self.cancelled
+
+    def cancel(self):
+        with self.cancelLock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            conns = list(self.conns)
+            children = self.children
+            self.children = []
+        for conn in conns:
+            abort(conn)
+        for child in children:
+            child.cancel()
+
+    def register(self, conn):
+        """Returns False, and aborts conn, when cancelled already."""
+        with self.cancelLock:
+            if not self.cancelled:
+                self.conns.add(conn)
+                return True
+        abort(conn)
+        return False
+
+    def unregister(self, conn):
+        with self.cancelLock:
+            self.conns.discard(conn)
+
+
+def abort(conn):
+    conn.aborted = True
+    sock = conn.sock
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
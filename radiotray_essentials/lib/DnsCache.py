@@ -0,0 +1,133 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import socket
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+# entries kept besides the prewarmed hosts, for playlist and mirror hosts
+PREWARM_HEADROOM = 256
+
+class DnsCache:
+    """Process wide cache in front of socket.getaddrinfo.
+
+    The system resolver does not tell us record TTLs, so answers are kept
+    for a fixed ttl and failed lookups for negativeTtl. Answers are cached
+    per host, the port of each request is put back into the addresses.
+    Only affects lookups made from Python; gstreamer resolves on its own.
+    """
+
+    def __init__(self, ttl=300, negativeTtl=30, maxEntries=256):
+        self.log = logging.getLogger('radiotray')
+        self.ttl = ttl
+        self.negativeTtl = negativeTtl
+        self.maxEntries = maxEntries
+        self.lock = threading.Lock()
+        # (host, family, socktype, proto, flags) -> (expires, addresses or gaierror)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.negativeHits = 0
+        self.originalGetaddrinfo = None
+
+    def install(self):
+        if self.originalGetaddrinfo is None:
+            self.originalGetaddrinfo = socket.getaddrinfo
+            socket.getaddrinfo = self.getaddrinfo
+
+    def uninstall(self):
+        if self.originalGetaddrinfo is not None:
+            socket.getaddrinfo = self.originalGetaddrinfo
+            self.originalGetaddrinfo = None
+
+    def getaddrinfo(self, host, port, family=0, socktype=0, proto=0, flags=0):
+        resolve = self.originalGetaddrinfo or socket.getaddrinfo
+        if host is None or not isinstance(port, (int, long, type(None))) or self._isAddress(host):
+            return resolve(host, port, family, socktype, proto, flags)
+
+        key = (host.lower(), family, socktype, proto, flags)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries[key] = self.entries.pop(key)
+                if isinstance(entry[1], socket.gaierror):
+                    self.negativeHits += 1
+                    raise entry[1]
+                self.hits += 1
+                return self._withPort(entry[1], port)
+            self.misses += 1
+
+        try:
+            addresses = resolve(host, port, family, socktype, proto, flags)
+        except socket.gaierror, e:
+            self._store(key, now + self.negativeTtl, e)
+            raise
+
+        self._store(key, now + self.ttl, addresses)
+        return addresses
+
+    def prewarm(self, hosts):
+        """Resolves hosts on a background thread so the first station switch finds them cached.
+
+        The cache grows to hold all of them and PREWARM_HEADROOM more, so
+        prewarming does not evict its own entries.
+        """
+        with self.lock:
+            self.maxEntries = max(self.maxEntries, len(hosts) + PREWARM_HEADROOM)
+        def work():
+            for host in hosts:
+                try:
+                    self.getaddrinfo(host, 80, 0, socket.SOCK_STREAM)
+                except socket.error:
+                    pass
+            self.log.debug('DNS cache prewarmed with %d hosts', len(hosts))
+
+        thread = threading.Thread(target=work, name='dns-prewarm')
+        thread.daemon = True
+        thread.start()
+
+    def stats(self):
+        with self.lock:
+            return {'hits':self.hits, 'misses':self.misses, 'negativeHits':self.negativeHits,
+                    'entries':len(self.entries), 'maxEntries':self.maxEntries}
+
+    def _store(self, key, expires, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (expires, value)
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    def _withPort(self, addresses, port):
+        if port is None:
+            return list(addresses)
+        return [(af, socktype, proto, canonname, (sockaddr[0], port) + tuple(sockaddr[2:]))
+                for (af, socktype, proto, canonname, sockaddr) in addresses]
+
+    def _isAddress(self, host):
+        for family in (socket.AF_INET, socket.AF_INET6):
+            try:
+                socket.inet_pton(family, host)
+                return True
+            except (socket.error, ValueError):
+                pass
+        return False
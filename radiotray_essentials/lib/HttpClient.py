@@ -0,0 +1,300 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import httplib
+import socket
+import threading
+import time
+import urllib2
+import urlparse
+import zlib
+import logging
+from common import USER_AGENT
+
+MAX_REDIRECTS = 5
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_DRAIN = 64 * 1024
+
+class HTTPConnection(httplib.HTTPConnection):
+    """Publishes its socket before connecting, so a Cancellation can shut it down."""
+
+    # set by Cancellation once the connection is to be given up
+    aborted = False
+
+    def connect(self):
+        error = socket.error('getaddrinfo returns an empty list')
+        for af, socktype, proto, canonname, address in socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_STREAM):
+            if self.aborted:
+                break
+            sock = socket.socket(af, socktype, proto)
+            self.sock = sock
+            try:
+                sock.settimeout(self.timeout)
+                sock.connect(address)
+                if self.aborted:
+                    raise socket.error('cancelled')
+                return
+            except socket.error, e:
+                error = e
+                sock.close()
+                self.sock = None
+        if self.aborted:
+            raise socket.error('cancelled')
+        raise error
+
+
+class HttpResponse(object):
+    """File-like response that gives its connection back to the pool on close.
+
+    gzip and deflate bodies are decompressed while reading. Connections are
+    only reused when the body was read to the end, so a probe that closes
+    an endless audio stream after a few bytes just drops its connection.
+    """
+
+    def __init__(self, client, key, conn, response, url, cancellation=None):
+        self.client = client
+        self.key = key
+        self.conn = conn
+        self.cancellation = cancellation
+        self.response = response
+        self.url = url
+        self.code = response.status
+        self.buffer = ''
+        self.decompressor = None
+
+        encoding = (response.getheader('content-encoding') or '').strip().lower()
+        if encoding == 'gzip':
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self.decompressor = zlib.decompressobj()
+
+    def info(self):
+        return self.response.msg
+
+    def geturl(self):
+        return self.url
+
+    def read(self, size=-1):
+        if self.response is None:
+            return ''
+
+        if self.decompressor is None:
+            if size is None or size < 0:
+                return self.response.read()
+            return self.response.read(size)
+
+        while size is None or size < 0 or len(self.buffer) < size:
+            chunk = self.response.read(8192)
+            if not chunk:
+                self.buffer += self.decompressor.flush()
+                break
+            try:
+                self.buffer += self.decompressor.decompress(chunk)
+            except zlib.error:
+                # some servers send raw deflate data without the zlib header
+                self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                self.buffer += self.decompressor.decompress(chunk)
+
+        if size is None or size < 0:
+            data, self.buffer = self.buffer, ''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def close(self):
+        if self.response is None:
+            return
+
+        reusable = self.response.isclosed() and not self.response.will_close and not getattr(self.conn, 'aborted', False)
+        self.response.close()
+        self.response = None
+        self.client._release(self.key, self.conn, reusable, self.cancellation)
+        self.conn = None
+
+    def drain(self):
+        # small bodies are read so the connection can be reused
+        if self.response.length is not None and self.response.length <= MAX_DRAIN:
+            self.response.read()
+        self.close()
+
+
+class HttpClient:
+    """Keep-alive HTTP client shared by the stream resolver and the playlist decoders.
+
+    Idle connections are kept per host, up to maxIdle in total, and no more
+    than maxPerHost connections to one host are open at the same time.
+    Errors are raised as urllib2.HTTPError and urllib2.URLError, like
+    urllib2.urlopen does.
+    """
+
+    def __init__(self, timeout=100, maxPerHost=4, maxIdle=16):
+        self.log = logging.getLogger('radiotray')
+        self.timeout = timeout
+        self.maxPerHost = maxPerHost
+        self.maxIdle = maxIdle
+        self.lock = threading.Condition()
+        # (scheme, host, port) -> idle connections, most recently used last
+        self.idle = {}
+        self.idleCount = 0
+        # (scheme, host, port) -> number of connections handed out
+        self.active = {}
+
+    def open(self, url, headers=None, timeout=None, cancellation=None):
+        """Opens url, following redirects; cancellation, if given, can abort it from another thread."""
+        if timeout is None:
+            timeout = self.timeout
+
+        for redirect in range(MAX_REDIRECTS + 1):
+            parts = urlparse.urlsplit(url)
+            scheme = parts.scheme.lower()
+            if scheme == 'mms':
+                # gstreamer deals with mms, we only need to know where to go
+                raise urllib2.URLError("MMS REDIRECT:" + url)
+            if scheme not in ('http', 'https'):
+                raise urllib2.URLError('unsupported url scheme: ' + url)
+
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+
+            requestHeaders = {'User-Agent':USER_AGENT, 'Accept-Encoding':'gzip, deflate'}
+            if headers is not None:
+                requestHeaders.update(headers)
+
+            key = (scheme, parts.hostname, parts.port)
+            conn, response = self._request(key, parts.netloc, path, requestHeaders, float(timeout), cancellation)
+
+            if response.status in REDIRECT_CODES and response.getheader('location'):
+                location = urlparse.urljoin(url, response.getheader('location'))
+                self.log.debug('Redirected from %s to %s', url, location)
+                HttpResponse(self, key, conn, response, url, cancellation).drain()
+                url = location
+                continue
+
+            if response.status >= 300:
+                HttpResponse(self, key, conn, response, url, cancellation).drain()
+                raise urllib2.HTTPError(url, response.status, response.reason, response.msg, None)
+
+            return HttpResponse(self, key, conn, response, url, cancellation)
+
+        raise urllib2.URLError('too many redirects: ' + url)
+
+    def _request(self, key, netloc, path, headers, timeout, cancellation=None):
+        self._acquire(key, timeout, cancellation)
+
+        conn = self._getIdle(key)
+        reused = conn is not None
+        try:
+            while True:
+                if conn is None:
+                    conn = self._connect(key, timeout)
+                else:
+                    conn.sock.settimeout(timeout)
+                if cancellation is not None and not cancellation.register(conn):
+                    raise socket.error('cancelled')
+                try:
+                    conn.putrequest('GET', path, skip_host=True, skip_accept_encoding=True)
+                    conn.putheader('Host', netloc)
+                    for name, value in headers.iteritems():
+                        conn.putheader(name, value)
+                    conn.endheaders()
+                    return conn, conn.getresponse()
+                except (httplib.BadStatusLine, socket.error), e:
+                    if cancellation is not None:
+                        cancellation.unregister(conn)
+                    conn.close()
+                    if not reused or getattr(conn, 'aborted', False):
+                        raise
+                    # the server closed the idle connection, try a fresh one
+                    self.log.debug('Stale connection to %s, reconnecting', netloc)
+                    conn = None
+                    reused = False
+        except (httplib.HTTPException, socket.error), e:
+            self._release(key, conn, False, cancellation)
+            raise urllib2.URLError(e)
+        except:
+            self._release(key, conn, False, cancellation)
+            raise
+
+    def _connect(self, key, timeout):
+        scheme, host, port = key
+        if scheme == 'https':
+            return httplib.HTTPSConnection(host, port, timeout=timeout)
+        return HTTPConnection(host, port, timeout=timeout)
+
+    def _acquire(self, key, timeout, cancellation=None):
+        deadline = time.time() + timeout
+        with self.lock:
+            while self.active.get(key, 0) >= self.maxPerHost:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise urllib2.URLError('too many connections to ' + str(key[1]))
+                if cancellation is not None:
+                    if cancellation.isCancelled():
+                        raise urllib2.URLError('cancelled')
+                    # nothing wakes us up on cancel, look again every now and then
+                    remaining = min(remaining, 0.5)
+                self.lock.wait(remaining)
+            self.active[key] = self.active.get(key, 0) + 1
+
+    def _getIdle(self, key):
+        with self.lock:
+            conns = self.idle.get(key)
+            if conns:
+                self.idleCount -= 1
+                return conns.pop()
+        return None
+
+    def _release(self, key, conn, reusable, cancellation=None):
+        if cancellation is not None and conn is not None:
+            cancellation.unregister(conn)
+        stale = None
+        with self.lock:
+            self.active[key] -= 1
+            if self.active[key] == 0:
+                del self.active[key]
+
+            if conn is not None and reusable and conn.sock is not None:
+                self.idle.setdefault(key, []).append(conn)
+                self.idleCount += 1
+                if self.idleCount > self.maxIdle:
+                    stale = self._popOldestIdle()
+            elif conn is not None:
+                stale = conn
+            self.lock.notify_all()
+
+        if stale is not None:
+            stale.close()
+
+    def _popOldestIdle(self):
+        # the first connection of the fullest host is as good a victim as any
+        key = max(self.idle, key=lambda k: len(self.idle[k]))
+        conn = self.idle[key].pop(0)
+        if len(self.idle[key]) == 0:
+            del self.idle[key]
+        self.idleCount -= 1
+        return conn
+
+    def closeIdle(self):
+        with self.lock:
+            conns = [conn for idle in self.idle.itervalues() for conn in idle]
+            self.idle = {}
+            self.idleCount = 0
+        for conn in conns:
+            conn.close()
@@ -0,0 +1,95 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import os
+import mmap
+import threading
+
+class RingFile:
+    """Fixed size ring buffer in a memory mapped file.
+
+    Positions are absolute byte counts since the ring was opened; only the
+    last size bytes written can still be read back. The file never grows,
+    old data is simply overwritten.
+    """
+
+    def __init__(self, filename, size):
+        self.filename = filename
+        self.size = size
+        self.lock = threading.Lock()
+        self.written = 0
+
+        fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0600)
+        try:
+            os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def oldest(self):
+        with self.lock:
+            return max(self.written - self.size, 0)
+
+    def newest(self):
+        with self.lock:
+            return self.written
+
+    def write(self, data):
+        # only the tail of data can survive anyway
+        if len(data) > self.size:
+            skipped = len(data) - self.size
+            data = data[skipped:]
+        else:
+            skipped = 0
+
+        with self.lock:
+            self.written += skipped
+            start = self.written % self.size
+            first = min(len(data), self.size - start)
+            self.map[start:start + first] = data[:first]
+            if first < len(data):
+                self.map[0:len(data) - first] = data[first:]
+            self.written += len(data)
+
+    def read(self, position, length):
+        """Returns (position, data) for up to length bytes from position on.
+
+        A position that was overwritten already is moved up to the oldest
+        byte still in the ring, so the returned position may differ.
+        """
+        with self.lock:
+            position = max(position, self.written - self.size, 0)
+            length = min(length, self.written - position)
+            if length <= 0:
+                return position, ''
+
+            start = position % self.size
+            first = min(length, self.size - start)
+            data = self.map[start:start + first]
+            if first < length:
+                data += self.map[0:length - first]
+            return position, data
+
+    def close(self):
+        with self.lock:
+            self.map.close()
+        try:
+            os.remove(self.filename)
+        except OSError:
+            pass
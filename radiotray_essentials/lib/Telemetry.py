@@ -0,0 +1,138 @@
+##########################################################################
+# Copyright 2012 fbcoder
+#
+# This file is part of CursedRadio
+#
+# Radio Tray is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 1 of the License, or
+# (at your option) any later version.
+#
+# Radio Tray is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radio Tray.  If not, see <http://www.gnu.org/licenses/>.
+#
+##########################################################################
+import os
+import json
+import time
+import bisect
+import threading
+import logging
+from collections import OrderedDict
+
+# upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 60.0)
+
+class Histogram:
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        # upper bound of the bucket the percentile falls in
+        wanted = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted and count > 0:
+                if index < len(BUCKETS):
+                    return BUCKETS[index]
+                return self.max
+        return None
+
+    def snapshot(self):
+        if self.count == 0:
+            return {'count':0}
+        return {'count':self.count, 'mean':round(self.total / self.count, 4),
+                'min':round(self.min, 4), 'max':round(self.max, 4),
+                'p50':self.percentile(0.5), 'p90':self.percentile(0.9), 'p99':self.percentile(0.99),
+                'buckets':self.counts}
+
+
+class Telemetry:
+    """Counters, histograms and per station totals, cheap enough to keep always on.
+
+    Everything is guarded by one lock that is only held for a few
+    additions. snapshot() copies the lot into plain dicts, writeTo()
+    appends one compact JSON line per call to a file that is rotated once
+    it grows past maxFileSize.
+    """
+
+    def __init__(self, maxStations=200, maxFileSize=1024 * 1024):
+        self.log = logging.getLogger('radiotray')
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.maxStations = maxStations
+        self.maxFileSize = maxFileSize
+        self.counters = {}
+        self.histograms = {}
+        # station url -> totals, least recently used first
+        self.stations = OrderedDict()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def station(self, url, name, amount=1):
+        """Adds amount to the per station total name, like bytes or underruns."""
+        with self.lock:
+            totals = self.stations.pop(url, None)
+            if totals is None:
+                totals = {}
+            totals[name] = totals.get(name, 0) + amount
+            self.stations[url] = totals
+            while len(self.stations) > self.maxStations:
+                self.stations.popitem(last=False)
+
+    def snapshot(self):
+        with self.lock:
+            stations = {}
+            for url, totals in self.stations.iteritems():
+                totals = dict(totals)
+                if totals.get('seconds'):
+                    totals['throughput'] = int(totals.get('bytes', 0) / totals['seconds'])
+                stations[url] = totals
+            return {'time':time.strftime('%Y-%m-%dT%H:%M:%S'), 'uptime':round(time.time() - self.started, 1),
+                    'counters':dict(self.counters),
+                    'histograms':dict((name, h.snapshot()) for name, h in self.histograms.iteritems()),
+                    'stations':stations}
+
+    def writeTo(self, filename, extra=None):
+        snapshot = self.snapshot()
+        if extra is not None:
+            snapshot.update(extra)
+        try:
+            if os.path.exists(filename) and os.path.getsize(filename) > self.maxFileSize:
+                os.rename(filename, filename + '.1')
+            out_file = open(filename, 'a')
+            try:
+                out_file.write(json.dumps(snapshot, separators=(',', ':')) + '\n')
+            finally:
+                out_file.close()
+        except Exception, e:
+            self.log.warn('Could not write stats to %s: %s', filename, str(e))
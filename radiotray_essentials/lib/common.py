@@ -82,6 +82,22 @@ DEFAULT_CONFIG_FILE = os.path.join(DEFAULT_CFG_PATH, OPTIONS_CFG_NAME)
 #Logfile
 LOGFILE = os.path.join(USER_CFG_PATH,'radiotray.log')
 
+#stream resolution cache
+RESOLUTION_CACHE_FILE = os.path.join(USER_CFG_PATH,'resolutioncache.json')
+BUFFER_HISTORY_FILE = os.path.join(USER_CFG_PATH,'bufferhistory.json')
+
+#time-shift ring
+TIMESHIFT_FILE = os.path.join(USER_CFG_PATH,'timeshift.ring')
+
+#recordings, a directory per recording
+RECORDINGS_DIR = os.path.join(USER_CFG_PATH,'recordings')
+
+#player telemetry, one JSON line per snapshot
+STATS_FILE = os.path.join(USER_CFG_PATH,'stats.jsonl')
+
+#every event sent while event_journal is on, for replaying it later
+EVENT_JOURNAL_FILE = os.path.join(USER_CFG_PATH,'events.jsonl')
+
 #temporary icon file
 #ICON_FILE = os.path.join(USER_CFG_PATH,'icon')
 
@@ -0,0 +1,72 @@
+import unittest
+from DecoderRegistry import DecoderRegistry
+from PlsPlaylistDecoder import PlsPlaylistDecoder
+from M3uPlaylistDecoder import M3uPlaylistDecoder
+from AsxPlaylistDecoder import AsxPlaylistDecoder
+from XspfPlaylistDecoder import XspfPlaylistDecoder
+from AsfPlaylistDecoder import AsfPlaylistDecoder
+from RamPlaylistDecoder import RamPlaylistDecoder
+
+MP3 = '\xff\xfb\x90\x64' + '\x00\x55\xaa\x13' * 124
+
+
+class LegacyDecoder:
+    """A third party decoder that only knows isStreamValid."""
+
+    def isStreamValid(self, contentType, firstBytes):
+        return contentType == 'application/x-legacy'
+
+
+class ShortMagicDecoder:
+    magic = ('[play',)
+
+
+class DecoderRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = DecoderRegistry()
+        self.decoders = {}
+        for decoderClass in [PlsPlaylistDecoder, AsxPlaylistDecoder, AsfPlaylistDecoder,
+                             XspfPlaylistDecoder, RamPlaylistDecoder, M3uPlaylistDecoder]:
+            decoder = decoderClass(None)
+            self.decoders[decoderClass.__name__] = decoder
+            self.registry.register(decoder)
+
+    def assertFound(self, name, contentType, firstBytes):
+        self.assertTrue(self.registry.lookup(contentType, firstBytes) is self.decoders[name])
+
+    def testAudioHasNoDecoder(self):
+        self.assertEqual(self.registry.lookup('audio/mpeg', MP3), None)
+
+    def testContentType(self):
+        self.assertFound('XspfPlaylistDecoder', 'application/xspf+xml; charset=utf-8', '<?xml version="1.0"?>')
+        self.assertFound('RamPlaylistDecoder', 'Audio/X-PN-RealAudio', 'rtsp://example.com/stream.rm\n')
+
+    def testMagicBeatsTheContentType(self):
+        self.assertFound('PlsPlaylistDecoder', 'audio/x-mpegurl', '\r\n  [Playlist]\nFile1=http://example.com/\n')
+
+    def testRequiredMagic(self):
+        # video/x-ms-asf is both; the magic tells asx from asf references
+        self.assertFound('AsxPlaylistDecoder', 'video/x-ms-asf', '<ASX version="3.0">')
+        self.assertFound('AsfPlaylistDecoder', 'video/x-ms-asf', '[Reference]\nRef1=http://example.com/\n')
+        self.assertEqual(self.registry.lookup('video/x-ms-asf', MP3), None)
+
+    def testLineMagic(self):
+        self.assertFound('M3uPlaylistDecoder', 'text/plain', '# stations\n  http://example.com:8000/\n')
+        self.assertEqual(self.registry.lookup('text/plain', '<html>see http://example.com/</html>'), None)
+
+    def testLegacyDecoderIsAskedLast(self):
+        legacy = LegacyDecoder()
+        self.registry.register(legacy)
+        self.assertTrue(self.registry.lookup('application/x-legacy', 'anything') is legacy)
+        self.assertFound('PlsPlaylistDecoder', 'application/x-legacy', '[playlist]\n')
+
+    def testLongestMagicWins(self):
+        short = ShortMagicDecoder()
+        self.registry.register(short)
+        self.assertFound('PlsPlaylistDecoder', 'text/plain', '[playlist]\n')
+        self.assertTrue(self.registry.lookup('text/plain', '[playback]\n') is short)
+
+
+if __name__ == '__main__':
+    unittest.main()
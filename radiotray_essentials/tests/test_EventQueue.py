@@ -0,0 +1,180 @@
+import gc
+import threading
+import time
+import unittest
+from events.EventQueue import EventQueue, QueuedCallback
+from events.WeakCallback import WeakCallback
+from events.EventManager import EventManager
+
+
+class Subscriber:
+
+    def __init__(self):
+        self.received = []
+
+    def onEvent(self, data):
+        self.received.append(data)
+
+
+class EventQueueTest(unittest.TestCase):
+
+    def testPriorityThenArrivalOrder(self):
+        queue = EventQueue()
+        queue.put('volume', 1, priority=2)
+        queue.put('song', 'a', priority=1)
+        queue.put('state', 'playing', priority=0)
+        queue.put('song', 'b', priority=1)
+        self.assertEqual(queue.drain(), [['state', 'playing'], ['song', 'a'], ['song', 'b'], ['volume', 1]])
+        self.assertEqual(queue.depth(), 0)
+
+    def testCoalescedPutReplacesWaitingValue(self):
+        queue = EventQueue()
+        queue.put('buffer', 10, coalesce=True)
+        queue.put('song', 'a')
+        queue.put('buffer', 20, coalesce=True)
+        self.assertEqual(queue.drain(), [['buffer', 20], ['song', 'a']])
+        # once delivered, the next value queues again
+        queue.put('buffer', 30, coalesce=True)
+        self.assertEqual(queue.drain(), [['buffer', 30]])
+        self.assertEqual(queue.stats(), {'depth':0, 'maxDepth':2, 'queued':3, 'coalesced':1})
+
+    def testGetTimesOut(self):
+        queue = EventQueue()
+        started = time.time()
+        self.assertEqual(queue.get(0.05), None)
+        self.assertTrue(time.time() - started >= 0.04)
+
+    def testCloseWakesConsumer(self):
+        queue = EventQueue()
+        results = []
+        thread = threading.Thread(target=lambda: results.append(queue.get()))
+        thread.start()
+        time.sleep(0.05)
+        queue.close()
+        thread.join(2)
+        self.assertEqual(results, [None])
+
+    def testJoinWaitsForDone(self):
+        queue = EventQueue()
+        queue.put('song', 'a')
+        entry = queue.get()
+        self.assertEqual(entry, ['song', 'a'])
+        # taken but not handled yet
+        self.assertFalse(queue.join(0.05))
+        queue.done()
+        self.assertTrue(queue.join(0.05))
+
+    def testJoinWithConsumerThread(self):
+        queue = EventQueue()
+        handled = []
+
+        def consume():
+            while True:
+                entry = queue.get()
+                if entry is None:
+                    break
+                time.sleep(0.01)
+                handled.append(entry[1])
+                queue.done()
+
+        thread = threading.Thread(target=consume)
+        thread.start()
+        for i in range(5):
+            queue.put('n', i)
+        self.assertTrue(queue.join(2))
+        self.assertEqual(handled, range(5))
+        queue.close()
+        thread.join(2)
+
+    def testQueuedCallback(self):
+        queue = EventQueue()
+        subscriber = Subscriber()
+        callback = QueuedCallback(queue, WeakCallback(subscriber.onEvent), coalesce=True)
+        callback(1)
+        callback(2)
+        self.assertEqual(subscriber.received, [])
+        for target, data in queue.drain():
+            target(data)
+        self.assertEqual(subscriber.received, [2])
+        self.assertTrue(callback.matches(subscriber.onEvent))
+
+
+class WeakCallbackTest(unittest.TestCase):
+
+    def testPlainFunction(self):
+        received = []
+        callback = WeakCallback(received.append)
+        callback('a')
+        self.assertEqual(received, ['a'])
+        self.assertTrue(callback.isAlive())
+        self.assertTrue(callback.matches(received.append))
+
+    def testFunctionIsKeptAlive(self):
+        received = []
+
+        def onEvent(data):
+            received.append(data)
+
+        callback = WeakCallback(onEvent)
+        del onEvent
+        gc.collect()
+        callback('a')
+        self.assertEqual(received, ['a'])
+        self.assertEqual(callback.name(), 'onEvent')
+
+    def testBoundMethodDoesNotKeepObjectAlive(self):
+        subscriber = Subscriber()
+        dead = []
+        callback = WeakCallback(subscriber.onEvent, dead.append)
+        callback('a')
+        self.assertEqual(subscriber.received, ['a'])
+        self.assertEqual(callback.name(), 'Subscriber.onEvent')
+
+        del subscriber
+        gc.collect()
+        self.assertFalse(callback.isAlive())
+        self.assertEqual(len(dead), 1)
+        # calling a dead callback does nothing
+        self.assertEqual(callback('b'), None)
+        self.assertEqual(callback.name(), '?.onEvent')
+
+    def testMatchesOnlySameObject(self):
+        one, two = Subscriber(), Subscriber()
+        callback = WeakCallback(one.onEvent)
+        self.assertTrue(callback.matches(one.onEvent))
+        self.assertFalse(callback.matches(two.onEvent))
+        self.assertFalse(callback.matches(len))
+
+
+class EventManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = EventManager()
+
+    def tearDown(self):
+        self.manager.close()
+
+    def testCollectedSubscriberIsPruned(self):
+        kept, dropped = Subscriber(), Subscriber()
+        self.manager.subscribe(EventManager.SONG_CHANGED, kept.onEvent)
+        self.manager.subscribe(EventManager.SONG_CHANGED, dropped.onEvent)
+        del dropped
+        gc.collect()
+        self.assertEqual(len(self.manager.getObserversMap()[EventManager.SONG_CHANGED]), 1)
+
+        self.manager.notify(EventManager.SONG_CHANGED, 'a')
+        self.assertTrue(self.manager.waitIdle(2))
+        self.assertEqual(kept.received, ['a'])
+
+    def testUnsubscribe(self):
+        subscriber = Subscriber()
+        self.manager.subscribe(EventManager.STATE_CHANGED, subscriber.onEvent)
+        self.assertTrue(self.manager.unsubscribe(EventManager.STATE_CHANGED, subscriber.onEvent))
+        self.assertFalse(self.manager.unsubscribe(EventManager.STATE_CHANGED, subscriber.onEvent))
+        self.manager.notify(EventManager.STATE_CHANGED, 'playing')
+        self.assertTrue(self.manager.waitIdle(2))
+        self.assertEqual(subscriber.received, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import gzip
+import threading
+import time
+import unittest
+import urllib2
+import zlib
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+from lib.HttpClient import HttpClient
+from lib.Cancellation import Cancellation
+
+BODY = 'http://stream.example.com/live\n' * 20
+
+
+def gzipped(data):
+    out = StringIO()
+    f = gzip.GzipFile(fileobj=out, mode='wb')
+    f.write(data)
+    f.close()
+    return out.getvalue()
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves a few fixed paths over keep-alive connections."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        if self.path == '/plain':
+            self.reply(200, BODY)
+        elif self.path == '/gzip':
+            self.reply(200, gzipped(BODY), {'Content-Encoding':'gzip'})
+        elif self.path == '/deflate':
+            self.reply(200, zlib.compress(BODY), {'Content-Encoding':'deflate'})
+        elif self.path == '/rawdeflate':
+            compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+            self.reply(200, compressor.compress(BODY) + compressor.flush(), {'Content-Encoding':'deflate'})
+        elif self.path == '/redirect':
+            self.reply(302, '', {'Location':'/plain'})
+        elif self.path == '/notmodified':
+            self.send_response(304)
+            self.end_headers()
+        elif self.path == '/hang':
+            self.server.released.wait(5)
+            self.reply(200, BODY)
+        else:
+            self.reply(404, 'not found')
+
+    def reply(self, code, body, headers={}):
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.iteritems():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, address):
+        # clients dropping their connections is part of the tests
+        pass
+
+
+class HttpClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.server.connections = 0
+        self.server.released = threading.Event()
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.base = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.client = HttpClient(timeout=5)
+
+    def tearDown(self):
+        self.server.released.set()
+        self.client.closeIdle()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, path):
+        response = self.client.open(self.base + path)
+        try:
+            return response.read()
+        finally:
+            response.close()
+
+    def testKeepAliveReusesConnection(self):
+        for i in range(3):
+            self.assertEqual(self.get('/plain'), BODY)
+        self.assertEqual(self.server.connections, 1)
+
+    def testPartialReadDropsConnection(self):
+        response = self.client.open(self.base + '/plain')
+        response.read(10)
+        response.close()
+        self.assertEqual(self.get('/plain'), BODY)
+        self.assertEqual(self.server.connections, 2)
+
+    def testGzipIsDecoded(self):
+        self.assertEqual(self.get('/gzip'), BODY)
+
+    def testDeflateIsDecoded(self):
+        self.assertEqual(self.get('/deflate'), BODY)
+
+    def testRawDeflateIsDecoded(self):
+        self.assertEqual(self.get('/rawdeflate'), BODY)
+
+    def testSizedReadsOfCompressedBody(self):
+        response = self.client.open(self.base + '/gzip')
+        data = ''
+        while True:
+            chunk = response.read(7)
+            if not chunk:
+                break
+            self.assertTrue(len(chunk) <= 7)
+            data += chunk
+        response.close()
+        self.assertEqual(data, BODY)
+
+    def testRedirectIsFollowed(self):
+        response = self.client.open(self.base + '/redirect')
+        self.assertEqual(response.geturl(), self.base + '/plain')
+        self.assertEqual(response.read(), BODY)
+        response.close()
+        # the redirect body was drained, so both requests used one connection
+        self.assertEqual(self.server.connections, 1)
+
+    def testNotModifiedRaises(self):
+        try:
+            self.client.open(self.base + '/notmodified')
+            self.fail('304 did not raise')
+        except urllib2.HTTPError, e:
+            self.assertEqual(e.code, 304)
+        # the connection is still good for the next request
+        self.assertEqual(self.get('/plain'), BODY)
+        self.assertEqual(self.server.connections, 1)
+
+    def testNotFoundRaises(self):
+        try:
+            self.client.open(self.base + '/missing')
+            self.fail('404 did not raise')
+        except urllib2.HTTPError, e:
+            self.assertEqual(e.code, 404)
+
+    def testCancelAbortsHungRequest(self):
+        cancellation = Cancellation()
+        errors = []
+
+        def request():
+            try:
+                self.client.open(self.base + '/hang', cancellation=cancellation)
+            except urllib2.URLError, e:
+                errors.append(e)
+
+        thread = threading.Thread(target=request)
+        started = time.time()
+        thread.start()
+        time.sleep(0.2)
+        cancellation.cancel()
+        thread.join(5)
+        self.assertFalse(thread.isAlive())
+        self.assertTrue(time.time() - started < 2)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(self.client.active, {})
+
+    def testCancelledBeforeStartFails(self):
+        cancellation = Cancellation()
+        cancellation.cancel()
+        self.assertRaises(urllib2.URLError, self.client.open, self.base + '/plain', cancellation=cancellation)
+        self.assertEqual(self.client.active, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
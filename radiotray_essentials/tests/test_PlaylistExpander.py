@@ -0,0 +1,82 @@
+import unittest
+from PlaylistExpander import PlaylistExpander, Candidate, normalizeUrl
+
+
+class NormalizeUrlTest(unittest.TestCase):
+
+    def testDefaultPortAndCaseAreIgnored(self):
+        self.assertEqual(normalizeUrl(' HTTP://Radio.Example.com:80/live '), 'http://radio.example.com/live')
+
+    def testOtherPortIsKept(self):
+        self.assertEqual(normalizeUrl('http://radio.example.com:8000/live'), 'http://radio.example.com:8000/live')
+
+    def testEmptyPathAndFragment(self):
+        self.assertEqual(normalizeUrl('http://radio.example.com#top'), 'http://radio.example.com/')
+
+    def testQueryIsKept(self):
+        self.assertEqual(normalizeUrl('http://radio.example.com/?id=1'), 'http://radio.example.com/?id=1')
+
+
+class PlaylistExpanderTest(unittest.TestCase):
+
+    def decisions(self, playlist):
+        return [(c.url, c.status, c.reason) for c in playlist.history]
+
+    def testAddKeepsOrderAndSkipsBlanks(self):
+        playlist = PlaylistExpander()
+        playlist.add(['http://a/1', '', None, '  ', ' http://a/2 '])
+        self.assertEqual(playlist.urls(), ['http://a/1', 'http://a/2'])
+        self.assertEqual(len(playlist), 2)
+
+    def testDuplicatesAreDropped(self):
+        playlist = PlaylistExpander()
+        playlist.add(['http://a/1', 'HTTP://A:80/1'])
+        self.assertEqual(playlist.urls(), ['http://a/1'])
+        self.assertEqual(self.decisions(playlist)[1], ('HTTP://A:80/1', Candidate.DROPPED, 'already seen'))
+
+    def testExpandReplacesPlaylistInPlace(self):
+        playlist = PlaylistExpander()
+        playlist.add(['http://a/first', 'http://a/list.pls', 'http://a/last'])
+        playlist.expand('http://a/list.pls', ['http://b/1', 'http://b/2'])
+        self.assertEqual(playlist.urls(), ['http://a/first', 'http://b/1', 'http://b/2', 'http://a/last'])
+        self.assertEqual(playlist.history[1].status, Candidate.EXPANDED)
+        self.assertEqual(playlist.history[1].reason, 'playlist with 2 entries')
+        self.assertEqual(playlist.history[-1].depth, 1)
+
+    def testSelfReferenceDoesNotLoop(self):
+        playlist = PlaylistExpander()
+        playlist.add(['http://a/list.pls'])
+        playlist.expand('http://a/list.pls', ['http://a/list.pls', 'http://a/stream'])
+        self.assertEqual(playlist.urls(), ['http://a/stream'])
+
+    def testDeepNestingIsDropped(self):
+        playlist = PlaylistExpander(maxDepth=2)
+        playlist.add(['http://a/0'])
+        for depth in range(1, 4):
+            playlist.expand('http://a/%d' % (depth - 1), ['http://a/%d' % depth])
+        self.assertEqual(playlist.urls(), [])
+        self.assertEqual(self.decisions(playlist)[-1], ('http://a/3', Candidate.DROPPED, 'playlists nested too deep'))
+
+    def testCandidatesAreCapped(self):
+        playlist = PlaylistExpander(maxCandidates=3)
+        playlist.add(['http://a/%d' % i for i in range(5)])
+        self.assertEqual(len(playlist), 3)
+        self.assertEqual(playlist.history[-1].reason, 'too many candidates')
+
+    def testTakeAndDrop(self):
+        playlist = PlaylistExpander()
+        playlist.add(['http://a/1', 'http://a/2', 'http://a/3'])
+        playlist.drop('http://a/1', 'dead')
+        playlist.take('http://a/2', 'audio/mpeg')
+        playlist.take('http://a/missing', 'audio/mpeg')
+        self.assertEqual(playlist.urls(), ['http://a/3'])
+        self.assertEqual(self.decisions(playlist)[:2], [
+            ('http://a/1', Candidate.DROPPED, 'dead'),
+            ('http://a/2', Candidate.PLAYED, 'audio/mpeg')])
+        # dropped and played urls still count as seen
+        playlist.add(['http://a/1'])
+        self.assertEqual(playlist.urls(), ['http://a/3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import random
+import tempfile
+import unittest
+from lib.RingFile import RingFile
+
+
+class RingFileTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(prefix='ringfile')
+        os.close(fd)
+        self.ring = RingFile(self.filename, 16)
+
+    def tearDown(self):
+        self.ring.close()
+
+    def testReadBeforeWraparound(self):
+        self.ring.write('abcdef')
+        self.assertEqual(self.ring.read(0, 100), (0, 'abcdef'))
+        self.assertEqual(self.ring.read(2, 3), (2, 'cde'))
+        self.assertEqual(self.ring.read(6, 10), (6, ''))
+        self.assertEqual((self.ring.oldest(), self.ring.newest()), (0, 6))
+
+    def testWriteAcrossTheEnd(self):
+        self.ring.write('0123456789')
+        self.ring.write('abcdefghij')
+        self.assertEqual((self.ring.oldest(), self.ring.newest()), (4, 20))
+        self.assertEqual(self.ring.read(4, 16), (4, '456789abcdefghij'))
+        # a read that wraps around the end of the file
+        self.assertEqual(self.ring.read(14, 4), (14, 'efgh'))
+
+    def testOverwrittenPositionMovesUp(self):
+        self.ring.write('x' * 10)
+        self.ring.write('y' * 10)
+        self.assertEqual(self.ring.read(0, 8), (4, 'xxxxxxyy'))
+
+    def testWriteLargerThanRing(self):
+        self.ring.write('abc')
+        self.ring.write('0123456789abcdefXYZ')
+        self.assertEqual((self.ring.oldest(), self.ring.newest()), (6, 22))
+        self.assertEqual(self.ring.read(0, 100), (6, '3456789abcdefXYZ'))
+
+    def testMatchesLinearHistory(self):
+        rand = random.Random(1)
+        history = ''
+        for i in range(200):
+            data = ''.join(chr(rand.randint(0, 255)) for j in range(rand.randint(0, 40)))
+            self.ring.write(data)
+            history += data
+            position = rand.randint(0, len(history))
+            length = rand.randint(0, 20)
+            start = max(position, len(history) - 16)
+            self.assertEqual(self.ring.read(position, length), (start, history[start:start + length]))
+
+    def testCloseRemovesFile(self):
+        self.ring.close()
+        self.assertFalse(os.path.exists(self.filename))
+        self.ring = RingFile(self.filename, 16)
+
+
+if __name__ == '__main__':
+    unittest.main()
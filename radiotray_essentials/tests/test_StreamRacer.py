@@ -0,0 +1,71 @@
+import time
+import threading
+import unittest
+from UrlInfo import UrlInfo
+from StreamRacer import StreamRacer
+from PlaylistExpander import PlaylistExpander
+
+
+class StubDecoder:
+    """Answers probes by the last part of the url: dead, hang, html or audio."""
+
+    def __init__(self, url_timeout=5):
+        self.url_timeout = url_timeout
+        self.probed = []
+        self.lock = threading.Lock()
+
+    def getMediaStreamInfo(self, url, headers=None, cancellation=None, phase='resolve'):
+        with self.lock:
+            self.probed.append(url)
+        kind = url.rsplit('/', 1)[-1]
+        if kind == 'dead':
+            return None
+        if kind == 'hang':
+            deadline = time.time() + self.url_timeout
+            while time.time() < deadline and not cancellation.isCancelled():
+                time.sleep(0.01)
+            return None
+        if kind == 'html':
+            return UrlInfo(url, False, 'text/html')
+        return UrlInfo(url, False, 'audio/mpeg')
+
+
+class StreamRacerTest(unittest.TestCase):
+
+    def testDeadMirrorIsSkipped(self):
+        racer = StreamRacer(StubDecoder(), width=2, stagger=0.05)
+        playlist = PlaylistExpander()
+        playlist.add(['http://one.example.com/dead', 'http://two.example.com/audio'])
+        stream = racer.select(playlist)
+        self.assertEqual(stream.getUrl(), 'http://two.example.com/audio')
+        self.assertEqual(len(playlist), 0)
+        reasons = dict((candidate.url, candidate.reason) for candidate in playlist.history)
+        self.assertEqual(reasons['http://one.example.com/dead'], 'no answer')
+
+    def testFirstAudioWins(self):
+        racer = StreamRacer(StubDecoder(), width=3, stagger=0.05)
+        result = racer.race(['http://one.example.com/hang', 'http://two.example.com/audio',
+                             'http://three.example.com/audio'])
+        self.assertEqual(result.winnerUrl, 'http://two.example.com/audio')
+        self.assertEqual(result.dead, set())
+
+    def testHangingProbesAreNotWaitedForAfterAnAnswer(self):
+        racer = StreamRacer(StubDecoder(url_timeout=5), width=3, stagger=0.05, grace=0.2)
+        started = time.time()
+        result = racer.race(['http://one.example.com/html', 'http://two.example.com/hang',
+                             'http://three.example.com/hang'])
+        self.assertTrue(time.time() - started < 2)
+        self.assertEqual(result.winner, None)
+        self.assertEqual(result.answered.keys(), ['http://one.example.com/html'])
+        # cut short, not dead; they stay in the playlist as fallback
+        self.assertEqual(result.dead, set())
+
+    def testNobodyAnswers(self):
+        racer = StreamRacer(StubDecoder(url_timeout=0.3), width=2, stagger=0.05)
+        result = racer.race(['http://one.example.com/hang', 'http://two.example.com/dead'])
+        self.assertEqual(result.winner, None)
+        self.assertEqual(result.dead, set(['http://one.example.com/hang', 'http://two.example.com/dead']))
+
+
+if __name__ == '__main__':
+    unittest.main()
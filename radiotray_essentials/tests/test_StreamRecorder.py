@@ -0,0 +1,61 @@
+import random
+import unittest
+from StreamRecorder import IcyStripper, IcyLocator
+
+METAINT = 1000
+
+
+def icyStream(blocks, titles):
+    """Returns a fake icecast stream and the audio in it, the titles come with the given blocks."""
+    generator = random.Random(1)
+    audio = []
+    stream = []
+    for block in range(blocks):
+        chunk = ''.join([chr(generator.randint(0, 255)) for i in range(METAINT)])
+        audio.append(chunk)
+        stream.append(chunk)
+        meta = ''
+        if block in titles:
+            meta = "StreamTitle='%s';" % titles[block]
+            meta += '\x00' * (-len(meta) % 16)
+        stream.append(chr(len(meta) / 16) + meta)
+    return ''.join(stream), ''.join(audio)
+
+
+def stripAll(stripper, stream, size):
+    audio = []
+    titles = []
+    for start in range(0, len(stream), size):
+        for piece, title in stripper.strip(stream[start:start + size]):
+            audio.append(piece)
+            if title is not None:
+                titles.append(title)
+    return ''.join(audio), titles
+
+
+class IcyStripperTest(unittest.TestCase):
+
+    def testStripsFromTheFirstByte(self):
+        stream, audio = icyStream(10, {2:'One', 7:'Two'})
+        stripped, titles = stripAll(IcyStripper(METAINT), stream, 333)
+        self.assertEqual(stripped, audio)
+        self.assertEqual(titles, [u'One', u'Two'])
+
+
+class IcyLocatorTest(unittest.TestCase):
+
+    def testJoinedInTheMiddle(self):
+        stream, audio = icyStream(20, {3:'Early', 12:'Late'})
+        # joins 2500 bytes in, halfway through the third chunk of audio
+        stripped, titles = stripAll(IcyLocator(METAINT), stream[2502:], 512)
+        self.assertEqual(stripped, audio[2500:])
+        self.assertEqual(titles, [u'Early', u'Late'])
+
+    def testHoldsBackUntilLocated(self):
+        stream, audio = icyStream(20, {})
+        locator = IcyLocator(METAINT)
+        self.assertEqual(locator.strip(stream[100:1500]), [('', None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import unittest
+from XmlDataProvider import XmlDataProvider
+
+BOOKMARKS = """<bookmarks>
+<group name="root">
+    <group name="Jazz">
+        <bookmark name="Smooth" url="http://smooth.example.com/"/>
+        <bookmark name="Piano" url="http://piano.example.com/"/>
+    </group>
+    <group name="Rock">
+        <bookmark name="Classic" url="http://classic.example.com/"/>
+        <group name="Jazz">
+            <bookmark name="Fusion" url="http://fusion.example.com/"/>
+        </group>
+    </group>
+    <bookmark name="Smooth" url="http://duplicate.example.com/"/>
+</group>
+</bookmarks>
+"""
+
+
+class XmlDataProviderIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        filename = os.path.join(self.directory, 'bookmarks.xml')
+        out_file = open(filename, 'w')
+        out_file.write(BOOKMARKS)
+        out_file.close()
+        self.provider = XmlDataProvider(filename)
+        self.provider.loadFromFile()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertIndexed(self):
+        # the indexes must list exactly what a search of the tree finds, in the same order
+        for tag, index in (('bookmark', self.provider.radios), ('group', self.provider.groups)):
+            names = set(self.provider.root.xpath('//%s/@name' % tag))
+            self.assertEqual(set(index.keys()), names)
+            for name in names:
+                self.assertEqual(index[name], self.provider.root.xpath('//%s[@name=$var]' % tag, var=name))
+
+    def testLoad(self):
+        self.assertIndexed()
+        self.assertEqual(self.provider.getRadioUrl('Smooth'), 'http://smooth.example.com/')
+
+    def testGroupsWithTheSameNameAreListedTogether(self):
+        self.assertEqual(self.provider.listRadiosInGroup('Jazz'), ['Smooth', 'Piano', 'Fusion'])
+
+    def testAdd(self):
+        self.assertTrue(self.provider.addGroup('root', 'Pop'))
+        self.assertTrue(self.provider.addRadio('Hits', 'http://hits.example.com/', 'Pop'))
+        self.assertIndexed()
+        self.assertEqual(self.provider.listRadiosInGroup('Pop'), ['Hits'])
+
+    def testRename(self):
+        self.assertTrue(self.provider.updateRadio('Smooth', 'Mellow', 'http://mellow.example.com/'))
+        self.assertIndexed()
+        # the duplicate takes over the old name
+        self.assertEqual(self.provider.getRadioUrl('Smooth'), 'http://duplicate.example.com/')
+        self.assertEqual(self.provider.getRadioUrl('Mellow'), 'http://mellow.example.com/')
+
+        self.assertTrue(self.provider.updateGroup('Rock', 'Metal'))
+        self.assertIndexed()
+        self.assertEqual(self.provider.listRadiosInGroup('Metal'), ['Classic'])
+
+    def testMove(self):
+        self.assertTrue(self.provider.moveRadio('Piano', 'Jazz', 'Rock'))
+        self.assertIndexed()
+        self.assertEqual(self.provider.listRadiosInGroup('Rock'), ['Classic', 'Piano'])
+
+        self.assertTrue(self.provider.moveUp('Piano'))
+        self.assertTrue(self.provider.moveUp('Piano'))
+        self.assertIndexed()
+        self.assertEqual(self.provider.listRadiosInGroup('Rock'), ['Piano', 'Classic'])
+        self.assertTrue(self.provider.moveDown('Piano'))
+        self.assertIndexed()
+        self.assertEqual(self.provider.listRadiosInGroup('Rock'), ['Classic', 'Piano'])
+
+    def testRemove(self):
+        self.provider.removeRadio('Smooth')
+        self.assertIndexed()
+        self.assertEqual(self.provider.getRadioUrl('Smooth'), 'http://duplicate.example.com/')
+
+        self.provider.removeRadio('Rock')
+        self.assertIndexed()
+        self.assertEqual(self.provider.getRadioUrl('Fusion'), None)
+        self.assertEqual(self.provider.listRadiosInGroup('Jazz'), ['Piano'])
+
+
+if __name__ == '__main__':
+    unittest.main()